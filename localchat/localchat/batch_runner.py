@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Batch Question Runner
+
+Runs a list of natural-language questions through the assistant with SQL
+generation (Ollama) and SQL execution (MySQL) pipelined: while one question is
+being executed, the next ones are already being generated. Each stage has its
+own concurrency limit so both backends stay busy.
+
+Progress is appended to a JSONL checkpoint after every question, so an
+interrupted run resumes where it stopped. The default checkpoint is deleted
+once a run completes, so a later run (e.g. after a prompt or model change)
+starts fresh; pass --checkpoint to keep one across runs. Results are written
+as CSV or JSON.
+
+Usage:
+    python batch_runner.py questions.txt -o report.csv
+    python batch_runner.py questions.txt -o report.json --llm-concurrency 2 --db-concurrency 6
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+
+def load_questions(path: str) -> List[str]:
+    """Read questions from a text file (one per line, '#' comments) or a JSON list."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith(".json"):
+        data = json.loads(text)
+        return [str(q.get("question") if isinstance(q, dict) else q).strip() for q in data if q]
+    questions = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            questions.append(line)
+    return questions
+
+
+def _load_checkpoint(path: Optional[str], questions: Sequence[str]) -> Dict[int, Dict[str, Any]]:
+    """Return successful results keyed by question index.
+
+    Failed entries are retried on resume; entries whose question text changed are ignored.
+    """
+    done: Dict[int, Dict[str, Any]] = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            idx = entry.get("index")
+            if isinstance(idx, int) and idx < len(questions) and questions[idx] == entry.get("question"):
+                if entry.get("error"):
+                    done.pop(idx, None)
+                else:
+                    done[idx] = entry
+    return done
+
+
+def write_results(results: List[Dict[str, Any]], path: str, fmt: Optional[str] = None) -> str:
+    """Write results as JSON (full rows) or CSV (one line per question)."""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".") or "json").lower()
+    if fmt == "csv":
+        fields = ["index", "question", "sql", "row_count", "error", "generate_seconds", "execute_seconds", "columns", "rows"]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            for r in results:
+                row = dict(r)
+                row["columns"] = json.dumps(r.get("columns", []), ensure_ascii=False)
+                row["rows"] = json.dumps(r.get("rows", []), ensure_ascii=False, default=str)
+                writer.writerow(row)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+    return path
+
+
+def ask_many(
+    assistant: Any,
+    questions: Sequence[str],
+    output: Optional[str] = None,
+    fmt: Optional[str] = None,
+    checkpoint: Optional[str] = None,
+    llm_concurrency: int = 2,
+    db_concurrency: int = 4,
+    max_rows: int = 1000,
+) -> List[Dict[str, Any]]:
+    """Answer many questions with pipelined generation and execution.
+
+    Args:
+        assistant: object exposing generate_sql(question) and execute_sql(sql)
+        questions: questions in report order
+        output: optional CSV/JSON path for the final results
+        checkpoint: JSONL progress file; defaults to `<output>.checkpoint.jsonl`,
+            which is deleted once the run completes (an explicit one is kept)
+        llm_concurrency: parallel SQL generations (Ollama)
+        db_concurrency: parallel SQL executions (MySQL)
+        max_rows: rows kept per question in the results
+
+    Returns results in the same order as `questions`.
+    """
+    default_checkpoint = checkpoint is None and bool(output)
+    if default_checkpoint:
+        checkpoint = output + ".checkpoint.jsonl"
+    results: Dict[int, Dict[str, Any]] = _load_checkpoint(checkpoint, questions)
+    pending = [i for i in range(len(questions)) if i not in results]
+    if results:
+        print(f"⏩ Resuming: {len(results)} of {len(questions)} questions already done")
+
+    ckpt_lock = threading.Lock()
+    ckpt_file = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+
+    def _generate(idx: int) -> Dict[str, Any]:
+        started = time.perf_counter()
+        entry = {"index": idx, "question": questions[idx], "sql": "", "error": None}
+        try:
+            entry["sql"] = assistant.generate_sql(questions[idx])
+        except Exception as e:
+            entry["error"] = f"SQL generation failed: {e}"
+        entry["generate_seconds"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    def _execute(entry: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            columns, rows = assistant.execute_sql(entry["sql"])
+            entry["columns"] = list(columns)
+            entry["row_count"] = len(rows)
+            entry["rows"] = [list(r) for r in rows[:max_rows]]
+        except Exception as e:
+            entry["error"] = str(e)
+            entry["row_count"] = 0
+        entry["execute_seconds"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    def _finish(entry: Dict[str, Any]) -> None:
+        results[entry["index"]] = entry
+        if ckpt_file:
+            with ckpt_lock:
+                ckpt_file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                ckpt_file.flush()
+        status = "❌" if entry.get("error") else "✅"
+        print(f"{status} [{len(results)}/{len(questions)}] {entry['question']}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, llm_concurrency), thread_name_prefix="llm") as llm_pool, \
+                ThreadPoolExecutor(max_workers=max(1, db_concurrency), thread_name_prefix="db") as db_pool:
+            in_flight: Dict[Future, str] = {}
+            queued = iter(pending)
+
+            def _submit_next() -> None:
+                # Generations are submitted as LLM workers free up, so an interrupt has little to cancel
+                idx = next(queued, None)
+                if idx is not None:
+                    in_flight[llm_pool.submit(_generate, idx)] = "generate"
+
+            for _ in range(max(1, llm_concurrency)):
+                _submit_next()
+            try:
+                while in_flight:
+                    finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        stage = in_flight.pop(fut)
+                        entry = fut.result()
+                        if stage == "generate":
+                            _submit_next()
+                        if stage == "generate" and not entry.get("error"):
+                            # Hand over to the DB stage; the LLM pool moves on to the next question
+                            in_flight[db_pool.submit(_execute, entry)] = "execute"
+                        else:
+                            _finish(entry)
+            except KeyboardInterrupt:
+                print("⏹️  Interrupted; waiting only for running queries (finished ones are in the checkpoint)")
+                llm_pool.shutdown(wait=False, cancel_futures=True)
+                db_pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if ckpt_file:
+            ckpt_file.close()
+
+    ordered = [results[i] for i in range(len(questions)) if i in results]
+    if output:
+        write_results(ordered, output, fmt)
+        print(f"💾 Results written to {output}")
+    if default_checkpoint and os.path.exists(checkpoint):
+        # Complete: results are in the output now, and stale answers must not be reused by the next run
+        os.remove(checkpoint)
+    return ordered
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a file of questions through the DB assistant")
+    parser.add_argument("questions", help="Text file (one question per line) or JSON list")
+    parser.add_argument("-o", "--output", default="batch_results.json", help="Result file (.csv or .json)")
+    parser.add_argument("--format", choices=["csv", "json"], help="Override format inferred from --output")
+    parser.add_argument("--checkpoint", help="Progress file kept across runs (default: <output>.checkpoint.jsonl, deleted once a run completes)")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Parallel SQL generations")
+    parser.add_argument("--db-concurrency", type=int, default=4, help="Parallel SQL executions")
+    parser.add_argument("--max-rows", type=int, default=1000, help="Rows kept per question")
+    parser.add_argument("--api-url", default="http://localhost:8000", help="SQL API URL (ignored with --embedded)")
+    parser.add_argument("--embedded", action="store_true", help="Execute SQL directly instead of via the SQL API")
+    args = parser.parse_args()
+
+    from single_model_db_assistant import SingleModelDBAssistant
+
+    questions = load_questions(args.questions)
+    print(f"🚀 Running {len(questions)} questions (LLM x{args.llm_concurrency}, DB x{args.db_concurrency})")
+    assistant = SingleModelDBAssistant(api_url=args.api_url, embedded_mode=args.embedded)
+    started = time.perf_counter()
+    results = assistant.ask_many(
+        questions,
+        output=args.output,
+        fmt=args.format,
+        checkpoint=args.checkpoint,
+        llm_concurrency=args.llm_concurrency,
+        db_concurrency=args.db_concurrency,
+        max_rows=args.max_rows,
+    )
+    failed = sum(1 for r in results if r.get("error"))
+    print(f"\n✅ Done in {time.perf_counter() - started:.1f}s: {len(results) - failed} succeeded, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Offline NL-to-SQL benchmark
+
+Runs `reference_questions.EXAMPLES` and `all_questions()` through
+`SingleModelDBAssistant.generate_sql` and `execute_sql` against a local MySQL
+database seeded from `schema_snapshot.txt`, and writes a JSON report that can
+be diffed between prompt or model changes.
+
+LLM backends:
+- ollama: the real model from LLM_CONFIG
+- stub:   scripted completions (reference SQL for EXAMPLES, or a --script JSON
+          mapping question -> completion); no model needed
+- cassette: completions recorded from the real model (--cassette-mode record)
+          and replayed later, optionally with the recorded generation time
+
+Reported per run: p50/p95 time per stage (generate, execute), LLM calls,
+auto-fix rate, execution success rate, and result-equivalence accuracy against
+the reference SQL of EXAMPLES.
+
+--few-shot on feeds each benchmarked result back into an in-memory
+LearningManager, so later questions get verified examples in their prompt;
+--few-shot compare runs the set without and then with them and reports the
+change in regenerations and auto-fixes per question.
+
+Usage:
+    python bench_nl2sql.py --llm stub --seed-db
+    python bench_nl2sql.py --llm ollama --questions examples -o report.json
+    python bench_nl2sql.py --llm cassette --cassette qwen3.cassette.json --cassette-mode record
+    python bench_nl2sql.py --llm cassette --cassette qwen3.cassette.json --latency-scale 1
+    python bench_nl2sql.py --llm ollama --few-shot compare
+
+The local database is configured with BENCH_DB_HOST / BENCH_DB_USER /
+BENCH_DB_PASSWORD / BENCH_DB_NAME (default: localhost, root, "", nl2sql_bench).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import json
+import os
+import random
+import re
+import statistics
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from reference_questions import EXAMPLES, all_questions
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_snapshot.txt")
+
+BENCH_DB = {
+    "host": os.getenv("BENCH_DB_HOST", "localhost"),
+    "user": os.getenv("BENCH_DB_USER", "root"),
+    "password": os.getenv("BENCH_DB_PASSWORD", ""),
+    "database": os.getenv("BENCH_DB_NAME", "nl2sql_bench"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Schema snapshot -> local database
+# ---------------------------------------------------------------------------
+
+def parse_schema_snapshot(path: str = SNAPSHOT_PATH) -> Dict[str, Dict[str, Any]]:
+    """Parse the '📋 table' blocks of the snapshot into {table: {columns, pk, fks}}."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    tables: Dict[str, Dict[str, Any]] = {}
+    # Table blocks end at the first all-caps section after them (RELATIONSHIPS, NOTES...)
+    body = text.split("\nRELATIONSHIPS", 1)[0]
+    for block in re.split(r"\n📋 ", body)[1:]:
+        lines = block.splitlines()
+        name = lines[0].strip()
+        info = " ".join(l.strip() for l in lines[1:])
+        columns: List[str] = []
+
+        def add(cols: List[str]) -> None:
+            for c in cols:
+                if len(c) > 1 and c not in columns:
+                    columns.append(c)
+
+        pk = re.search(r"PK:\s*(\w+)", info)
+        pk_col = pk.group(1) if pk else "id"
+        add(["id", pk_col])
+        for m in re.finditer(r"Unique(?: composite)?:\s*([^.]+)\.", info):
+            add(re.findall(r"[A-Za-z_]\w*", m.group(1).replace("AUTO_INCREMENT", "")))
+        fks = {m.group(1): (m.group(2), m.group(3)) for m in re.finditer(r"(\w+) → (\w+)\.(\w+)", info)}
+        add(list(fks))
+        key_cols = re.search(r"Key columns:\s*(.+?)(?:\s+-\s+\w+:|$)", info)
+        if key_cols:
+            add(re.findall(r"[A-Za-z_]\w*", key_cols.group(1)))
+        for m in re.finditer(r"Indexes:\s*([^.]+)\.", info):
+            add(re.findall(r"[A-Za-z_]\w*", m.group(1)))
+        if "Sensitive: access_token" in info:
+            add(["access_token"])
+        tables[name] = {"columns": columns, "pk": pk_col, "fks": fks}
+    # Columns the TABLE PROMPTS section documents but the key-column lists omit
+    if "product_variants" in tables:
+        for c in ("variant_id", "product_id", "title"):
+            if c not in tables["product_variants"]["columns"]:
+                tables["product_variants"]["columns"].append(c)
+    return tables
+
+
+def _column_type(col: str) -> str:
+    c = col.lower()
+    if c == "id":
+        return "BIGINT"
+    if c.endswith("_at"):
+        return "DATETIME"
+    if c in ("quantity", "inventory_quantity", "orders_count", "variant_count", "pinned",
+             "total_products", "total_customers", "total_orders"):
+        return "INT"
+    if any(k in c for k in ("price", "amount", "cost", "discount", "tax", "spent", "vat", "latitude", "longitude")):
+        return "DECIMAL(12,2)"
+    if c in ("message", "tracking_url", "prop_value"):
+        return "TEXT"
+    return "VARCHAR(255)"
+
+
+_COUNTRIES = ["Bahrain", "United Arab Emirates", "Saudi Arabia", "Kuwait", "Qatar", "Oman", "India"]
+_ROW_COUNTS = {"stores": 3, "customers": 60, "products": 40, "product_variants": 80, "orders": 150, "order_items": 300,
+               "sku_mapping": 40, "order_item_properties": 60, "admin": 1, "chat_messages": 0}
+_SEED_ORDER = ["stores", "customers", "products", "product_variants", "orders", "order_customer", "order_items"]
+
+
+def _synthetic_value(table: str, col: str, i: int, rng: random.Random, keys: Dict[Tuple[str, str], List[Any]]) -> Any:
+    c = col.lower()
+    ctype = _column_type(col)
+    if c == "id":
+        return i + 1
+    parent = {"store_id": ("stores", "store_id"), "customer_id": ("customers", "customer_id"),
+              "order_id": ("orders", "order_id"), "product_id": ("products", "product_id"),
+              "variant_id": ("product_variants", "variant_id")}.get(c)
+    if parent and parent[0] != table and keys.get(parent):
+        pool = keys[parent]
+        # 1:1 child tables keyed by order_id take orders in sequence
+        return pool[i % len(pool)] if c == "order_id" else rng.choice(pool)
+    if c.endswith("_id") or c in ("shopify_id", "sku", "shopify_sku", "sku_code", "handle"):
+        return f"{c[:3]}-{table[:3]}-{i + 1}"
+    if ctype == "DATETIME":
+        return _dt.datetime(2025, 1, 1) + _dt.timedelta(days=rng.randint(0, 364), minutes=rng.randint(0, 1439))
+    if ctype == "INT":
+        return rng.randint(0, 20)
+    if ctype.startswith("DECIMAL"):
+        return Decimal(rng.randint(100, 500000)) / 100
+    if c in ("country",):
+        return rng.choice(_COUNTRIES)
+    if c == "status":
+        return rng.choice(["paid", "pending", "refunded", "active"])
+    if c == "currency":
+        return rng.choice(["BHD", "AED", "SAR"])
+    if c == "email":
+        return f"user{i + 1}@{rng.choice(['gmail.com', 'yahoo.com', 'sony.com'])}"
+    if c == "vendor":
+        return rng.choice(["Sony", "Sony Mobile", "Sony Audio"])
+    if c == "product_type":
+        return rng.choice(["TV", "Audio", "Camera"])
+    return f"{col} {i + 1}"
+
+
+def seed_database(conn: Any, tables: Dict[str, Dict[str, Any]], seed: int = 7) -> Dict[str, int]:
+    """(Re)create the snapshot tables in `conn` and fill them with deterministic rows."""
+    rng = random.Random(seed)
+    cur = conn.cursor()
+    keys: Dict[Tuple[str, str], List[Any]] = {}
+    counts: Dict[str, int] = {}
+    order = _SEED_ORDER + [t for t in tables if t not in _SEED_ORDER]
+    for table in order:
+        if table not in tables:
+            continue
+        spec = tables[table]
+        cols = spec["columns"]
+        cur.execute(f"DROP TABLE IF EXISTS `{table}`")
+        col_defs = ", ".join(f"`{c}` {_column_type(c)}" for c in cols)
+        cur.execute(f"CREATE TABLE `{table}` ({col_defs}, PRIMARY KEY (`{spec['pk']}`))")
+        n = _ROW_COUNTS.get(table, len(keys.get(("orders", "order_id"), [])) or 20)
+        rows = [tuple(_synthetic_value(table, c, i, rng, keys) for c in cols) for i in range(n)]
+        if rows:
+            placeholders = ", ".join(["%s"] * len(cols))
+            cur.executemany(f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in cols)}) VALUES ({placeholders})", rows)
+        for idx, col in enumerate(cols):
+            if col == spec["pk"] or col.endswith("_id"):
+                keys[(table, col)] = [r[idx] for r in rows]
+        counts[table] = n
+    conn.commit()
+    cur.close()
+    return counts
+
+
+def make_mysql_executor(conn: Any) -> Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]:
+    def execute(sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql)
+            rows = cur.fetchall() if cur.description else []
+            columns = [d[0] for d in cur.description] if cur.description else []
+            return columns, [tuple(r) for r in rows]
+        finally:
+            cur.close()
+    return execute
+
+
+# ---------------------------------------------------------------------------
+# LLM backends
+# ---------------------------------------------------------------------------
+
+class ScriptedLLM:
+    """Deterministic stand-in for Ollama: answers known questions from a script."""
+
+    def __init__(self, script: Optional[Dict[str, str]] = None) -> None:
+        self.script = {k.strip().lower(): v for k, v in (script or {}).items()}
+        for ex in EXAMPLES:
+            self.script.setdefault(ex["user"].strip().lower(), f"```sql\n{ex['sql']}\n```")
+
+    def invoke(self, prompt: str) -> str:
+        m = re.search(r"USER QUESTION:\n(.*?)\n\n", prompt, re.DOTALL)
+        question = (m.group(1) if m else "").strip().lower()
+        return self.script.get(question, "```sql\nSELECT 1 AS unanswered;\n```")
+
+
+class CountingLLM:
+    """Wraps an LLM and counts invoke() calls."""
+
+    def __init__(self, inner: Any) -> None:
+        self.inner = inner
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> Any:
+        self.calls += 1
+        return self.inner.invoke(prompt)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, (Decimal, float)):
+        return round(float(value), 2)
+    if isinstance(value, (_dt.datetime, _dt.date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def results_equivalent(a: List[Tuple[Any, ...]], b: List[Tuple[Any, ...]]) -> bool:
+    """Compare result sets as multisets of normalized rows (column names ignored)."""
+    norm = lambda rows: sorted(repr(tuple(_normalize(v) for v in r)) for r in rows)
+    return norm(a) == norm(b)
+
+
+def _pct(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))], 2)
+
+
+def run_benchmark(assistant: Any, counting_llm: CountingLLM, questions: List[Dict[str, Any]],
+                  executor: Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]) -> Dict[str, Any]:
+    """Run every question through generate_sql / execute_sql and collect per-stage metrics."""
+    fixes = {"count": 0}
+    original_fix = assistant._auto_fix_sql
+
+    def counting_fix(sql: str, error: str) -> str:
+        fixed = original_fix(sql, error)
+        if fixed and fixed.strip() != sql.strip():
+            fixes["count"] += 1
+        return fixed
+
+    assistant._auto_fix_sql = counting_fix
+    per_question = []
+    for item in questions:
+        q = item["question"]
+        calls_before, fixes_before = counting_llm.calls, fixes["count"]
+        entry: Dict[str, Any] = {"question": q, "error": None, "equivalent": None}
+        t0 = time.perf_counter()
+        try:
+            entry["sql"] = assistant.generate_sql(q)
+        except Exception as e:
+            entry["sql"] = ""
+            entry["error"] = f"generate: {e}"
+        entry["generate_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        rows: List[Tuple[Any, ...]] = []
+        t1 = time.perf_counter()
+        if not entry["error"]:
+            try:
+                _, rows = assistant.execute_sql(entry["sql"])
+                entry["row_count"] = len(rows)
+            except Exception as e:
+                entry["error"] = f"execute: {e}"
+        entry["execute_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+        entry["llm_calls"] = counting_llm.calls - calls_before
+        entry["auto_fixes"] = fixes["count"] - fixes_before
+        ref_sql = item.get("reference_sql")
+        if ref_sql and ref_sql.strip().lower().startswith("select"):
+            try:
+                _, ref_rows = executor(ref_sql)
+                entry["equivalent"] = (not entry["error"]) and results_equivalent(rows, ref_rows)
+            except Exception as e:
+                entry["reference_error"] = str(e)
+        learner = getattr(assistant, "learning_manager", None)
+        if learner is not None and entry["sql"]:
+            # Only results that ran and did not contradict the reference become verified examples
+            succeeded = not entry["error"] and entry["equivalent"] is not False and not entry["auto_fixes"]
+            learner.learn_from_interaction(q, entry["sql"], succeeded, entry["execute_ms"] / 1000,
+                                           entry.get("row_count", 0), entry["error"] or ("auto-fixed" if entry["auto_fixes"] else None))
+        per_question.append(entry)
+        status = "✅" if not entry["error"] else "❌"
+        print(f"{status} {entry['generate_ms']:>8.1f}ms gen {entry['execute_ms']:>7.1f}ms exec | {q}")
+    assistant._auto_fix_sql = original_fix
+
+    gen = [e["generate_ms"] for e in per_question]
+    exe = [e["execute_ms"] for e in per_question]
+    scored = [e for e in per_question if e["equivalent"] is not None]
+    n = len(per_question) or 1
+    summary = {
+        "questions": len(per_question),
+        "generate_ms_p50": _pct(gen, 50),
+        "generate_ms_p95": _pct(gen, 95),
+        "execute_ms_p50": _pct(exe, 50),
+        "execute_ms_p95": _pct(exe, 95),
+        "llm_calls": sum(e["llm_calls"] for e in per_question),
+        "llm_calls_per_question": round(sum(e["llm_calls"] for e in per_question) / n, 3),
+        "regenerations": sum(max(0, e["llm_calls"] - 1) for e in per_question),
+        "regenerations_per_question": round(sum(max(0, e["llm_calls"] - 1) for e in per_question) / n, 3),
+        "auto_fixes_per_question": round(sum(e["auto_fixes"] for e in per_question) / n, 3),
+        "auto_fix_rate": round(sum(1 for e in per_question if e["auto_fixes"]) / n, 3),
+        "execution_success_rate": round(sum(1 for e in per_question if not e["error"]) / n, 3),
+        "accuracy_scored": len(scored),
+        "accuracy": round(sum(1 for e in scored if e["equivalent"]) / len(scored), 3) if scored else None,
+        "generate_ms_mean": round(statistics.mean(gen), 2) if gen else 0.0,
+    }
+    return {"summary": summary, "questions": per_question}
+
+
+def compare_summaries(baseline: Dict[str, Any], few_shot: Dict[str, Any]) -> Dict[str, Any]:
+    """few_shot minus baseline for the metrics verified examples are meant to move"""
+    keys = ("regenerations_per_question", "auto_fixes_per_question", "auto_fix_rate",
+            "execution_success_rate", "accuracy", "generate_ms_p50", "generate_ms_p95")
+    return {k: round(few_shot[k] - baseline[k], 3) for k in keys
+            if baseline.get(k) is not None and few_shot.get(k) is not None}
+
+
+def build_question_set(which: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    seen = set()
+    if which in ("examples", "both"):
+        for ex in EXAMPLES:
+            items.append({"question": ex["user"], "reference_sql": ex["sql"]})
+            seen.add(ex["user"].strip().lower())
+    if which in ("all", "both"):
+        for q in all_questions():
+            if q.strip().lower() not in seen:
+                seen.add(q.strip().lower())
+                items.append({"question": q})
+    return items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline NL-to-SQL latency and accuracy benchmark")
+    parser.add_argument("--llm", choices=["ollama", "stub", "cassette"], default="stub", help="LLM backend")
+    parser.add_argument("--script", help="JSON file mapping question -> completion for the stub backend")
+    parser.add_argument("--cassette", default="bench_nl2sql.cassette.json", help="Cassette file for --llm cassette")
+    parser.add_argument("--cassette-mode", choices=["record", "replay", "auto"], default="replay")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="Replay delay as a multiple of recorded time")
+    parser.add_argument("--questions", choices=["examples", "all", "both"], default="both")
+    parser.add_argument("--limit", type=int, help="Only run the first N questions")
+    parser.add_argument("--few-shot", choices=["off", "on", "compare"], default="off",
+                        help="Learn verified examples while running (on), or run without and then with them (compare)")
+    parser.add_argument("--seed-db", action="store_true", help="(Re)create and seed the local benchmark database first")
+    parser.add_argument("-o", "--output", default="bench_nl2sql_report.json", help="JSON report path")
+    args = parser.parse_args()
+
+    import mysql.connector
+
+    if BENCH_DB["database"] == os.getenv("DB_NAME", "staging_central_hub"):
+        raise SystemExit("Refusing to use the application database for benchmarking; set BENCH_DB_NAME.")
+    server = mysql.connector.connect(host=BENCH_DB["host"], user=BENCH_DB["user"], password=BENCH_DB["password"])
+    server.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{BENCH_DB['database']}`")
+    server.close()
+    conn = mysql.connector.connect(**BENCH_DB)
+    if args.seed_db:
+        counts = seed_database(conn, parse_schema_snapshot())
+        print(f"🌱 Seeded {BENCH_DB['database']}: {counts}")
+
+    # Point schema discovery at the benchmark database before the assistant imports it
+    os.environ["DATABASE_URL"] = (
+        f"mysql+mysqlconnector://{BENCH_DB['user']}:{BENCH_DB['password']}@{BENCH_DB['host']}/{BENCH_DB['database']}?ssl_disabled=True"
+    )
+    from single_model_db_assistant import SingleModelDBAssistant
+    from learning_store import InMemoryLearningStore
+    from learning_system import LearningManager
+
+    if args.llm == "stub":
+        script = None
+        if args.script:
+            with open(args.script, "r", encoding="utf-8") as f:
+                script = json.load(f)
+        inner = ScriptedLLM(script)
+    elif args.llm == "cassette":
+        from llm_config import CassetteLLM, get_single_llm
+        inner = CassetteLLM(
+            args.cassette,
+            mode=args.cassette_mode,
+            inner=None if args.cassette_mode == "replay" else get_single_llm(),
+            latency_scale=args.latency_scale,
+        )
+    else:
+        from llm_config import get_single_llm
+        inner = get_single_llm()
+    executor = make_mysql_executor(conn)
+    questions = build_question_set(args.questions)[: args.limit]
+
+    def run(few_shot: bool) -> Tuple[Any, Dict[str, Any]]:
+        # A fresh, empty learner per run so results only reflect this question set
+        learner = LearningManager(learning_data_file="", store=InMemoryLearningStore()) if few_shot else None
+        counting = CountingLLM(inner)
+        runner = SingleModelDBAssistant(embedded_mode=True, llm=counting, sql_executor=executor, learning_manager=learner)
+        return runner, run_benchmark(runner, counting, questions, executor)
+
+    started = time.perf_counter()
+    if args.few_shot == "compare":
+        print("▶️  Baseline (no verified examples)")
+        _, baseline = run(False)
+        print("▶️  With verified few-shot examples")
+        assistant, report = run(True)
+        report["baseline"] = baseline
+        report["few_shot_delta"] = compare_summaries(baseline["summary"], report["summary"])
+    else:
+        assistant, report = run(args.few_shot == "on")
+    report["config"] = {
+        "llm": args.llm,
+        "model": "stub" if args.llm == "stub" else assistant.model_name,
+        "questions": args.questions,
+        "few_shot": args.few_shot,
+        "database": BENCH_DB["database"],
+        "wall_seconds": round(time.perf_counter() - started, 2),
+    }
+    if args.llm == "cassette":
+        report["config"].update({"cassette": args.cassette, "cassette_hits": inner.hits, "cassette_misses": inner.misses})
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False, default=str)
+    print(json.dumps(report["summary"], indent=2))
+    if "few_shot_delta" in report:
+        print("Δ few-shot vs baseline:", json.dumps(report["few_shot_delta"], indent=2))
+    print(f"💾 Report written to {args.output}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Prompt-prefix benchmark: time-to-first-token against a live Ollama.
+
+Compares two ways of calling the model with the SQL-generation prompt:
+- baseline: the original layout (rules, schema and reference questions, with
+  the question last), the static part rebuilt on every call, and Ollama's
+  default options (default num_ctx, default keep_alive). Only what a rebuilt
+  prompt and the default context window leave reusable is reused.
+- stable:   cached byte-identical prefix plus LLM_CONFIG num_ctx/keep_alive,
+  so Ollama reuses the evaluated prefix and only processes the question
+
+For every question the script streams /api/generate and records the time to
+the first generated token and Ollama's prompt_eval_count (tokens it actually
+had to evaluate; a prefix cache hit shows up as a small count).
+
+Usage:
+    python bench_prompt_prefix.py --questions 20 --output prefix_bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from llm_config import LLM_CONFIG
+from reference_questions import all_questions
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def stream_ttft(base_url: str, model: str, prompt: str, options: Dict[str, Any],
+                keep_alive: Optional[str], num_predict: int = 32) -> Dict[str, Any]:
+    """Send one streaming generate request and time the first token."""
+    payload: Dict[str, Any] = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "options": {**options, "num_predict": num_predict},
+    }
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    started = time.perf_counter()
+    ttft = None
+    final: Dict[str, Any] = {}
+    with requests.post(f"{base_url}/api/generate", json=payload, stream=True, timeout=600) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if ttft is None and chunk.get("response"):
+                ttft = time.perf_counter() - started
+            if chunk.get("done"):
+                final = chunk
+                break
+    total = time.perf_counter() - started
+    return {
+        "ttft": ttft if ttft is not None else total,
+        "total": total,
+        "prompt_eval_count": final.get("prompt_eval_count", 0),
+        "prompt_eval_ms": final.get("prompt_eval_duration", 0) / 1e6,
+    }
+
+
+def baseline_prompt(assistant: Any, question: str) -> str:
+    """The prompt as _build_prompt built it before the prefix cache: static part rebuilt, question last"""
+    assistant._prefix_cache.clear()
+    assistant._snapshot_text = None
+    assistant._reference_text = None
+    return (
+        assistant._prompt_prefix("deliberate")
+        + f"USER QUESTION:\n{question}\n\n"
+        "Return only a single fenced sql code block."
+    )
+
+
+def run_mode(name: str, assistant: Any, questions: List[str], base_url: str, model: str) -> Dict[str, Any]:
+    if name == "baseline":
+        options: Dict[str, Any] = {"temperature": LLM_CONFIG.get("temperature", 0.1)}
+        keep_alive = None
+    else:
+        options = {"temperature": LLM_CONFIG.get("temperature", 0.1), "num_ctx": LLM_CONFIG.get("num_ctx")}
+        keep_alive = LLM_CONFIG.get("keep_alive")
+    build = (lambda q: baseline_prompt(assistant, q)) if name == "baseline" else assistant._build_prompt
+
+    # One untimed call loads the model with this mode's options
+    stream_ttft(base_url, model, build("warm up"), options, keep_alive, num_predict=1)
+
+    samples = []
+    for q in questions:
+        samples.append(stream_ttft(base_url, model, build(q), options, keep_alive))
+        print(f"  [{name}] ttft={samples[-1]['ttft'] * 1000:.0f}ms prompt_eval={samples[-1]['prompt_eval_count']} | {q}")
+
+    ttfts = [s["ttft"] * 1000 for s in samples]
+    return {
+        "mode": name,
+        "questions": len(samples),
+        "ttft_ms_p50": round(_percentile(ttfts, 50), 1),
+        "ttft_ms_p95": round(_percentile(ttfts, 95), 1),
+        "ttft_ms_mean": round(statistics.mean(ttfts), 1) if ttfts else 0.0,
+        "prompt_eval_tokens_mean": round(statistics.mean(s["prompt_eval_count"] for s in samples), 1) if samples else 0.0,
+        "prompt_eval_ms_mean": round(statistics.mean(s["prompt_eval_ms"] for s in samples), 1) if samples else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure time-to-first-token with and without a stable prompt prefix")
+    parser.add_argument("--questions", type=int, default=20, help="Number of reference questions to send per mode")
+    parser.add_argument("--modes", default="baseline,stable", help="Comma-separated modes to run, in order")
+    parser.add_argument("--base-url", default=LLM_CONFIG.get("base_url"))
+    parser.add_argument("--model", default=LLM_CONFIG.get("model"))
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    from single_model_db_assistant import SingleModelDBAssistant
+
+    assistant = SingleModelDBAssistant(model=args.model, base_url=args.base_url, embedded_mode=True)
+    questions = all_questions()[: args.questions]
+    prefix_chars = len(assistant._prompt_prefix("deliberate"))
+    print(f"🚀 Prompt prefix: {prefix_chars} chars | {len(questions)} questions | model {args.model}")
+
+    report = {"model": args.model, "prefix_chars": prefix_chars, "results": []}
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        report["results"].append(run_mode(mode, assistant, questions, args.base_url, args.model))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Count Answerer
+
+Fast path for plain count questions ("how many customers do we have",
+"orders per store", "how many products does Sony Bahrain have") that would
+otherwise cost an LLM call plus a COUNT(*) over a large table.
+
+Answers come from, in order of preference:
+- the aggregates the sync maintains on `stores` (total_customers,
+  total_orders, total_products), with a freshness note from `synced_at`
+- exact counts cached for COUNT_CONFIG["cache_ttl"] seconds
+- `information_schema.tables.table_rows` estimates, while the exact count is
+  refreshed in the background
+
+Only questions made of a count phrase, one entity and optionally a store
+name or a per-store grouping are handled; anything else (dates, filters,
+statuses) returns None and goes through SQL generation as before.
+"""
+
+from __future__ import annotations
+
+import datetime as _dt
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log_config import get_logger
+
+log = get_logger("count_answerer")
+
+COUNT_CONFIG = {
+    "enabled": os.getenv("COUNT_FAST_PATH", "1") not in ("0", "false", "False"),
+    "cache_ttl": int(os.getenv("COUNT_CACHE_TTL", "300")),
+    "store_names_ttl": int(os.getenv("COUNT_STORE_NAMES_TTL", "600")),
+}
+
+# entity -> table, aggregate column on `stores` (None: count the table), words that name it
+ENTITIES: Dict[str, Dict[str, Any]] = {
+    "customers": {"table": "customers", "aggregate": "total_customers", "words": ("customer", "customers", "client", "clients")},
+    "orders": {"table": "orders", "aggregate": "total_orders", "words": ("order", "orders")},
+    "products": {"table": "products", "aggregate": "total_products", "words": ("product", "products")},
+    "stores": {"table": "stores", "aggregate": None, "words": ("store", "stores", "shop", "shops")},
+    "variants": {"table": "product_variants", "aggregate": None, "words": ("variant", "variants", "product variants")},
+    "order items": {"table": "order_items", "aggregate": None, "words": ("order item", "order items", "line item", "line items")},
+    "returns": {"table": "order_returns", "aggregate": None, "words": ("return", "returns")},
+    "fulfillments": {"table": "order_fulfillments", "aggregate": None, "words": ("fulfillment", "fulfillments", "shipments")},
+    "transactions": {"table": "order_transaction", "aggregate": None, "words": ("transaction", "transactions", "payments")},
+}
+
+_ENTITY_WORDS = sorted(
+    ((word, entity) for entity, spec in ENTITIES.items() for word in spec["words"]),
+    key=lambda item: -len(item[0]),
+)
+_COUNT_RE = re.compile(r"\b(how many|count|number of|total)\b")
+_PER_STORE_RE = re.compile(r"\b(per|by|for each|each|every|across)\s+(store|stores|shop|shops)\b|\bstore[- ]?wise\b")
+# Words allowed around the count phrase and entity; any other word means a filter we do not handle
+_FILLER = frozenset((
+    "how", "many", "count", "number", "of", "total", "the", "a", "an", "do", "does", "did", "we", "i", "you",
+    "have", "has", "are", "is", "there", "in", "at", "for", "our", "my", "all", "what", "what's", "whats",
+    "show", "me", "give", "get", "tell", "list", "please", "currently", "database", "db", "altogether",
+    "overall", "it", "its", "their", "exist", "registered", "store", "stores", "shop", "shops", "s",
+))
+_WORD_RE = re.compile(r"[a-z0-9_']+")
+
+
+class CountQuestion:
+    __slots__ = ("entity", "per_store", "store")
+
+    def __init__(self, entity: str, per_store: bool, store: Optional[Tuple[str, str]]) -> None:
+        self.entity = entity
+        self.per_store = per_store
+        self.store = store  # (store_id, store_name)
+
+    def __repr__(self) -> str:
+        return f"CountQuestion({self.entity!r}, per_store={self.per_store}, store={self.store})"
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _synced(ts: _dt.datetime) -> str:
+    """'2024-05-01 10:20 (35 min ago)'"""
+    minutes = int((_dt.datetime.now() - ts).total_seconds() // 60)
+    if minutes < 1:
+        age = "just now"
+    elif minutes < 120:
+        age = f"{minutes} min ago"
+    elif minutes < 48 * 60:
+        age = f"{minutes // 60} h ago"
+    else:
+        age = f"{minutes // 1440} days ago"
+    return f"{ts:%Y-%m-%d %H:%M} ({age})"
+
+
+class CountAnswerer:
+    """Answers plain count questions without the LLM.
+
+    `execute` is the assistant's executor: sql -> (columns, rows).
+    """
+
+    def __init__(self, execute: Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]],
+                 cache_ttl: Optional[int] = None) -> None:
+        self.execute = execute
+        self.cache_ttl = COUNT_CONFIG["cache_ttl"] if cache_ttl is None else cache_ttl
+        self._lock = threading.Lock()
+        # count sql -> (fetched_at, columns, rows)
+        self._exact: Dict[str, Tuple[float, List[str], List[Tuple[Any, ...]]]] = {}
+        self._refreshing: set = set()
+        self._stores: List[Tuple[str, str]] = []
+        self._stores_loaded = 0.0
+
+    # -- recognition -------------------------------------------------------
+
+    def _store_names(self) -> List[Tuple[str, str]]:
+        if time.time() - self._stores_loaded > COUNT_CONFIG["store_names_ttl"]:
+            try:
+                _, rows = self.execute("SELECT store_id, store_name FROM stores")
+                self._stores = [(str(r[0]), str(r[1] or "")) for r in rows]
+            except Exception:
+                pass
+            self._stores_loaded = time.time()
+        return self._stores
+
+    def parse(self, question: str) -> Optional[CountQuestion]:
+        """Recognize a plain count question, or return None."""
+        q = " " + (question or "").lower().strip().rstrip("?.! ") + " "
+        per_store = bool(_PER_STORE_RE.search(q))
+        # "orders per store" is a count even without a count phrase
+        if not per_store and not _COUNT_RE.search(q):
+            return None
+        q = _PER_STORE_RE.sub(" ", q)
+
+        store = None
+        for store_id, name in sorted(self._store_names(), key=lambda s: -len(s[1])):
+            for label in (name.lower(), store_id.lower()):
+                if label and re.search(r"(?<![a-z0-9])" + re.escape(label) + r"(?![a-z0-9])", q):
+                    store = (store_id, name)
+                    q = q.replace(label, " ")
+                    break
+            if store:
+                break
+
+        # Longest names first, so "order items" is not read as "orders"
+        matched = set()
+        for word, entity in _ENTITY_WORDS:
+            pattern = r"\b" + re.escape(word) + r"\b"
+            if re.search(pattern, q):
+                matched.add(entity)
+                q = re.sub(pattern, " ", q)
+        if len(matched) > 1:
+            matched.discard("stores")  # "customers in store X": the store is the scope
+        if len(matched) != 1 or any(w not in _FILLER for w in _WORD_RE.findall(q)):
+            return None
+        entity = matched.pop()
+        if entity == "stores" and (per_store or store):
+            return None
+        return CountQuestion(entity, per_store and store is None, store)
+
+    # -- answers -----------------------------------------------------------
+
+    def answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Return {sql, columns, rows, note, source} for a count question, or None."""
+        if not COUNT_CONFIG["enabled"]:
+            return None
+        parsed = self.parse(question)
+        if parsed is None:
+            return None
+        spec = ENTITIES[parsed.entity]
+        try:
+            if spec["aggregate"]:
+                result = self._from_store_aggregates(parsed, spec)
+                if result is not None:
+                    return result
+            return self._from_table(parsed, spec)
+        except Exception as e:
+            log.warning("⚠️  Count fast path failed, falling back to SQL generation: %s", e)
+            return None
+
+    def _from_store_aggregates(self, parsed: CountQuestion, spec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        col = spec["aggregate"]
+        if parsed.store:
+            sql = f"SELECT store_name, {col}, synced_at FROM stores WHERE store_id = {_quote(parsed.store[0])}"
+        elif parsed.per_store:
+            sql = f"SELECT store_id, store_name, {col}, synced_at FROM stores ORDER BY {col} DESC"
+        else:
+            sql = f"SELECT SUM({col}) AS {col}, COUNT(*) AS stores, MIN(synced_at) AS oldest_synced_at FROM stores"
+        columns, rows = self.execute(sql)
+        if not rows or rows[0][columns.index(col)] is None:
+            return None  # aggregates not maintained yet
+        synced = [r[-1] for r in rows if isinstance(r[-1], _dt.datetime)]
+        # A total or per-store list is only as fresh as the store synced longest ago
+        if parsed.store:
+            note = f"From store aggregates as of the last sync {_synced(min(synced))}." if synced else "From store aggregates maintained by the sync."
+        else:
+            note = f"From store aggregates maintained by the sync; oldest store sync {_synced(min(synced))}." if synced else "From store aggregates maintained by the sync."
+        return {"sql": sql, "columns": columns, "rows": rows, "note": note, "source": "store_aggregates"}
+
+    def _count_sql(self, table: str, per_store: bool, store: Optional[Tuple[str, str]]) -> str:
+        if per_store:
+            return f"SELECT t.store_id, s.store_name, COUNT(*) AS {table}_count FROM {table} t LEFT JOIN stores s ON s.store_id = t.store_id GROUP BY t.store_id, s.store_name ORDER BY {table}_count DESC"
+        if store:
+            return f"SELECT COUNT(*) AS {table}_count FROM {table} WHERE store_id = {_quote(store[0])}"
+        return f"SELECT COUNT(*) AS {table}_count FROM {table}"
+
+    def _from_table(self, parsed: CountQuestion, spec: Dict[str, Any]) -> Dict[str, Any]:
+        table = spec["table"]
+        sql = self._count_sql(table, parsed.per_store, parsed.store)
+        with self._lock:
+            cached = self._exact.get(sql)
+        if cached and time.time() - cached[0] <= self.cache_ttl:
+            return {"sql": "", "columns": cached[1], "rows": cached[2],
+                    "note": f"Exact count cached {int(time.time() - cached[0])}s ago.", "source": "cached_count"}
+
+        # Whole-table totals are answered immediately while the exact count refreshes in the background
+        if not parsed.per_store and not parsed.store and table != "stores":
+            if cached:
+                self._refresh_async(sql)
+                return {"sql": "", "columns": cached[1], "rows": cached[2],
+                        "note": f"Exact count from {int(time.time() - cached[0])}s ago; refreshing.", "source": "cached_count"}
+            estimate = self._estimate(table)
+            if estimate is not None:
+                self._refresh_async(sql)
+                return {"sql": "", "columns": [f"{table}_count_estimate"], "rows": [(estimate,)],
+                        "note": "Estimate from table statistics; the exact count is being refreshed.",
+                        "source": "table_statistics"}
+
+        columns, rows = self._refresh(sql)
+        return {"sql": "", "columns": columns, "rows": rows, "note": "Exact count (cached for reuse).", "source": "exact_count"}
+
+    def _estimate(self, table: str) -> Optional[int]:
+        try:
+            _, rows = self.execute(
+                "SELECT table_rows FROM information_schema.tables"
+                f" WHERE table_schema = DATABASE() AND table_name = {_quote(table)}"
+            )
+            return int(rows[0][0]) if rows and rows[0][0] is not None else None
+        except Exception:
+            return None
+
+    def _refresh(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        columns, rows = self.execute(sql)
+        with self._lock:
+            self._exact[sql] = (time.time(), columns, rows)
+        return columns, rows
+
+    def _refresh_async(self, sql: str) -> None:
+        with self._lock:
+            if sql in self._refreshing:
+                return
+            self._refreshing.add(sql)
+
+        def _run() -> None:
+            try:
+                self._refresh(sql)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(sql)
+
+        threading.Thread(target=_run, daemon=True, name="count-refresh").start()
+
+    def invalidate(self) -> None:
+        """Drop cached counts and store names (e.g. after a sync)."""
+        with self._lock:
+            self._exact.clear()
+        self._stores_loaded = 0.0
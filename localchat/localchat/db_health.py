@@ -0,0 +1,243 @@
+"""
+Database Health
+
+One health manager shared by every caller of the MySQL database (sql_api,
+the assistant's embedded executor, DynamicDatabaseManager), so that while the
+remote database is down or flapping requests fail fast with a clear error
+instead of each waiting through its own connect timeout.
+
+- Circuit breaker: after DB_HEALTH_CONFIG["failure_threshold"] consecutive
+  connection failures the circuit opens and calls raise DatabaseUnavailable
+  immediately. After a jittered, exponentially growing cool-down one trial
+  call is let through (half-open); its outcome closes or re-opens the circuit.
+- Only connectivity failures count: SQL errors (unknown column, syntax) mean
+  the database is up.
+- Keepalive: a background thread pings with the registered probe, so the
+  circuit notices an outage (and, while it is open, a recovery) off the
+  request path. The probe opens its own connection; it does not keep the
+  request handlers' connections alive.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import socket
+import ssl
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from log_config import get_logger
+
+T = TypeVar("T")
+
+log = get_logger("db_health")
+
+DB_HEALTH_CONFIG = {
+    "failure_threshold": int(os.getenv("DB_BREAKER_FAILURES", "3")),
+    "open_seconds": float(os.getenv("DB_BREAKER_OPEN_SECONDS", "5")),
+    "max_open_seconds": float(os.getenv("DB_BREAKER_MAX_OPEN_SECONDS", "60")),
+    "keepalive_interval": float(os.getenv("DB_KEEPALIVE_INTERVAL", "30")),
+    "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+}
+
+# MySQL client errors that mean "cannot reach the server", not "bad query"
+_CONNECTION_ERRNOS = frozenset((1040, 1129, 1158, 1159, 1160, 1161, 2002, 2003, 2005, 2006, 2013, 2026, 2047, 2055))
+_CONNECTION_ERROR_TYPES = frozenset(("InterfaceError", "DisconnectionError", "ConnectionTimeoutError", "PoolError"))
+_CONNECTION_MESSAGES = (
+    "lost connection", "gone away", "can't connect", "cannot connect", "connection refused",
+    "timed out", "bad record mac", "decryption_failed", "connection reset", "not connected",
+)
+
+
+class DatabaseUnavailable(RuntimeError):
+    """Raised without touching the database while the circuit is open"""
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True for failures to reach the database (as opposed to errors in the SQL)"""
+    if isinstance(error, DatabaseUnavailable):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, ssl.SSLError)):
+        return True
+    # SQLAlchemy wraps the driver error
+    original = getattr(error, "orig", None)
+    if original is not None and original is not error and is_connection_error(original):
+        return True
+    errno = getattr(error, "errno", None)
+    if errno in _CONNECTION_ERRNOS:
+        return True
+    if type(error).__name__ in _CONNECTION_ERROR_TYPES:
+        return True
+    message = str(error).lower()
+    return any(m in message for m in _CONNECTION_MESSAGES)
+
+
+def jittered_backoff(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** max(0, attempt))))
+
+
+class DatabaseHealth:
+    """Circuit breaker plus keepalive for one database"""
+
+    def __init__(self, name: str = "mysql", failure_threshold: Optional[int] = None,
+                 open_seconds: Optional[float] = None, max_open_seconds: Optional[float] = None) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold or DB_HEALTH_CONFIG["failure_threshold"]
+        self.open_seconds = open_seconds or DB_HEALTH_CONFIG["open_seconds"]
+        self.max_open_seconds = max_open_seconds or DB_HEALTH_CONFIG["max_open_seconds"]
+        self._lock = threading.Lock()
+        self.state = "closed"            # closed | open | half_open
+        self.consecutive_failures = 0
+        self.times_opened = 0            # consecutive openings; grows the cool-down
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        self.last_failure_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_ping_ms: Optional[float] = None
+        self.rejected = 0
+        self._trial_running = False
+        self._probe: Optional[Callable[[], Any]] = None
+        self._keepalive: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -- breaker -----------------------------------------------------------
+
+    def _cooldown(self) -> float:
+        base = min(self.max_open_seconds, self.open_seconds * (2 ** max(0, self.times_opened - 1)))
+        return base * random.uniform(0.8, 1.2)
+
+    def check(self) -> None:
+        """Raise DatabaseUnavailable if calls should not reach the database right now"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            now = time.time()
+            if self.state == "open" and now >= self.open_until:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True  # this caller is the trial
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.open_until - now)
+        raise DatabaseUnavailable(
+            f"Database unavailable (circuit open after {self.consecutive_failures} connection failures; "
+            f"retrying in {retry_in:.0f}s). Last error: {self.last_error}"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                log.info("✅ Database '%s' reachable again; circuit closed", self.name)
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.times_opened = 0
+            self._trial_running = False
+            self.last_success_at = time.time()
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"[:300]
+            self.last_failure_at = time.time()
+            trial_failed = self.state == "half_open"
+            self._trial_running = False
+            if trial_failed or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+                self.times_opened += 1
+                cooldown = self._cooldown()
+                self.state = "open"
+                self.open_until = time.time() + cooldown
+                log.warning("⚠️  Database '%s' circuit open for %.1fs: %s", self.name, cooldown, self.last_error)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run `fn` through the breaker; connection failures count against the database"""
+        self.check()
+        try:
+            result = fn()
+        except DatabaseUnavailable:
+            with self._lock:
+                self._trial_running = False
+            raise
+        except Exception as e:
+            if is_connection_error(e):
+                self.record_failure(e)
+            else:
+                self.record_success()  # the server answered, even if with an error
+            raise
+        except BaseException:
+            with self._lock:
+                self._trial_running = False
+            raise
+        self.record_success()
+        return result
+
+    @property
+    def available(self) -> bool:
+        return self.state == "closed" or (self.state == "open" and time.time() >= self.open_until)
+
+    # -- keepalive ---------------------------------------------------------
+
+    def set_probe(self, probe: Callable[[], Any]) -> None:
+        """`probe` runs a trivial query (e.g. SELECT 1); used by the keepalive thread"""
+        self._probe = probe
+
+    def ping(self) -> bool:
+        """Run the probe through the breaker; False if it failed or the circuit rejected it"""
+        if self._probe is None:
+            return self.state == "closed"
+        started = time.perf_counter()
+        try:
+            self.call(self._probe)
+        except Exception:
+            return False
+        self.last_ping_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+    def _keepalive_loop(self, interval: float) -> None:
+        while True:
+            # While open, wake up when the cool-down ends so the reconnect happens here, not in a request
+            wait = interval if self.state == "closed" else max(0.5, min(interval, self.open_until - time.time()))
+            if self._stop.wait(wait):
+                return
+            self.ping()
+
+    def start_keepalive(self, interval: Optional[float] = None) -> bool:
+        interval = DB_HEALTH_CONFIG["keepalive_interval"] if interval is None else interval
+        if interval <= 0 or (self._keepalive is not None and self._keepalive.is_alive()):
+            return False
+        self._stop.clear()
+        self._keepalive = threading.Thread(target=self._keepalive_loop, args=(interval,), daemon=True,
+                                           name=f"db-keepalive-{self.name}")
+        self._keepalive.start()
+        return True
+
+    def stop_keepalive(self) -> None:
+        self._stop.set()
+
+    def status(self) -> Dict[str, Any]:
+        """State for /health"""
+        now = time.time()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_seconds": round(max(0.0, self.open_until - now), 1) if self.state != "closed" else 0,
+            "rejected_calls": self.rejected,
+            "last_error": self.last_error,
+            "seconds_since_success": round(now - self.last_success_at, 1) if self.last_success_at else None,
+            "last_ping_ms": self.last_ping_ms,
+            "keepalive": self._keepalive is not None and self._keepalive.is_alive(),
+        }
+
+
+_health: Dict[str, DatabaseHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_db_health(name: str = "mysql") -> DatabaseHealth:
+    """Shared health manager for a database (all DB_* callers use "mysql")"""
+    with _health_lock:
+        if name not in _health:
+            _health[name] = DatabaseHealth(name)
+        return _health[name]
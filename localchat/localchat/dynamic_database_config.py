@@ -5,24 +5,158 @@ This module provides dynamic database schema understanding through prompts and d
 
 import os
 import ssl
+import threading
 import time
 import re
-from typing import List, Dict, Any, Tuple
-from langchain_community.utilities import SQLDatabase
+from typing import List, Dict, Any, Optional, Tuple
 from tabulate import tabulate
 
+from db_health import DatabaseUnavailable, get_db_health, is_connection_error, jittered_backoff
+from log_config import debug_enabled, get_logger, lazy
+from rollups import ROLLUP_PROMPT, ROLLUP_TABLE, STATE_TABLE
+from join_planner import JoinPlanner
+from schema_catalog import CatalogIndex, introspect, load_catalog, render_structure, schema_checksum, write_cache
+
+log = get_logger("schema")
+
+# SCHEMA_INIT: "lazy" connects on first use, "background" starts connecting at import,
+# "eager" connects during import (the old behavior)
+# SCHEMA_WATCH_INTERVAL: seconds between schema checksum polls (0 disables the watcher)
+SCHEMA_CONFIG = {
+    "init": os.getenv("SCHEMA_INIT", "lazy").lower(),
+    "watch_interval": float(os.getenv("SCHEMA_WATCH_INTERVAL", "60")),
+}
+
+
+class SchemaState:
+    """One consistent view of the schema: table info, catalog, its index and the prompt built from them.
+
+    States are never modified; a schema change builds a new one and swaps the
+    manager's reference, so a request holding a state keeps a coherent view.
+    """
+    __slots__ = ("schema_info", "catalog", "index", "source", "prompt", "version", "built_at")
+
+    def __init__(self, schema_info, catalog, index, source, prompt, version):
+        self.schema_info = schema_info
+        self.catalog = catalog
+        self.index = index
+        self.source = source
+        self.prompt = prompt
+        self.version = version
+        self.built_at = time.time()
+
+    @property
+    def checksum(self):
+        return self.catalog.get("checksum") if self.catalog else None
+
 
 class DynamicDatabaseManager:
     """Manages database connections with dynamic schema understanding"""
 
-    def __init__(self, connection_string=None):
-        """Initialize dynamic database manager"""
+    def __init__(self, connection_string=None, lazy=False):
+        """Initialize dynamic database manager.
+
+        With lazy=True nothing is connected until the database or schema is
+        first needed (or start_background_init() is called); until then the
+        prompt is built from the fallback schema.
+        """
         self.connection_string = connection_string or self._get_default_connection()
         self.db = None
-        self.schema_info = None
-        self._connect()
-        if self.db:
-            self._analyze_schema()
+        self.init_error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+        self._init_lock = threading.Lock()
+        self._init_started = False
+        self._ready = threading.Event()
+        self._state: Optional[SchemaState] = None
+        self._fallback_state: Optional[SchemaState] = None
+        self._swap_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        if not lazy:
+            self._initialize()
+
+    @property
+    def ready(self) -> bool:
+        """True once the connection attempt and schema analysis have finished"""
+        return self._ready.is_set()
+
+    # The current state's fields; callers that need several of them together should use snapshot()
+    @property
+    def schema_info(self):
+        return self._state.schema_info if self._state else None
+
+    @property
+    def catalog(self):
+        """Structured schema from schema_catalog, when available"""
+        return self._state.catalog if self._state else None
+
+    @property
+    def schema_source(self):
+        """Where the schema came from: cache, database, stale-cache, table_info or fallback"""
+        return self._state.source if self._state else None
+
+    def snapshot(self) -> SchemaState:
+        """Current schema state without blocking; the fallback schema until analysis is done"""
+        state = self._state
+        if self._ready.is_set() and state is not None and state.schema_info:
+            return state
+        self.start_background_init()
+        if self._fallback_state is None:
+            self._fallback_state = self._build_state(self._create_fallback_schema(), None, "fallback", 0)
+        return self._fallback_state
+
+    def _build_state(self, schema_info, catalog, source, version):
+        index = CatalogIndex.from_catalog(catalog) if catalog else CatalogIndex.from_structures(schema_info)
+        prompt = self._build_description_prompt(schema_info, index)
+        return SchemaState(schema_info, catalog, index, source, prompt, version)
+
+    def _set_state(self, schema_info, catalog, source):
+        """Build a new state (prompt included) and swap it in"""
+        with self._swap_lock:
+            version = self._state.version + 1 if self._state else 1
+            self._state = self._build_state(schema_info, catalog, source, version)
+
+    def _initialize(self):
+        """Connect and analyze the schema; runs once per manager"""
+        with self._init_lock:
+            if self._init_started:
+                return
+            self._init_started = True
+        started = time.perf_counter()
+        try:
+            self._connect()
+            if self.db:
+                self._analyze_schema()
+            else:
+                self.init_error = "Database connection failed"
+                # Describe the last known schema rather than the generic fallback
+                catalog, source = load_catalog(None)
+                if catalog:
+                    self._use_catalog(catalog, source)
+        except Exception as e:
+            self.init_error = str(e)
+            log.error("Schema initialization failed: %s", e)
+        finally:
+            self.init_seconds = time.perf_counter() - started
+            self._ready.set()
+
+    def start_background_init(self) -> bool:
+        """Connect and analyze the schema on a daemon thread; False if already started"""
+        with self._init_lock:
+            if self._init_started:
+                return False
+        threading.Thread(target=self._initialize, daemon=True, name="schema-init").start()
+        return True
+
+    def ensure_initialized(self, timeout: Optional[float] = None) -> bool:
+        """Block until initialization finishes (starting it if needed); False on timeout"""
+        if self._ready.is_set():
+            return True
+        if timeout is None:
+            self._initialize()  # returns at once if another thread is already initializing
+        else:
+            self.start_background_init()
+        return self._ready.wait(timeout)
 
     def _get_default_connection(self):
         """Get default database connection string (env or fallback)"""
@@ -35,26 +169,103 @@ class DynamicDatabaseManager:
     def _connect(self):
         """Establish database connection"""
         try:
+            # Imported here so importing this module stays cheap
+            from langchain_community.utilities import SQLDatabase
+
             self.db = SQLDatabase.from_uri(
                 self.connection_string,
-                sample_rows_in_table_info=15,   # More rows for schema understanding
+                sample_rows_in_table_info=0,    # Schema comes from schema_catalog; no per-table sampling
+                lazy_table_reflection=True,     # Reflect tables only if get_table_info() is needed
                 include_tables=None,
-                max_string_length=5000          # Prevent truncation
+                max_string_length=5000,         # Prevent truncation
+                # Drop connections the server closed while idle instead of failing the next query
+                engine_args={"pool_pre_ping": True, "pool_recycle": 1800}
             )
-            print("[OK] Database connection established successfully!")
+            log.info("Database connection established")
         except Exception as e:
-            print(f"[ERROR] Database connection failed: {e}")
+            log.error("Database connection failed: %s", e)
             self.db = None
 
+    def _fetch_rows(self, sql):
+        """Run SQL on the SQLDatabase engine and return (columns, rows)"""
+        from sqlalchemy import text
+
+        with self.db._engine.connect() as conn:
+            result = conn.execute(text(sql))
+            return list(result.keys()), [tuple(r) for r in result.fetchall()]
+
+    def _use_catalog(self, catalog, source):
+        schema_info = {
+            name: {
+                'structure': render_structure(name, table),
+                'description': self._generate_table_description(name, None),
+            }
+            for name, table in catalog["tables"].items()
+        }
+        self._set_state(schema_info, catalog, source)
+
     def _analyze_schema(self):
         """Analyze database schema to understand table structures"""
         try:
+            # Bulk information_schema read, or the on-disk cache when its checksum still matches
+            started = time.perf_counter()
+            catalog, source = load_catalog(self._fetch_rows)
+            if catalog and catalog.get("tables"):
+                self._use_catalog(catalog, source)
+                log.info("Database schema loaded from %s: %d tables in %.0fms",
+                         source, len(catalog['tables']), (time.perf_counter() - started) * 1000)
+                return
+            # No information_schema (e.g. SQLite): parse the CREATE TABLE text instead
             table_info = self.db.get_table_info()
-            self.schema_info = self._extract_schema_details(table_info)
-            print("[OK] Database schema analyzed successfully!")
+            self._set_state(self._extract_schema_details(table_info), None, "table_info")
+            log.info("Database schema analyzed")
         except Exception as e:
-            print(f"[ERROR] Schema analysis failed: {e}")
-            self.schema_info = self._create_fallback_schema()
+            log.error("Schema analysis failed: %s", e)
+            self._set_state(self._create_fallback_schema(), None, "fallback")
+
+    # --- Schema change watcher ---
+
+    def check_schema(self) -> bool:
+        """Rebuild the schema state if the database schema changed; True if a new state was swapped in.
+
+        Costs one checksum query when nothing changed. Only catalog-backed
+        states (MySQL) are watched.
+        """
+        state = self._state
+        if self.db is None or state is None or not state.checksum:
+            return False
+        try:
+            current = schema_checksum(self._fetch_rows)
+            if (state.catalog.get("database"), state.checksum) == current:
+                return False
+            started = time.perf_counter()
+            catalog = introspect(self._fetch_rows, current)
+        except Exception as e:
+            log.warning("Schema check failed: %s", e)
+            return False
+        write_cache(catalog)
+        self._use_catalog(catalog, "database")
+        log.info("Schema change detected; state v%d with %d tables swapped in after %.0fms",
+                 self._state.version, len(catalog['tables']), (time.perf_counter() - started) * 1000)
+        return True
+
+    def _watch(self, interval):
+        self.ensure_initialized()
+        while not self._watch_stop.wait(interval):
+            self.check_schema()
+
+    def start_schema_watcher(self, interval: Optional[float] = None) -> bool:
+        """Poll the schema checksum every `interval` seconds on a daemon thread"""
+        interval = SCHEMA_CONFIG["watch_interval"] if interval is None else interval
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return False
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True, name="schema-watcher")
+        self._watcher.start()
+        return True
+
+    def stop_schema_watcher(self):
+        self._watch_stop.set()
 
     def _extract_schema_details(self, table_info):
         """Extract detailed schema information from table info"""
@@ -83,7 +294,7 @@ class DynamicDatabaseManager:
                 }
 
         except Exception as e:
-            print(f"[WARN] Schema parsing warning: {e}")
+            log.warning("Schema parsing warning: %s", e)
             schema_details = self._create_fallback_schema()
         return schema_details
 
@@ -107,7 +318,8 @@ class DynamicDatabaseManager:
             'sku_mapping': 'Contains SKU mappings to product and variant IDs',
             'stores': 'Contains store records including store_id, store_name, shop_url, status, synced_at, and aggregate counts',
             'admin': 'Contains administrative user accounts',
-            'chat_messages': 'Contains chat message logs for conversations'
+            'chat_messages': 'Contains chat message logs for conversations',
+            ROLLUP_TABLE: 'Daily rollup per store and country: orders_count, revenue, items_sold, new_customers (refreshed after each sync)'
 
             
         }
@@ -147,45 +359,64 @@ class DynamicDatabaseManager:
         }
 
     def get_database(self):
-        """Get the database connection"""
+        """Get the database connection (initializes on first use)"""
+        self.ensure_initialized()
         return self.db
 
     def is_connected(self):
-        """Check if database is connected"""
+        """Check if database is connected (does not trigger initialization)"""
         return self.db is not None
 
     def get_schema_info(self):
-        """Get the analyzed schema information"""
+        """Get the analyzed schema information (initializes on first use)"""
+        self.ensure_initialized()
         return self.schema_info
 
-    def _generate_schema_description(self):
+    def _generate_schema_description(self, schema_info, index=None):
         """Generate a schema description for LLM prompting"""
-        if not self.schema_info:
+        if not schema_info:
             return "Database schema unavailable"
 
         # Exclude sensitive/non-analytic tables from prompts
-        excluded_tables = {"admin", "chat_messages"}
+        excluded_tables = {"admin", "chat_messages", STATE_TABLE}
 
         schema_desc = ["The database contains the following tables (excluding admin/chat_messages):"]
-        for table_name, table_info in self.schema_info.items():
+        for table_name, table_info in schema_info.items():
             if table_name in excluded_tables:
                 continue
             schema_desc.append(f"\n📋 **{table_name}**: {table_info.get('description', 'Contains data')}")
+            columns = index.column_names.get(table_name) if index else None
+            if columns:
+                shown = [c for c in columns if c.lower() != "access_token"]
+                schema_desc.append(f"   Columns: {', '.join(shown)}")
 
         schema_desc.append("\n## TABLE RELATIONSHIPS:")
-        schema_desc.append("- stores → customers (via store_id)")
-        schema_desc.append("- stores → products (via store_id)")
-        schema_desc.append("- products → product_variants (via product_id)")
-        schema_desc.append("- orders → stores (via store_id)")
-        schema_desc.append("- order_customer: order_id ↔ orders.order_id; customer_id ↔ customers.customer_id")
-        schema_desc.append("- orders → order_items (via order_id)")
-        schema_desc.append("- orders → order_transaction (via order_id)")
+        # Join keys from the catalog's FK graph when there is one; the hand-written list otherwise
+        relationships = JoinPlanner(index).relationships() if index and any(index.join_graph.values()) else []
+        if relationships:
+            schema_desc.extend(relationships)
+        else:
+            schema_desc.append("- stores → customers (via store_id)")
+            schema_desc.append("- stores → products (via store_id)")
+            schema_desc.append("- products → product_variants (via product_id)")
+            schema_desc.append("- orders → stores (via store_id)")
+            schema_desc.append("- order_customer: order_id ↔ orders.order_id; customer_id ↔ customers.customer_id")
+            schema_desc.append("- orders → order_items (via order_id)")
+            schema_desc.append("- orders → order_transaction (via order_id)")
+
+        # Advertise the rollups only once they exist, so generated SQL never points at a missing table
+        if ROLLUP_TABLE in schema_info:
+            schema_desc.append(ROLLUP_PROMPT)
 
         return "\n".join(schema_desc)
 
     def get_database_description_prompt(self):
+        """Database description prompt of the current schema state (built when the state was swapped in)"""
+        return self.snapshot().prompt
+
+    def _build_description_prompt(self, schema_info, index=None):
         """Generate the comprehensive database description prompt for LLM training"""
-        schema_text = self._generate_schema_description()
+        schema_text = self._generate_schema_description(schema_info, index)
         prompt = f"""
 ## DATABASE SCHEMA
 {schema_text}
@@ -245,12 +476,12 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
         """
         valid, checked_query = self.validate_sql(query)
         if not valid:
-            print(checked_query)
+            log.warning("%s", checked_query)
             return {"error": checked_query}
 
         result = self.execute_query(checked_query)
         if not result:
-            print("[WARN] No results found.")
+            log.info("No results found.")
             return {"error": "No results found."}
 
         # Format result
@@ -266,17 +497,18 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
                 summary_note = f"\n[WARN] Showing top {max_rows} rows out of {len(rows)} total."
                 table_output += summary_note
 
-            print(table_output)
+            log.debug("%s", table_output)
             return table_output  # Return the formatted table directly instead of wrapped in dict
 
         except Exception as e:
-            print(f"[ERROR] Result formatting failed: {e}")
+            log.error("Result formatting failed: %s", e)
             return {"error": str(e)}
 
         
     def get_table_suggestions(self, user_query):
         """Get relevant table suggestions based on user query"""
-        if not self.schema_info:
+        schema_info = self.snapshot().schema_info
+        if not schema_info:
             return []
 
         query_lower = user_query.lower()
@@ -293,10 +525,10 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
         for keyword, tables in keyword_mapping.items():
             if keyword in query_lower:
                 for table in tables:
-                    if table in self.schema_info:
+                    if table in schema_info:
                         relevant_tables.append({
                             'table': table,
-                            'description': self.schema_info[table]['description'],
+                            'description': schema_info[table]['description'],
                             'relevance': 'high'
                         })
 
@@ -319,56 +551,32 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
 
         query_clean = query.strip().rstrip(";")
 
-        if not self.schema_info:
+        self.ensure_initialized()
+        state = self._state  # one state for the whole check, even if the watcher swaps
+        if state is None or not state.schema_info:
             return False, "[ERROR] Schema information unavailable for validation."
 
-        # --- Extract tables ---
-        used_tables = re.findall(
-            r"\bfrom\s+([a-zA-Z0-9_]+)|\bjoin\s+([a-zA-Z0-9_]+)", 
-            query_clean, re.IGNORECASE
-        )
-        used_tables = {t for tup in used_tables for t in tup if t}
-
-        for table in used_tables:
-            if table not in self.schema_info:
-                return False, f"[ERROR] Table '{table}' not found in schema."
-
-        # --- Extract columns ---
-        selected_cols = re.findall(
-            r"select\s+(.*?)\s+from", query_clean, re.IGNORECASE | re.DOTALL
-        )
-
-        if selected_cols:
-            cols = re.split(r",\s*", selected_cols[0])
-            for col in cols:
-                col = col.strip().split(" ")[0]  # remove aliases
-                if col != "*" and not any(
-                    col in self.schema_info[t]["structure"] for t in used_tables
-                ):
-                    return False, f"[ERROR] Column '{col}' not found in referenced tables."
+        # Hash lookups against the catalog index; only definite problems are reported
+        problem = state.index.check_sql(query_clean)
+        if problem:
+            return False, f"[ERROR] {problem}"
 
         return True, query_clean
 
     def execute_query(self, query, max_retries=3):
         """Execute a SQL query with retry logic"""
+        self.ensure_initialized()
         if not self.is_connected():
-            print("[ERROR] Database not connected")
+            log.error("Database not connected")
             return None
 
         attempts = 0
         while attempts < max_retries:
             try:
-                result = self.db.run(query)
-                # Print a concise raw preview for transparency (non-blocking)
-                try:
-                    preview = result
-                    if isinstance(result, list):
-                        preview = result[:3]
-                    elif isinstance(result, str) and len(result) > 800:
-                        preview = result[:800] + "... (truncated)"
-                    print("[RAW] SQL result preview:", preview)
-                except Exception:
-                    pass
+                # Shared circuit breaker: fails fast while the database is down
+                result = get_db_health().call(lambda: self.db.run(query))
+                # Concise raw preview, only rendered at DEBUG
+                log.debug("SQL result preview: %s", lazy(lambda: result[:3] if isinstance(result, list) else str(result)[:800]))
                 # Normalize to list of dicts to avoid tuple-like rows upstream
                 if isinstance(result, list) and result:
                     try:
@@ -383,15 +591,18 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
                                 values = list(r) if not isinstance(r, dict) else [r.get(h) for h in headers]
                             row_obj = {h: (values[i] if i < len(values) else None) for i, h in enumerate(headers)}
                             dict_rows.append(row_obj)
-                        # Pretty print
-                        rows_for_print = [[row_obj.get(h) for h in headers] for row_obj in dict_rows]
-                        print(tabulate(rows_for_print, headers=headers, tablefmt="fancy_grid"))
+                        if debug_enabled(log):
+                            rows_for_print = [[row_obj.get(h) for h in headers] for row_obj in dict_rows]
+                            log.debug("\n%s", tabulate(rows_for_print, headers=headers, tablefmt="fancy_grid"))
                         return dict_rows
                     except Exception:
                         # Fall back to original behavior if normalization fails
                         pass
                 # If not a non-empty list, return as-is
                 return result
+            except DatabaseUnavailable as e:
+                log.warning("%s", e)
+                return None
             except Exception as e:
                 message = str(e)
                 is_ssl_error = (
@@ -400,19 +611,42 @@ Assistant: SELECT product_id, title, vendor, status FROM products LIMIT 20;
                     or "bad record mac" in message.lower()
                 )
                 attempts += 1
-                if is_ssl_error and attempts < max_retries:
-                    print(f"[RETRY] SSL error detected, retrying... (attempt {attempts}/{max_retries})")
-                    time.sleep(0.8 * attempts)
+                if (is_ssl_error or is_connection_error(e)) and attempts < max_retries:
+                    log.warning("%s error detected, retrying... (attempt %d/%d)", "SSL" if is_ssl_error else "Connection", attempts, max_retries)
+                    time.sleep(jittered_backoff(attempts))
                     continue
                 else:
-                    print(f"[ERROR] Query execution failed: {e}")
+                    log.error("Query execution failed: %s", e)
                     return None
         return None
 
 
 # --- Global helper functions ---
 
-dynamic_db_manager = DynamicDatabaseManager()
+dynamic_db_manager = DynamicDatabaseManager(lazy=SCHEMA_CONFIG["init"] != "eager")
+if SCHEMA_CONFIG["init"] == "background":
+    dynamic_db_manager.start_background_init()
+
+def start_schema_init():
+    """Begin connecting and analyzing the schema off the calling thread"""
+    return dynamic_db_manager.start_background_init()
+
+def is_schema_ready():
+    return dynamic_db_manager.ready
+
+def start_schema_watcher(interval: Optional[float] = None):
+    """Rebuild the schema state in the background when the database schema changes"""
+    return dynamic_db_manager.start_schema_watcher(interval)
+
+def get_schema_state():
+    return dynamic_db_manager.snapshot()
+
+def get_catalog_index():
+    """CatalogIndex of the current schema state (column sets, keys, join graph)"""
+    return dynamic_db_manager.snapshot().index
+
+def wait_for_schema(timeout: Optional[float] = None):
+    return dynamic_db_manager.ensure_initialized(timeout)
 
 def get_dynamic_db():
     return dynamic_db_manager.get_database()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Index Advisor
+
+Recommends MySQL indexes for the queries the assistant actually runs.
+
+1. Workload: SQL and execution_time from the LearningManager store
+   (learning.db interactions, or an old learning_data.json), grouped by fingerprint (literals
+   replaced by '?'), weighted by frequency x mean latency = total time spent.
+2. Columns: equality / range predicates, join keys and ORDER BY / GROUP BY
+   columns per table, with table aliases resolved. Predicates wrapped in
+   functions (DATE(created_at)) or leading-wildcard LIKEs cannot use an index
+   and are skipped.
+3. Candidates: per table, equality columns first, then one range column, then
+   ordering columns (max 3), plus single-column join keys. Candidates already
+   served by a leftmost prefix of an index in information_schema.statistics
+   are dropped.
+4. Benefit: EXPLAIN of the heaviest query per candidate gives the access type,
+   rows examined and `filtered`; a full or index scan that keeps only
+   `filtered`% of its rows saves roughly (1 - filtered) of that table's share
+   of the query time.
+
+Usage:
+    python index_advisor.py --learning-data learning.db --top 10
+    python index_advisor.py --no-explain -o index_advice.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from learning_store import LEARNING_CONFIG, SQLiteLearningStore
+from sql_fingerprint import fingerprint_id, fingerprint_sql, strip_comments_and_strings
+
+# Most recent interactions read from the learning store
+WORKLOAD_LIMIT = 100000
+
+# ---------------------------------------------------------------------------
+# Column extraction
+# ---------------------------------------------------------------------------
+
+_IDENT = r"`?([A-Za-z_][\w$]*)`?"
+_TABLE_REF_RE = re.compile(
+    r"\b(?:from|join)\s+" + _IDENT + r"(?:\s*\.\s*" + _IDENT + r")?(?:\s+(?:as\s+)?" + _IDENT + r")?",
+    re.IGNORECASE,
+)
+_NOT_ALIAS = frozenset((
+    "where", "on", "using", "join", "inner", "left", "right", "outer", "cross", "natural", "straight_join",
+    "group", "order", "limit", "having", "union", "window", "for", "lock", "into", "set", "select",
+))
+_CLAUSE_RE = re.compile(r"\b(where|on|group\s+by|order\s+by|having|limit|union|join|inner|left|right|cross|from|select)\b", re.IGNORECASE)
+_COL = r"(?:`?([A-Za-z_]\w*)`?\s*\.\s*)?`?([A-Za-z_]\w*)`?"
+_EQ_RE = re.compile(_COL + r"\s*(?:=|<=>|\bin\s*\(|\bis\s+(?:not\s+)?null\b)", re.IGNORECASE)
+# LIKE 'abc%' is a range scan; LIKE '%abc' cannot use an index (rewritten to LIKE %? first)
+_RANGE_RE = re.compile(_COL + r"\s*(?:<=|>=|<|>|\bbetween\b|\blike\s+')", re.IGNORECASE)
+_WILDCARD_LIKE_RE = re.compile(r"\blike\s+'[%_](?:[^'\\]|\\.|'')*'", re.IGNORECASE)
+_JOIN_EQ_RE = re.compile(_COL + r"\s*=\s*" + _COL, re.IGNORECASE)
+_ORDER_COL_RE = re.compile(r"^\s*" + _COL + r"\s*(?:asc|desc)?\s*$", re.IGNORECASE)
+_SQL_WORDS = frozenset((
+    "and", "or", "not", "null", "is", "in", "like", "between", "exists", "case", "when", "then", "else", "end",
+    "true", "false", "interval", "day", "month", "year", "now", "curdate", "select", "distinct", "as",
+))
+
+
+def _strip_subqueries(sql: str) -> str:
+    """Remove parenthesized sub-expressions, keeping IN (...) markers for predicate detection."""
+    flat = sql
+    while True:
+        inner = re.sub(r"(?<!\bin)(?<!\bIN)\s*\([^()]*\)", " ()", flat)
+        inner = re.sub(r"\b(in|IN)\s*\([^()]*\)", r"\1 (?)", inner)
+        if inner == flat:
+            return flat
+        flat = inner
+
+
+def _clauses(sql: str) -> Dict[str, List[str]]:
+    """Split a flattened query into its top-level clause bodies by keyword."""
+    parts: Dict[str, List[str]] = defaultdict(list)
+    matches = list(_CLAUSE_RE.finditer(sql))
+    for i, m in enumerate(matches):
+        key = re.sub(r"\s+", " ", m.group(1).lower())
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(sql)
+        parts[key].append(sql[m.end():end])
+    return parts
+
+
+class QueryColumns:
+    """Index-relevant columns of one query, keyed by real table name."""
+
+    def __init__(self) -> None:
+        self.equality: Dict[str, List[str]] = defaultdict(list)
+        self.range: Dict[str, List[str]] = defaultdict(list)
+        self.join: Dict[str, List[str]] = defaultdict(list)
+        self.order: Dict[str, List[str]] = defaultdict(list)
+
+    @staticmethod
+    def _add(bucket: Dict[str, List[str]], table: str, column: str) -> None:
+        if column not in bucket[table]:
+            bucket[table].append(column)
+
+    def tables(self) -> Set[str]:
+        return set(self.equality) | set(self.range) | set(self.join) | set(self.order)
+
+
+def extract_columns(sql: str, table_columns: Optional[Dict[str, Set[str]]] = None) -> QueryColumns:
+    """Find predicate, join and ordering columns of the outer query.
+
+    `table_columns` (table -> column names) resolves unqualified columns when
+    more than one table is referenced; without it they are only attributed in
+    single-table queries.
+    """
+    # Classify LIKE patterns before their literals become '?'
+    text = _WILDCARD_LIKE_RE.sub("like %?", sql or "")
+    text = strip_comments_and_strings(text, "'?'")
+    flat = _strip_subqueries(text)
+
+    aliases: Dict[str, str] = {}
+    for m in _TABLE_REF_RE.finditer(flat):
+        table = m.group(2) or m.group(1)  # schema.table -> table
+        alias = m.group(3)
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in _NOT_ALIAS:
+            aliases[alias.lower()] = table
+    tables = sorted(set(aliases.values()))
+
+    def resolve(qualifier: Optional[str], column: str) -> Optional[str]:
+        if column.lower() in _SQL_WORDS:
+            return None
+        if qualifier:
+            return aliases.get(qualifier.lower())
+        if len(tables) == 1:
+            return tables[0]
+        if table_columns:
+            owners = [t for t in tables if column in table_columns.get(t, ())]
+            if len(owners) == 1:
+                return owners[0]
+        return None
+
+    found = QueryColumns()
+    clauses = _clauses(flat)
+
+    for body in clauses.get("where", []) + clauses.get("on", []) + clauses.get("having", []):
+        # Column-to-column equality is a join key for both sides
+        for m in _JOIN_EQ_RE.finditer(body):
+            left, right = resolve(m.group(1), m.group(2)), resolve(m.group(3), m.group(4))
+            if left and right and left != right:
+                found._add(found.join, left, m.group(2))
+                found._add(found.join, right, m.group(4))
+        body_wo_joins = _JOIN_EQ_RE.sub(" ", body)
+        for m in _EQ_RE.finditer(body_wo_joins):
+            table = resolve(m.group(1), m.group(2))
+            if table and not _wrapped_in_function(body_wo_joins, m.start()):
+                found._add(found.equality, table, m.group(2))
+        for m in _RANGE_RE.finditer(body_wo_joins):
+            table = resolve(m.group(1), m.group(2))
+            if table and not _wrapped_in_function(body_wo_joins, m.start()):
+                found._add(found.range, table, m.group(2))
+
+    for key in ("order by", "group by"):
+        for body in clauses.get(key, []):
+            for item in body.split(","):
+                m = _ORDER_COL_RE.match(item)
+                if m:
+                    table = resolve(m.group(1), m.group(2))
+                    if table:
+                        found._add(found.order, table, m.group(2))
+    return found
+
+
+def _wrapped_in_function(body: str, pos: int) -> bool:
+    """True if the column at `pos` is an argument, e.g. DATE(created_at) = ?"""
+    return re.search(r"\w\s*\(\s*$", body[:pos]) is not None
+
+
+# ---------------------------------------------------------------------------
+# Workload and candidates
+# ---------------------------------------------------------------------------
+
+def collect_workload(entries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group successful SELECTs by fingerprint; heaviest (count x mean latency) first."""
+    groups: Dict[str, Dict[str, Any]] = {}
+    seen: Set[Tuple[Any, str]] = set()
+    for e in entries:
+        sql = (e.get("sql") or "").strip()
+        if not sql or e.get("success") is False or not sql.lower().startswith(("select", "with")):
+            continue
+        key = (e.get("timestamp"), sql)
+        if key in seen:
+            continue  # the same interaction is recorded in both lists
+        seen.add(key)
+        fp = fingerprint_sql(sql)
+        g = groups.setdefault(fp, {"fingerprint": fp, "id": fingerprint_id(sql), "sample_sql": sql,
+                                   "count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        seconds = float(e.get("execution_time") or 0.0)
+        g["count"] += 1
+        g["total_seconds"] += seconds
+        if seconds >= g["max_seconds"]:
+            g["max_seconds"], g["sample_sql"] = seconds, sql
+    for g in groups.values():
+        g["mean_seconds"] = g["total_seconds"] / g["count"]
+        # Queries without timings still count by frequency
+        g["weight"] = g["total_seconds"] if g["total_seconds"] > 0 else g["count"] * 1e-3
+    return sorted(groups.values(), key=lambda g: -g["weight"])
+
+
+def workload_from_learning(learning: Any) -> List[Dict[str, Any]]:
+    """Workload from a LearningManager, its SQLite store path or a learning_data.json path."""
+    if isinstance(learning, str) and not learning.endswith(".json"):
+        # Interactions already include the successful ones
+        data = SQLiteLearningStore(learning).load(max_metrics=WORKLOAD_LIMIT, max_successes=0)
+        metrics, successes = data["performance_metrics"], []
+    elif isinstance(learning, str):
+        with open(learning, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        metrics, successes = data.get("performance_metrics", []), data.get("successful_queries", [])
+    else:
+        metrics, successes = learning.performance_metrics, learning.successful_queries
+    return collect_workload(list(metrics) + list(successes))
+
+
+def candidate_indexes(cols: QueryColumns, max_columns: int = 3) -> List[Tuple[str, Tuple[str, ...], str]]:
+    """(table, columns, reason) candidates for one query."""
+    out = []
+    for table in sorted(cols.tables()):
+        composite = list(cols.equality.get(table, []))
+        reasons = ["where"] if composite else []
+        ranges = [c for c in cols.range.get(table, []) if c not in composite]
+        if ranges:
+            composite.append(ranges[0])
+            reasons.append("range")
+        elif cols.order.get(table):
+            # Ordering only helps after equality columns, never after a range column
+            composite.extend(c for c in cols.order[table] if c not in composite)
+            reasons.append("order by")
+        if composite:
+            out.append((table, tuple(composite[:max_columns]), "+".join(reasons)))
+        for col in cols.join.get(table, []):
+            out.append((table, (col,), "join"))
+    return out
+
+
+def load_existing_indexes(execute: Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]) -> Dict[str, List[Tuple[str, ...]]]:
+    """table -> list of index column tuples, from information_schema.statistics."""
+    _, rows = execute(
+        "SELECT table_name, index_name, seq_in_index, column_name FROM information_schema.statistics"
+        " WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"
+    )
+    indexes: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for table, index, _, column in rows:
+        indexes[(str(table), str(index))].append(str(column))
+    out: Dict[str, List[Tuple[str, ...]]] = defaultdict(list)
+    for (table, _), columns in indexes.items():
+        out[table].append(tuple(columns))
+    return out
+
+
+def load_table_columns(execute: Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]) -> Dict[str, Set[str]]:
+    _, rows = execute(
+        "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = DATABASE()"
+    )
+    out: Dict[str, Set[str]] = defaultdict(set)
+    for table, column in rows:
+        out[str(table)].add(str(column))
+    return out
+
+
+def is_covered(columns: Tuple[str, ...], existing: List[Tuple[str, ...]]) -> bool:
+    """An index serves the candidate if the candidate is its leftmost prefix."""
+    wanted = tuple(c.lower() for c in columns)
+    return any(tuple(c.lower() for c in idx[:len(wanted)]) == wanted for idx in existing)
+
+
+def explain_benefit(execute: Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]],
+                    sql: str, table: str, weight: float) -> Optional[Dict[str, Any]]:
+    """Estimate time saved on `table` for one query from its EXPLAIN plan."""
+    columns, rows = execute("EXPLAIN " + sql)
+    plan = [dict(zip([c.lower() for c in columns], r)) for r in rows]
+    total_rows = sum(float(p.get("rows") or 0) for p in plan) or 1.0
+    for p in plan:
+        if str(p.get("table")) != table:
+            continue
+        examined = float(p.get("rows") or 0)
+        filtered = (100.0 if p.get("filtered") is None else float(p["filtered"])) / 100.0
+        scan = str(p.get("type") or "").upper() in ("ALL", "INDEX")
+        saved_fraction = (1.0 - filtered) * (examined / total_rows) if scan else 0.0
+        return {
+            "access_type": p.get("type"),
+            "rows_examined": int(examined),
+            "filtered_pct": round(filtered * 100, 1),
+            "estimated_saved_seconds": round(weight * saved_fraction, 4),
+        }
+    return None
+
+
+def recommend(workload: List[Dict[str, Any]],
+              execute: Optional[Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]] = None,
+              top: int = 10, use_explain: bool = True) -> List[Dict[str, Any]]:
+    """Ranked CREATE INDEX recommendations for a workload (see collect_workload)."""
+    existing = load_existing_indexes(execute) if execute else {}
+    table_columns = load_table_columns(execute) if execute else None
+
+    merged: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    for query in workload:
+        for table, columns, reason in candidate_indexes(extract_columns(query["sample_sql"], table_columns)):
+            if table_columns is not None and table not in table_columns:
+                continue  # derived table or CTE name
+            if is_covered(columns, existing.get(table, [])):
+                continue
+            rec = merged.setdefault((table, columns), {
+                "table": table, "columns": list(columns), "reasons": set(),
+                "queries": 0, "executions": 0, "weight_seconds": 0.0, "top_query": query,
+            })
+            rec["reasons"].add(reason)
+            rec["queries"] += 1
+            rec["executions"] += query["count"]
+            rec["weight_seconds"] += query["weight"]
+            if query["weight"] > rec["top_query"]["weight"]:
+                rec["top_query"] = query
+
+    # A candidate that is a prefix of a longer one is served by it
+    for (table, columns), rec in list(merged.items()):
+        for (t2, c2), other in merged.items():
+            if t2 == table and len(c2) > len(columns) and tuple(c2[:len(columns)]) == columns:
+                other["weight_seconds"] += rec["weight_seconds"]
+                other["executions"] += rec["executions"]
+                other["reasons"] |= rec["reasons"]
+                merged.pop((table, columns), None)
+                break
+
+    out = []
+    for rec in merged.values():
+        name = "idx_" + "_".join([rec["table"]] + rec["columns"])[:60]
+        item = {
+            "table": rec["table"],
+            "columns": rec["columns"],
+            "ddl": f"CREATE INDEX {name} ON {rec['table']} ({', '.join(rec['columns'])});",
+            "reasons": sorted(rec["reasons"]),
+            "queries": rec["queries"],
+            "executions": rec["executions"],
+            "weight_seconds": round(rec["weight_seconds"], 4),
+            "example_sql": rec["top_query"]["sample_sql"],
+            "score": rec["weight_seconds"],
+        }
+        if execute and use_explain:
+            try:
+                plan = explain_benefit(execute, rec["top_query"]["sample_sql"], rec["table"], rec["weight_seconds"])
+            except Exception as e:
+                plan = {"explain_error": str(e)}
+            if plan:
+                item["explain"] = plan
+                if "estimated_saved_seconds" in plan:
+                    item["score"] = plan["estimated_saved_seconds"]
+        out.append(item)
+    out.sort(key=lambda r: (-r["score"], -r["weight_seconds"]))
+    return out[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recommend indexes from the assistant's learned queries")
+    parser.add_argument("--learning-data", default=LEARNING_CONFIG["db_path"],
+                        help="LearningManager store (learning.db) or learning_data.json")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--no-explain", action="store_true", help="Rank by workload weight only (no EXPLAIN)")
+    parser.add_argument("--offline", action="store_true", help="Do not connect to MySQL (no index or EXPLAIN checks)")
+    parser.add_argument("-o", "--output", help="Write the recommendations as JSON")
+    args = parser.parse_args()
+
+    workload = workload_from_learning(args.learning_data)
+    print(f"📊 {sum(q['count'] for q in workload)} executions, {len(workload)} distinct query fingerprints")
+
+    execute = None
+    conn = None
+    if not args.offline:
+        import mysql.connector
+
+        conn = mysql.connector.connect(
+            host=os.getenv("DB_HOST", "43.225.53.118"),
+            user=os.getenv("DB_USER", "staging_sony_centeral"),
+            password=os.getenv("DB_PASSWORD", "sony_centeralsony_centeral"),
+            database=os.getenv("DB_NAME", "staging_central_hub"),
+            ssl_disabled=True,
+        )
+
+        def execute(sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+            columns = [d[0] for d in cursor.description or []]
+            cursor.close()
+            return columns, rows
+
+    recommendations = recommend(workload, execute, top=args.top, use_explain=not args.no_explain)
+    if conn is not None:
+        conn.close()
+
+    if not recommendations:
+        print("✅ No missing indexes found for the recorded workload")
+    for i, rec in enumerate(recommendations, 1):
+        plan = rec.get("explain", {})
+        detail = (f" | {plan.get('access_type')} scan of {plan.get('rows_examined')} rows,"
+                  f" keeps {plan.get('filtered_pct')}% → saves ~{plan.get('estimated_saved_seconds')}s"
+                  if "rows_examined" in plan else "")
+        print(f"{i:>2}. {rec['ddl']}\n    {rec['executions']} runs, {rec['weight_seconds']}s total, {'/'.join(rec['reasons'])}{detail}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(recommendations, f, indent=2, default=str)
+        print(f"💾 Recommendations written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
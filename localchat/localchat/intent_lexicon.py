@@ -0,0 +1,136 @@
+"""
+Intent Lexicon
+
+One precompiled multi-phrase matcher that classifies a question in a single
+pass and returns every intent flag at once. It replaces the phrase lists that
+were re-declared and scanned with `any(phrase in q ...)` in the assistant and
+in LearningManager.
+
+Matching is word-boundary correct: phrases are compiled into a token trie, so
+"count" no longer fires on "country" and "it" no longer fires on "with".
+"""
+
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+
+# flag -> phrases. Flags prefixed with "intent:" are LearningManager intents.
+LEXICON: Dict[str, Tuple[str, ...]] = {
+    # Display preferences / follow-ups
+    "full_detail": (
+        "full list", "complete list", "all details", "show all", "entire list",
+        "full details", "complete details", "all data", "everything", "full data",
+        "complete data", "entire data", "all records", "full records", "complete records",
+        "no limit", "unlimited", "all rows", "full rows", "complete rows",
+    ),
+    "full_word": ("full", "complete", "all", "entire", "everything"),
+    "limit": ("limit", "first", "top", "few", "some"),
+    "recency": ("last", "recent"),
+    "continuation": (
+        "more", "next", "continue", "rest", "remaining", "additional",
+        "50 more", "20 more", "10 more", "5 more", "100 more",
+        "show more", "get more", "give me more",
+    ),
+    # Vagueness detection
+    "intent_cue": ("how many", "count", "list", "show", "get", "find", "give", "top", "recent", "latest"),
+    "vague_ref": (
+        "this", "that", "those", "these", "it", "them",
+        "more", "next", "continue", "rest", "remaining",
+        "others", "like before", "same as before",
+    ),
+    "domain": (
+        "orders", "order", "products", "product", "customers", "customer",
+        "stores", "store", "variants", "variant", "sales", "sold", "tv", "tvs",
+        "television", "televisions", "sku", "skus", "items", "item",
+    ),
+    "time_based": ("recent", "latest", "today", "yesterday"),
+    # LearningManager intents (checked in LEARNING_INTENTS order)
+    "intent:count": ("how many", "count", "number of", "total"),
+    "intent:list": ("show", "list", "get", "find", "display"),
+    "intent:filter": ("where", "from", "with", "having", "filter"),
+    "intent:aggregate": ("sum", "average", "avg", "max", "min", "group by"),
+    "intent:join": ("with", "and", "including", "together"),
+    "intent:time_series": ("daily", "monthly", "weekly", "yearly", "trend", "over time"),
+    "intent:comparison": ("compare", "vs", "versus", "difference", "better", "worse"),
+    "intent:top": ("top", "best", "highest", "most", "first"),
+    "intent:recent": ("recent", "latest", "new", "last"),
+}
+
+LEARNING_INTENTS: Tuple[str, ...] = (
+    "count", "list", "filter", "aggregate", "join", "time_series", "comparison", "top", "recent",
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+class QuestionIntents:
+    """All flags matched in one question, plus the phrases that triggered them."""
+
+    __slots__ = ("flags", "phrases", "word_count")
+
+    def __init__(self, flags: FrozenSet[str], phrases: Tuple[str, ...], word_count: int) -> None:
+        self.flags = flags
+        self.phrases = phrases
+        self.word_count = word_count
+
+    def __contains__(self, flag: str) -> bool:
+        return flag in self.flags
+
+    def primary_intent(self) -> str:
+        """First LearningManager intent that matched, or 'general'."""
+        for intent in LEARNING_INTENTS:
+            if "intent:" + intent in self.flags:
+                return intent
+        return "general"
+
+    def __repr__(self) -> str:
+        return f"QuestionIntents({sorted(self.flags)})"
+
+
+class IntentMatcher:
+    """Token-trie matcher: every phrase is found in O(tokens x longest phrase)."""
+
+    def __init__(self, lexicon: Dict[str, Iterable[str]]) -> None:
+        self._root: Dict[str, tuple] = {}
+        for flag, phrases in lexicon.items():
+            for phrase in phrases:
+                tokens = _TOKEN_RE.findall(phrase.lower())
+                if not tokens:
+                    continue
+                node = self._root
+                for i, tok in enumerate(tokens):
+                    if tok not in node:
+                        node[tok] = ({}, set())
+                    children, flags = node[tok]
+                    if i == len(tokens) - 1:
+                        flags.add((flag, phrase))
+                    node = children
+
+    def classify(self, text: str) -> QuestionIntents:
+        tokens = _TOKEN_RE.findall((text or "").lower())
+        flags: set = set()
+        phrases: List[str] = []
+        for start in range(len(tokens)):
+            node = self._root
+            for tok in tokens[start:]:
+                entry = node.get(tok)
+                if entry is None:
+                    break
+                children, hits = entry
+                for flag, phrase in hits:
+                    flags.add(flag)
+                    phrases.append(phrase)
+                node = children
+        return QuestionIntents(frozenset(flags), tuple(phrases), len((text or "").split()))
+
+
+_MATCHER = IntentMatcher(LEXICON)
+
+
+@lru_cache(maxsize=2048)
+def classify(question: str) -> QuestionIntents:
+    """Classify a question once; repeated calls for the same text are served from cache."""
+    return _MATCHER.classify(question)
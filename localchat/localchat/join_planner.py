@@ -0,0 +1,218 @@
+"""
+Join Planner
+
+Finds the join path between the tables a question mentions and spells it out
+as exact JOIN ... ON clauses, so the LLM does not have to guess relationships
+(and get order_customer or product_variants wrong).
+
+- Graph: CatalogIndex.join_graph (declared foreign keys plus `<x>_id` columns
+  matching another table's key).
+- Weights: declared edges cost 1.0, inferred ones 1.25; table pairs that
+  LearningManager.schema_insights saw succeed get cheaper, failing ones dearer.
+- Paths never go up to a parent and back down to another child (customers ->
+  stores -> orders), which would multiply rows instead of relating them.
+- Several tables are connected greedily: each next table is attached to the
+  tree built so far by its cheapest path.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from schema_catalog import CatalogIndex
+
+DECLARED_WEIGHT = 1.0
+INFERRED_WEIGHT = 1.25
+MAX_HOPS = 4
+
+# Words that name a table without containing its name
+TABLE_SYNONYMS = {
+    "product_variants": ("variant", "variants", "sku", "skus"),
+    "order_items": ("line item", "line items", "items sold", "order item", "order items"),
+    "order_transaction": ("transaction", "transactions", "payment", "payments", "gateway"),
+    "order_shipping": ("shipping", "shipping address", "tracking"),
+    "order_fulfillments": ("fulfillment", "fulfillments", "fulfilled", "shipment", "shipments"),
+    "order_returns": ("return", "returns", "returned", "refund", "refunds"),
+    "order_billing": ("billing",),
+    "sku_mapping": ("sku mapping", "sku code", "sku codes"),
+    "customers": ("customer", "client", "clients", "buyer", "buyers"),
+    "stores": ("store", "shop", "shops"),
+}
+# Never suggested as join targets
+EXCLUDED_TABLES = frozenset(("admin", "chat_messages", "rollup_state"))
+
+Edge = Tuple[str, str, str, str]  # (table, column, other table, other column)
+
+
+def _pair_key(a: str, b: str) -> Tuple[str, str]:
+    return tuple(sorted((a, b)))  # type: ignore[return-value]
+
+
+def _insight_rates(insights: Optional[Dict[Any, Dict[str, Any]]]) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    """(table, table) -> (success_rate, usage_count); keys may be tuples or their JSON string form"""
+    rates = {}
+    for key, stats in (insights or {}).items():
+        names = list(key) if isinstance(key, (tuple, list)) else re.findall(r"\w+", str(key))
+        if len(names) != 2 or not isinstance(stats, dict):
+            continue
+        rates[_pair_key(names[0], names[1])] = (float(stats.get("success_rate", 0) or 0), int(stats.get("usage_count", 0) or 0))
+    return rates
+
+
+def _alias(table: str, taken: set) -> str:
+    base = "".join(word[0] for word in table.split("_") if word) or table[:1]
+    alias, n = base, 2
+    while alias in taken:
+        alias, n = f"{base}{n}", n + 1
+    taken.add(alias)
+    return alias
+
+
+class JoinPlanner:
+    """Shortest join paths over one CatalogIndex"""
+
+    def __init__(self, index: CatalogIndex, insights: Optional[Dict[Any, Dict[str, Any]]] = None) -> None:
+        self.index = index
+        self.insights = insights
+        self._table_words = self._build_table_words()
+
+    def _build_table_words(self) -> List[Tuple[str, str]]:
+        """(phrase, table) pairs, longest phrase first"""
+        words = []
+        for table in self.index.columns:
+            if table in EXCLUDED_TABLES:
+                continue
+            phrase = table.replace("_", " ")
+            words.append((phrase, table))
+            if phrase.endswith("s"):
+                words.append((phrase[:-1], table))
+            for synonym in TABLE_SYNONYMS.get(table, ()):
+                words.append((synonym, table))
+        return sorted(words, key=lambda w: -len(w[0]))
+
+    def tables_for_question(self, question: str) -> List[str]:
+        """Catalog tables named in a question, in order of first mention"""
+        text = " " + re.sub(r"[^a-z0-9_ ]+", " ", (question or "").lower()) + " "
+        found: Dict[str, int] = {}
+        for phrase, table in self._table_words:
+            m = re.search(r"(?<![a-z0-9_])" + re.escape(phrase) + r"(?![a-z0-9_])", text)
+            if m:
+                found.setdefault(table, m.start())
+                text = text[:m.start()] + " " * len(phrase) + text[m.end():]  # "order items" is not also "orders"
+        return sorted(found, key=found.get)
+
+    # -- graph -------------------------------------------------------------
+
+    def _is_key(self, table: str, column: str) -> bool:
+        column = column.lower()
+        keys = [self.index.primary_keys.get(table, ())] + list(self.index.unique_keys.get(table, []))
+        return any(len(k) == 1 and k[0].lower() == column for k in keys)
+
+    def _edges(self) -> Dict[str, List[Tuple[float, bool, Edge]]]:
+        """table -> [(weight, goes_up, edge)]; up means many-to-one (or one-to-one)"""
+        rates = _insight_rates(self.insights)
+        out: Dict[str, List[Tuple[float, bool, Edge]]] = {}
+        for table, edges in self.index.join_graph.items():
+            if table in EXCLUDED_TABLES:
+                continue
+            for column, other, other_column, declared in edges:
+                if other in EXCLUDED_TABLES:
+                    continue
+                weight = DECLARED_WEIGHT if declared else INFERRED_WEIGHT
+                rate = rates.get(_pair_key(table, other))
+                if rate:
+                    confidence = min(rate[1], 10) / 10.0
+                    weight *= 1.0 + confidence * (0.5 - rate[0])
+                out.setdefault(table, []).append((weight, self._is_key(other, other_column), (table, column, other, other_column)))
+        return out
+
+    def _cheapest_path(self, edges: Dict[str, List[Tuple[float, bool, Edge]]],
+                       sources: Dict[str, bool], target: str) -> Optional[Tuple[float, List[Edge]]]:
+        """Dijkstra from any source; states remember whether the last step went up,
+        because going down right after going up would fan out.
+
+        `sources` maps each table already joined to how it was reached (True: went up).
+        """
+        heap: List[Tuple[float, int, str, bool, Tuple[Edge, ...]]] = []
+        counter = 0
+        for source, went_up in sources.items():
+            heap.append((0.0, counter, source, went_up, ()))
+            counter += 1
+        heapq.heapify(heap)
+        settled = set()
+        while heap:
+            cost, _, table, went_up, path = heapq.heappop(heap)
+            if table == target:
+                return cost, list(path)
+            if (table, went_up) in settled or len(path) >= MAX_HOPS:
+                continue
+            settled.add((table, went_up))
+            for weight, goes_up, edge in edges.get(table, []):
+                if went_up and not goes_up:
+                    continue
+                if (edge[2], goes_up) in settled:
+                    continue
+                counter += 1
+                heapq.heappush(heap, (cost + weight, counter, edge[2], goes_up, path + (edge,)))
+        return None
+
+    def plan(self, tables: Sequence[str]) -> Optional[List[Edge]]:
+        """Join edges connecting all `tables` (first one is the root), or None if they cannot be connected"""
+        tables = [t for t in dict.fromkeys(tables) if t in self.index.columns]
+        if len(tables) < 2:
+            return None
+        edges = self._edges()
+        tree = {tables[0]: False}  # joined table -> reached by going up
+        joins: List[Edge] = []
+        remaining = tables[1:]
+        while remaining:
+            best = None
+            for target in remaining:
+                found = self._cheapest_path(edges, tree, target)
+                if found and (best is None or found[0] < best[1][0]):
+                    best = (target, found)
+            if best is None:
+                return None
+            target, (_, path) = best
+            for edge in path:
+                if edge[2] not in tree:
+                    tree[edge[2]] = self._is_key(edge[2], edge[3])
+                    joins.append(edge)
+            remaining = [t for t in remaining if t not in tree]
+        return joins
+
+    def join_clauses(self, tables: Sequence[str]) -> Optional[str]:
+        """FROM/JOIN clauses for the tables, with aliases"""
+        tables = [t for t in dict.fromkeys(tables) if t in self.index.columns]
+        joins = self.plan(tables)
+        if not joins:
+            return None
+        taken: set = set()
+        aliases = {tables[0]: _alias(tables[0], taken)}
+        lines = [f"FROM {tables[0]} {aliases[tables[0]]}"]
+        for table, column, other, other_column in joins:
+            aliases[other] = _alias(other, taken)
+            lines.append(f"JOIN {other} {aliases[other]} ON {aliases[other]}.{other_column} = {aliases[table]}.{column}")
+        return "\n".join(lines)
+
+    def relationships(self) -> List[str]:
+        """'child.column → parent.column' lines for every many-to-one edge, for the schema prompt"""
+        lines = []
+        for table, edges in sorted(self._edges().items()):
+            for _, goes_up, (_, column, other, other_column) in edges:
+                if goes_up:
+                    lines.append(f"- {table}.{column} → {other}.{other_column}")
+        return lines
+
+    def hint_for_question(self, question: str) -> str:
+        """Prompt text with the exact joins for the tables a question mentions ('' if none needed)"""
+        tables = self.tables_for_question(question)
+        clauses = self.join_clauses(tables) if len(tables) > 1 else None
+        if not clauses:
+            return ""
+        return (
+            "JOIN PATH (verified against the schema; use these joins, add filters/grouping as needed):\n"
+            f"{clauses}\n\n"
+        )
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Latency Stats
+
+Rolling latency analytics over the interactions LearningManager records.
+
+- MetricsRing: the most recent interactions in fixed-size arrays (timestamp,
+  seconds, rows, success) plus one tuple of interned strings per slot; the
+  oldest slot is overwritten, nothing is ever truncated or copied.
+- P2Quantile: streaming estimate of one quantile in constant memory (the P²
+  algorithm of Jain and Chlamtac). LatencyTracker keeps p50 / p95 / p99 per
+  intent and per query pattern since startup.
+- Reports: the slowest question patterns and SQL fingerprints (literals
+  replaced by '?', see sql_fingerprint) over sliding windows, with exact
+  percentiles computed from the ring.
+
+Usage:
+    python latency_stats.py --learning-data learning.db
+    python latency_stats.py --by fingerprint --windows 3600,86400 -o latency.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from learning_store import LEARNING_CONFIG, SQLiteLearningStore
+from sql_fingerprint import fingerprint_sql
+
+LATENCY_CONFIG = {
+    # Sliding windows reported by default, in seconds
+    "windows": [int(w) for w in os.getenv("LATENCY_WINDOWS", "300,3600,86400").split(",") if w.strip()],
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+GROUP_KINDS = ("intent", "pattern", "fingerprint")
+
+
+def _window_label(seconds: int) -> str:
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, min(len(ordered) - 1, int(round(p * (len(ordered) - 1)))))]
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile with five markers (P² algorithm)"""
+
+    __slots__ = ("p", "count", "_heights", "_positions", "_desired", "_increments")
+
+    def __init__(self, p: float) -> None:
+        self.p = p
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self._increments = (0.0, p / 2, p, (1 + p) / 2, 1.0)
+
+    def add(self, x: float) -> None:
+        self.count += 1
+        q = self._heights
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        n = self._positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        # Move the three middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def value(self) -> float:
+        if self.count >= 5:
+            return self._heights[2]
+        # Too few samples for the markers; the exact answer is cheap
+        return _percentile(self._heights, self.p)
+
+
+class LatencyDigest:
+    """Count, mean, max and streaming p50 / p95 / p99 of one series"""
+
+    __slots__ = ("count", "failures", "total", "max", "_quantiles")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._quantiles = [P2Quantile(p) for p in QUANTILES]
+
+    def add(self, seconds: float, success: bool = True) -> None:
+        self.count += 1
+        self.failures += 0 if success else 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for quantile in self._quantiles:
+            quantile.add(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        result = {
+            "count": self.count,
+            "success_rate": round(1 - self.failures / self.count, 3) if self.count else 0.0,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 2),
+        }
+        for quantile in self._quantiles:
+            result[f"p{int(quantile.p * 100)}_ms"] = round(quantile.value() * 1000, 2)
+        return result
+
+
+class MetricsRing:
+    """Fixed-capacity, array-backed buffer of the most recent interactions"""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self._ts = array("d", bytes(8 * self.capacity))
+        self._seconds = array("d", bytes(8 * self.capacity))
+        self._rows = array("q", bytes(8 * self.capacity))
+        self._ok = array("b", bytes(self.capacity))
+        # (intent, pattern, fingerprint, question, sql) per slot
+        self._text: List[Optional[Tuple[str, str, str, str, str]]] = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, seconds: float, rows: int, success: bool,
+               text: Tuple[str, str, str, str, str]) -> None:
+        slot = self._next
+        self._ts[slot] = timestamp
+        self._seconds[slot] = seconds
+        self._rows[slot] = rows
+        self._ok[slot] = 1 if success else 0
+        self._text[slot] = text
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def newest_first(self) -> Iterator[int]:
+        """Slot numbers from the newest interaction back to the oldest"""
+        for offset in range(1, self._size + 1):
+            yield (self._next - offset) % self.capacity
+
+
+class LatencyTracker:
+    """Ring of recent interactions plus streaming percentiles per intent and pattern"""
+
+    def __init__(self, capacity: Optional[int] = None) -> None:
+        # Same history length LearningManager loads (LEARNING_MAX_METRICS)
+        self.ring = MetricsRing(capacity or LEARNING_CONFIG["max_metrics"])
+        self.overall = LatencyDigest()
+        self._digests: Dict[Tuple[str, str], LatencyDigest] = {}
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, success: bool, intent: str, pattern: str, sql: str,
+            question: str = "", result_count: int = 0, timestamp: Optional[float] = None) -> None:
+        seconds = float(seconds or 0.0)
+        intent, pattern = sys.intern(intent or "general"), sys.intern(pattern or "")
+        fingerprint = sys.intern(fingerprint_sql(sql))
+        with self._lock:
+            self.ring.append(timestamp or time.time(), seconds, int(result_count or 0), success,
+                             (intent, pattern, fingerprint, question, sql))
+            self.overall.add(seconds, success)
+            for key in (("intent", intent), ("pattern", pattern)):
+                digest = self._digests.get(key)
+                if digest is None:
+                    digest = self._digests[key] = LatencyDigest()
+                digest.add(seconds, success)
+
+    def add_many(self, metrics: Iterable[Dict[str, Any]]) -> None:
+        """Replay loaded performance_metrics dicts, oldest first"""
+        for m in metrics:
+            self.add(m.get("execution_time") or 0.0, bool(m.get("success")), m.get("intent") or "general",
+                     m.get("pattern") or "", m.get("sql") or "", m.get("question") or "",
+                     m.get("result_count") or 0, m.get("timestamp"))
+
+    def __len__(self) -> int:
+        return len(self.ring)
+
+    def records(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ring contents as performance_metrics dicts, oldest first"""
+        ring = self.ring
+        with self._lock:
+            slots = list(ring.newest_first())[:limit]
+            out = []
+            for slot in reversed(slots):
+                intent, pattern, _, question, sql = ring._text[slot]
+                out.append({
+                    "question": question,
+                    "sql": sql,
+                    "intent": intent,
+                    "pattern": pattern,
+                    "execution_time": ring._seconds[slot],
+                    "result_count": ring._rows[slot],
+                    "success": bool(ring._ok[slot]),
+                    "timestamp": ring._ts[slot],
+                })
+        return out
+
+    def success_rate(self, last: int = 50) -> float:
+        """Share of the `last` most recent interactions that succeeded"""
+        with self._lock:
+            slots = [slot for _, slot in zip(range(last), self.ring.newest_first())]
+            return sum(self.ring._ok[s] for s in slots) / len(slots) if slots else 0.0
+
+    def percentiles(self, kind: Optional[str] = None) -> Dict[str, Any]:
+        """Streaming summaries since startup: overall, or {key: summary} for "intent" / "pattern" """
+        with self._lock:
+            if kind is None:
+                return self.overall.summary()
+            return {key: digest.summary() for (k, key), digest in self._digests.items() if k == kind}
+
+    def slowest(self, window_seconds: float, by: str = "pattern", limit: int = 10,
+                min_count: int = 1, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Groups with the highest p95 over the last `window_seconds`, exact from the ring"""
+        if by not in GROUP_KINDS:
+            raise ValueError(f"by must be one of {GROUP_KINDS}")
+        column = GROUP_KINDS.index(by)
+        cutoff = (now or time.time()) - window_seconds
+        ring = self.ring
+        groups: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for slot in ring.newest_first():
+                if ring._ts[slot] < cutoff:
+                    break
+                text = ring._text[slot]
+                seconds = ring._seconds[slot]
+                group = groups.get(text[column])
+                if group is None:
+                    group = groups[text[column]] = {"seconds": [], "failures": 0, "slowest": -1.0, "sql": "", "question": ""}
+                group["seconds"].append(seconds)
+                group["failures"] += 0 if ring._ok[slot] else 1
+                if seconds > group["slowest"]:
+                    group["slowest"], group["sql"], group["question"] = seconds, text[4], text[3]
+        rows = []
+        for key, group in groups.items():
+            values = sorted(group["seconds"])
+            if len(values) < min_count:
+                continue
+            row = {by: key, "count": len(values), "success_rate": round(1 - group["failures"] / len(values), 3)}
+            for p in QUANTILES:
+                row[f"p{int(p * 100)}_ms"] = round(_percentile(values, p) * 1000, 2)
+            row["total_ms"] = round(sum(values) * 1000, 2)
+            row["slowest_question"] = group["question"]
+            row["slowest_sql"] = group["sql"]
+            rows.append(row)
+        rows.sort(key=lambda r: (-r["p95_ms"], -r["total_ms"]))
+        return rows[:limit]
+
+    def report(self, windows: Optional[Iterable[int]] = None, limit: int = 10,
+               now: Optional[float] = None) -> Dict[str, Any]:
+        """Slowest patterns and fingerprints per window, plus the streaming percentiles"""
+        now = now or time.time()
+        return {
+            "interactions": len(self),
+            "overall": self.percentiles(),
+            "by_intent": self.percentiles("intent"),
+            "windows": {
+                _window_label(w): {
+                    "slowest_patterns": self.slowest(w, "pattern", limit, now=now),
+                    "slowest_fingerprints": self.slowest(w, "fingerprint", limit, now=now),
+                }
+                for w in (windows or LATENCY_CONFIG["windows"])
+            },
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency percentiles and slowest queries from the learning store")
+    parser.add_argument("--learning-data", default=LEARNING_CONFIG["db_path"], help="LearningManager store (learning.db)")
+    parser.add_argument("--windows", help="Comma-separated window sizes in seconds (default: LATENCY_WINDOWS)")
+    parser.add_argument("--by", choices=["pattern", "fingerprint", "both"], default="both")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("-o", "--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    tracker = LatencyTracker()
+    data = SQLiteLearningStore(args.learning_data).load(max_metrics=tracker.ring.capacity, max_successes=0)
+    tracker.add_many(data.get("performance_metrics", []))
+    windows = [int(w) for w in args.windows.split(",")] if args.windows else None
+    report = tracker.report(windows, limit=args.top)
+
+    overall = report["overall"]
+    print(f"📊 {report['interactions']} interactions: p50 {overall['p50_ms']}ms, "
+          f"p95 {overall['p95_ms']}ms, p99 {overall['p99_ms']}ms")
+    for label, window in report["windows"].items():
+        for kind in ("patterns", "fingerprints"):
+            if args.by not in ("both", kind[:-1]):
+                continue
+            print(f"\n🐢 Slowest {kind} ({label}):")
+            for row in window[f"slowest_{kind}"]:
+                name = row.get("pattern", row.get("fingerprint")) or "(none)"
+                print(f"  p95 {row['p95_ms']:>9.1f}ms  p99 {row['p99_ms']:>9.1f}ms  x{row['count']:<5} {name[:100]}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
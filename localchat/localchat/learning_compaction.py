@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Learning Compaction
+
+Retention for what LearningManager learns, so that load time and lookup cost
+stay flat over months of traffic instead of growing with every new pattern.
+
+- Decay: a pattern, error or table pair scores count * 0.5 ** (age / half-life),
+  where age is the time since it was last used. Old counts fade and recent
+  ones win.
+- Eviction: anything scoring below `min_score` is dropped. Beyond the memory
+  budget (max patterns / errors / table pairs), the lowest scores go first.
+- Merging: SQL examples that differ only in literals share a fingerprint
+  (sql_fingerprint.fingerprint_sql). Only the most recent one of each is kept.
+- Disk: interactions older than `retention_days` are deleted. While the store
+  is above `max_db_mb`, the oldest interactions go. Freed pages are returned
+  to the file system with VACUUM.
+
+LearningManager compacts its in-memory state every `interval_seconds` and the
+store in the background; workers sharing one learning.db skip the store pass
+if another worker compacted it recently.
+
+Usage:
+    python learning_compaction.py --learning-data learning.db
+    python learning_compaction.py --force --max-db-mb 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+
+from learning_store import LEARNING_CONFIG, PATTERN_EXAMPLES, SQLiteLearningStore
+from sql_fingerprint import fingerprint_sql
+
+COMPACTION_CONFIG = {
+    "half_life_days": float(os.getenv("LEARNING_HALF_LIFE_DAYS", "30")),
+    "min_score": float(os.getenv("LEARNING_MIN_SCORE", "0.1")),
+    # Memory budgets: entries kept after compaction
+    "max_patterns": int(os.getenv("LEARNING_MAX_PATTERNS", "5000")),
+    "max_errors": int(os.getenv("LEARNING_MAX_ERRORS", "5000")),
+    "max_insights": int(os.getenv("LEARNING_MAX_INSIGHTS", "10000")),
+    "max_failed_sql": int(os.getenv("LEARNING_MAX_FAILED_SQL", "5")),
+    # Disk budget for learning.db
+    "retention_days": float(os.getenv("LEARNING_RETENTION_DAYS", "90")),
+    "max_db_mb": float(os.getenv("LEARNING_MAX_DB_MB", "256")),
+    # 0 disables periodic compaction
+    "interval_seconds": float(os.getenv("LEARNING_COMPACT_INTERVAL", "3600")),
+}
+
+
+class CompactionPolicy:
+    """Decay scoring, budgets and SQL merging shared by the in-memory and store passes"""
+
+    def __init__(self, **overrides: Any) -> None:
+        config = {**COMPACTION_CONFIG, **{k: v for k, v in overrides.items() if v is not None}}
+        self.half_life_seconds = config["half_life_days"] * 86400
+        self.min_score = config["min_score"]
+        self.max_patterns = config["max_patterns"]
+        self.max_errors = config["max_errors"]
+        self.max_insights = config["max_insights"]
+        self.max_failed_sql = config["max_failed_sql"]
+        self.max_examples = PATTERN_EXAMPLES
+        self.retention_seconds = config["retention_days"] * 86400
+        self.max_db_bytes = int(config["max_db_mb"] * 1024 * 1024)
+        self.interval_seconds = config["interval_seconds"]
+
+    def score(self, count: float, last_used: Optional[float], now: float) -> float:
+        """count halved for every half-life since last use"""
+        if self.half_life_seconds <= 0:
+            return float(count or 0)
+        age = max(0.0, now - (last_used or 0.0))
+        return (count or 0) * 0.5 ** (age / self.half_life_seconds)
+
+    def evictions(self, entries: Iterable[Tuple[Hashable, float, Optional[float]]], budget: int,
+                  now: float) -> List[Hashable]:
+        """Keys of (key, count, last_used) entries that score too low or fall outside the budget"""
+        scored = sorted(((self.score(count, last_used, now), key) for key, count, last_used in entries),
+                        key=lambda s: -s[0])
+        return [key for rank, (score, key) in enumerate(scored) if score < self.min_score or rank >= budget]
+
+    def merge_sql(self, sqls: List[str], keep: int) -> List[str]:
+        """Latest SQL per fingerprint, oldest first, at most `keep` of them (`sqls` is oldest first)"""
+        latest = {}
+        for sql in sqls:
+            fingerprint = fingerprint_sql(sql)
+            latest.pop(fingerprint, None)  # re-insert so dict order follows the latest use
+            latest[fingerprint] = sql
+        return list(latest.values())[-keep:] if keep > 0 else []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Decay, evict and shrink the LearningManager store")
+    parser.add_argument("--learning-data", default=LEARNING_CONFIG["db_path"], help="LearningManager store (learning.db)")
+    parser.add_argument("--half-life-days", type=float)
+    parser.add_argument("--retention-days", type=float)
+    parser.add_argument("--max-db-mb", type=float)
+    parser.add_argument("--force", action="store_true", help="Compact even if another worker did recently")
+    args = parser.parse_args()
+
+    policy = CompactionPolicy(half_life_days=args.half_life_days, retention_days=args.retention_days,
+                              max_db_mb=args.max_db_mb)
+    started = time.perf_counter()
+    stats = SQLiteLearningStore(args.learning_data).compact(policy, force=args.force)
+    print(json.dumps(stats, indent=2))
+    print(f"🧹 Compacted {args.learning_data} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Learning Index
+
+In-memory inverted indexes behind LearningManager's lookups, so that
+get_learned_examples, get_optimal_query_suggestions and
+get_error_prevention_tips cost the same with ten interactions or a million.
+
+- ExampleIndex: intent / pattern / table -> ids of distinct successful SQL
+  (queries differing only in literals are one example, the latest kept).
+  Each bucket keeps only its BUCKET_SIZE most recently used ids, so a lookup
+  ranks a bounded candidate set by match, success count and recency.
+- PatternIndex: keyword -> patterns, answering "patterns that contain this
+  one, or that it contains" (whole keywords) without scanning every pattern.
+
+Both are updated incrementally as interactions are learned.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sql_fingerprint import fingerprint_sql
+
+BUCKET_SIZE = 64
+# Weight of a match on each key kind when ranking examples
+MATCH_WEIGHTS = {"pattern": 2.0, "table": 1.5, "intent": 1.0}
+RECENCY_HALF_LIFE = 7 * 24 * 3600.0
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def _sql_key(sql: str) -> str:
+    return fingerprint_sql(sql)
+
+
+class ExampleIndex:
+    """Distinct successful queries, looked up by intent, pattern and table"""
+
+    def __init__(self, bucket_size: int = BUCKET_SIZE) -> None:
+        self.bucket_size = bucket_size
+        self._ids: Dict[str, int] = {}
+        self._examples: Dict[int, Dict[str, Any]] = {}
+        self._refs: Dict[int, int] = {}
+        # (kind, key) -> ids, least recently used first
+        self._buckets: Dict[Tuple[str, str], "OrderedDict[int, None]"] = {}
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def add(self, question: str, sql: str, intent: str, pattern: str,
+            tables: Iterable[str] = (), timestamp: Optional[float] = None) -> int:
+        """Record one successful query; returns its example id"""
+        key = _sql_key(sql)
+        example_id = self._ids.get(key)
+        if example_id is None:
+            example_id = self._next_id
+            self._next_id += 1
+            self._ids[key] = example_id
+            self._refs[example_id] = 0
+            self._examples[example_id] = {"question": question, "sql": sql, "intent": intent,
+                                          "pattern": pattern, "success_count": 0, "last_used": 0.0}
+        example = self._examples[example_id]
+        example["question"], example["sql"] = question, sql  # latest phrasing and literals
+        example["success_count"] += 1
+        example["last_used"] = max(example["last_used"], timestamp or time.time())
+        keys = [("intent", intent), ("pattern", pattern)] + [("table", t.lower()) for t in dict.fromkeys(tables)]
+        for bucket_key in keys:
+            if bucket_key[1]:
+                self._touch(bucket_key, example_id)
+        return example_id
+
+    def _touch(self, bucket_key: Tuple[str, str], example_id: int) -> None:
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = OrderedDict()
+        if example_id in bucket:
+            bucket.move_to_end(example_id)
+            return
+        bucket[example_id] = None
+        self._refs[example_id] += 1
+        if len(bucket) > self.bucket_size:
+            evicted, _ = bucket.popitem(last=False)
+            self._release(evicted)
+
+    def _release(self, example_id: int) -> None:
+        self._refs[example_id] -= 1
+        if self._refs[example_id] <= 0:
+            # No bucket can reach it any more
+            example = self._examples.pop(example_id)
+            del self._refs[example_id]
+            self._ids.pop(_sql_key(example["sql"]), None)
+
+    def tables_in(self, question: str) -> List[str]:
+        """Indexed table names mentioned in a question ("order items" finds order_items)"""
+        words = _WORD_RE.findall((question or "").lower())
+        candidates = words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+        found = []
+        for word in candidates:
+            for name in (word, word + "s"):
+                if ("table", name) in self._buckets and name not in found:
+                    found.append(name)
+        return found
+
+    def search(self, intent: str, pattern: str, tables: Iterable[str] = (), limit: int = 3,
+               now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top `limit` examples by match weight, then log(success count) and recency"""
+        now = now or time.time()
+        scores: Dict[int, float] = {}
+        keys = [("intent", intent), ("pattern", pattern)] + [("table", t.lower()) for t in tables]
+        for kind, key in keys:
+            for example_id in self._buckets.get((kind, key), ()):
+                scores[example_id] = scores.get(example_id, 0.0) + MATCH_WEIGHTS[kind]
+
+        def rank(example_id: int) -> float:
+            example = self._examples[example_id]
+            recency = 0.5 ** (max(0.0, now - example["last_used"]) / RECENCY_HALF_LIFE)
+            return scores[example_id] + 0.5 * math.log1p(example["success_count"]) + recency
+
+        return [dict(self._examples[i]) for i in heapq.nlargest(limit, scores, key=rank)]
+
+
+class PatternIndex:
+    """Keyword index over query patterns ("orders AGGREGATE", "customers JOIN orders")"""
+
+    def __init__(self, patterns: Iterable[str] = ()) -> None:
+        self._patterns: Set[str] = set()
+        self._by_word: Dict[str, Set[str]] = {}
+        for pattern in patterns:
+            self.add(pattern)
+
+    def __contains__(self, pattern: str) -> bool:
+        return pattern in self._patterns
+
+    def add(self, pattern: str) -> None:
+        if pattern in self._patterns:
+            return
+        self._patterns.add(pattern)
+        for word in set(pattern.split()):
+            self._by_word.setdefault(word, set()).add(pattern)
+
+    def related(self, pattern: str) -> Set[str]:
+        """Known patterns that contain `pattern` or are contained in it, as whole keyword runs"""
+        words = pattern.split()
+        if not words:
+            return {pattern} & self._patterns
+        buckets = sorted((self._by_word.get(w, set()) for w in set(words)), key=len)
+        padded = f" {pattern} "
+        found = {p for p in buckets[0] if padded in f" {p} "} if all(buckets) else set()
+        # Patterns are at most a few keywords, so enumerating the runs of this one is cheap
+        for i in range(len(words)):
+            for j in range(i + 1, len(words) + 1):
+                run = " ".join(words[i:j])
+                if run in self._patterns:
+                    found.add(run)
+        return found
@@ -0,0 +1,648 @@
+"""
+Learning Store
+
+Persistence for LearningManager. Replaces rewriting learning_data.json in
+full: each interaction is one append to `interactions` plus counter upserts,
+all in one short transaction, so several worker processes can record at once.
+
+Backends:
+- SQLiteLearningStore (default): embedded SQLite file in WAL mode
+- InMemoryLearningStore: nothing persisted, for the REPL and tests
+
+Tables:
+- interactions: append-only log (question, sql, intent, pattern, tables, outcome, timing)
+- patterns / pattern_intents / pattern_examples: successful query patterns
+- error_corrections / error_sql: failures grouped by pattern and error
+- schema_insights: per table pair usage and success counts
+- preferences: learned user preference flags
+
+An existing learning_data.json is imported once into an empty database.
+"""
+
+from __future__ import annotations
+
+import abc
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from log_config import get_logger
+
+log = get_logger("learning_store")
+
+
+LEARNING_CONFIG = {
+    "backend": os.getenv("LEARNING_STORE", "sqlite"),
+    "db_path": os.getenv("LEARNING_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "learning.db")),
+    # How much history LearningManager keeps in memory
+    "max_metrics": int(os.getenv("LEARNING_MAX_METRICS", "10000")),
+    "max_successes": int(os.getenv("LEARNING_MAX_SUCCESSES", "500")),
+    # Background writer (LearningWriter); LEARNING_ASYNC=0 writes on the calling thread
+    "async_writes": os.getenv("LEARNING_ASYNC", "1") not in ("0", "false", "False"),
+    "batch_size": int(os.getenv("LEARNING_BATCH_SIZE", "50")),
+    "flush_seconds": float(os.getenv("LEARNING_FLUSH_SECONDS", "1.0")),
+    "queue_size": int(os.getenv("LEARNING_QUEUE_SIZE", "10000")),
+    # When the queue is full: "block" (up to block_seconds, then drop), "drop_newest" or "drop_oldest"
+    "overflow": os.getenv("LEARNING_QUEUE_OVERFLOW", "drop_oldest").lower(),
+    "block_seconds": float(os.getenv("LEARNING_BLOCK_SECONDS", "0.05")),
+}
+
+PATTERN_EXAMPLES = 5  # SQL examples kept per pattern
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS interactions ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " ts REAL NOT NULL,"
+    " question TEXT NOT NULL,"
+    " sql TEXT NOT NULL,"
+    " intent TEXT,"
+    " pattern TEXT,"
+    " tables TEXT,"
+    " success INTEGER NOT NULL,"
+    " execution_time REAL,"
+    " result_count INTEGER,"
+    " error TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_ts ON interactions(ts)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_success_ts ON interactions(success, ts)",
+    "CREATE TABLE IF NOT EXISTS patterns ("
+    " pattern TEXT PRIMARY KEY,"
+    " success_count INTEGER NOT NULL,"
+    " last_used REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS pattern_intents ("
+    " pattern TEXT NOT NULL,"
+    " intent TEXT NOT NULL,"
+    " PRIMARY KEY (pattern, intent))",
+    "CREATE TABLE IF NOT EXISTS pattern_examples ("
+    " pattern TEXT NOT NULL,"
+    " sql TEXT NOT NULL,"
+    " last_used REAL NOT NULL,"
+    " PRIMARY KEY (pattern, sql))",
+    "CREATE TABLE IF NOT EXISTS error_corrections ("
+    " error_key TEXT PRIMARY KEY,"
+    " pattern TEXT,"
+    " error_count INTEGER NOT NULL,"
+    " last_seen REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS error_sql ("
+    " error_key TEXT NOT NULL,"
+    " sql TEXT NOT NULL,"
+    " PRIMARY KEY (error_key, sql))",
+    "CREATE TABLE IF NOT EXISTS schema_insights ("
+    " table_a TEXT NOT NULL,"
+    " table_b TEXT NOT NULL,"
+    " usage_count INTEGER NOT NULL,"
+    " success_count INTEGER NOT NULL,"
+    " last_used REAL NOT NULL,"
+    " PRIMARY KEY (table_a, table_b))",
+    "CREATE TABLE IF NOT EXISTS preferences ("
+    " key TEXT PRIMARY KEY,"
+    " value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta ("
+    " key TEXT PRIMARY KEY,"
+    " value TEXT NOT NULL)",
+)
+
+
+def make_error_key(pattern: str, error_message: Optional[str]) -> str:
+    """Key grouping failures of one pattern with the same error"""
+    return f"{pattern}:{error_message[:50]}" if error_message else pattern
+
+
+def table_pairs(tables: Iterable[str]) -> List[Tuple[str, str]]:
+    """Sorted, distinct pairs of the tables one query used"""
+    names = list(dict.fromkeys(tables))
+    return sorted({tuple(sorted((a, b))) for i, a in enumerate(names) for b in names[i + 1:] if a != b})  # type: ignore[misc]
+
+
+def _pair_from_key(key: Any) -> Optional[Tuple[str, str]]:
+    # Older JSON files wrote tuple keys as strings ("('orders', 'stores')")
+    names = list(key) if isinstance(key, (tuple, list)) else re.findall(r"\w+", str(key))
+    return tuple(sorted(names[:2])) if len(names) == 2 else None  # type: ignore[return-value]
+
+
+class LearningStore(abc.ABC):
+    """Interface for learning persistence.
+
+    `record_many` takes interaction dicts as built by LearningManager:
+    question, sql, success, timestamp, intent, pattern, tables,
+    execution_time, result_count, error_message, preferences.
+    """
+
+    def record(self, interaction: Dict[str, Any]) -> None:
+        self.record_many([interaction])
+
+    @abc.abstractmethod
+    def record_many(self, interactions: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def load(self, max_metrics: int = 1000, max_successes: int = 500) -> Dict[str, Any]:
+        """State in the learning_data.json shape (tuple insight keys, intent sets)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def is_empty(self) -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def import_snapshot(self, data: Dict[str, Any], source: str = "") -> int:
+        """Import a learning_data.json dict; returns the number of interactions imported"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def compact(self, policy: Any, now: Optional[float] = None, force: bool = False) -> Dict[str, Any]:
+        """Apply a learning_compaction.CompactionPolicy; returns what was removed"""
+        raise NotImplementedError
+
+
+class InMemoryLearningStore(LearningStore):
+    """Keeps nothing; LearningManager's own in-memory state is the only copy."""
+
+    def record_many(self, interactions: List[Dict[str, Any]]) -> None:
+        pass
+
+    def load(self, max_metrics: int = 1000, max_successes: int = 500) -> Dict[str, Any]:
+        return {}
+
+    def is_empty(self) -> bool:
+        return True
+
+    def import_snapshot(self, data: Dict[str, Any], source: str = "") -> int:
+        return 0
+
+    def compact(self, policy: Any, now: Optional[float] = None, force: bool = False) -> Dict[str, Any]:
+        return {}
+
+
+class SQLiteLearningStore(LearningStore):
+    """Embedded SQLite store in WAL mode, safe for several worker processes.
+
+    Each thread keeps its own connection. A batch of interactions is written in
+    one BEGIN IMMEDIATE transaction; counters are incremented in SQL, so
+    concurrent writers never lose updates.
+    """
+
+    def __init__(self, db_path: str = "learning.db") -> None:
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn) -> Any:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    # -- writes ------------------------------------------------------------
+
+    def record_many(self, interactions: List[Dict[str, Any]]) -> None:
+        if interactions:
+            self._write(lambda conn: [self._apply(conn, i) for i in interactions])
+
+    def _apply(self, conn: sqlite3.Connection, i: Dict[str, Any]) -> None:
+        ts = i.get("timestamp") or time.time()
+        success = bool(i.get("success"))
+        pattern = i.get("pattern") or ""
+        tables = list(i.get("tables") or [])
+        conn.execute(
+            "INSERT INTO interactions (ts, question, sql, intent, pattern, tables, success,"
+            " execution_time, result_count, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (ts, i.get("question", ""), i.get("sql", ""), i.get("intent"), pattern,
+             ",".join(tables), int(success), i.get("execution_time"), i.get("result_count"),
+             i.get("error_message")),
+        )
+        if success:
+            conn.execute(
+                "INSERT INTO patterns (pattern, success_count, last_used) VALUES (?, 1, ?)"
+                " ON CONFLICT(pattern) DO UPDATE SET success_count = success_count + 1,"
+                " last_used = MAX(last_used, excluded.last_used)",
+                (pattern, ts),
+            )
+            if i.get("intent"):
+                conn.execute("INSERT OR IGNORE INTO pattern_intents (pattern, intent) VALUES (?, ?)", (pattern, i["intent"]))
+            conn.execute(
+                "INSERT INTO pattern_examples (pattern, sql, last_used) VALUES (?, ?, ?)"
+                " ON CONFLICT(pattern, sql) DO UPDATE SET last_used = MAX(last_used, excluded.last_used)",
+                (pattern, i.get("sql", ""), ts),
+            )
+        else:
+            key = make_error_key(pattern, i.get("error_message"))
+            conn.execute(
+                "INSERT INTO error_corrections (error_key, pattern, error_count, last_seen) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT(error_key) DO UPDATE SET error_count = error_count + 1,"
+                " last_seen = MAX(last_seen, excluded.last_seen)",
+                (key, pattern, ts),
+            )
+            conn.execute("INSERT OR IGNORE INTO error_sql (error_key, sql) VALUES (?, ?)", (key, i.get("sql", "")))
+        for a, b in table_pairs(tables):
+            conn.execute(
+                "INSERT INTO schema_insights (table_a, table_b, usage_count, success_count, last_used)"
+                " VALUES (?, ?, 1, ?, ?) ON CONFLICT(table_a, table_b) DO UPDATE SET"
+                " usage_count = usage_count + 1, success_count = success_count + excluded.success_count,"
+                " last_used = MAX(last_used, excluded.last_used)",
+                (a, b, int(success), ts),
+            )
+        for key, value in (i.get("preferences") or {}).items():
+            conn.execute(
+                "INSERT INTO preferences (key, value) VALUES (?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value)),
+            )
+
+    # -- reads -------------------------------------------------------------
+
+    def is_empty(self) -> bool:
+        conn = self._conn()
+        # A meta row (import or compaction) means the store was used, even if retention emptied it
+        return (conn.execute("SELECT 1 FROM interactions LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM patterns LIMIT 1").fetchone() is None
+                and conn.execute("SELECT 1 FROM meta LIMIT 1").fetchone() is None)
+
+    def load(self, max_metrics: int = 1000, max_successes: int = 500) -> Dict[str, Any]:
+        conn = self._conn()
+        patterns: Dict[str, Dict[str, Any]] = {}
+        for pattern, count, last_used in conn.execute("SELECT pattern, success_count, last_used FROM patterns"):
+            patterns[pattern] = {"sql_examples": [], "success_count": count, "intents": set(), "last_used": last_used}
+        for pattern, intent in conn.execute("SELECT pattern, intent FROM pattern_intents"):
+            if pattern in patterns:
+                patterns[pattern]["intents"].add(intent)
+        for pattern, sql in conn.execute("SELECT pattern, sql FROM pattern_examples ORDER BY last_used"):
+            if pattern in patterns:
+                patterns[pattern]["sql_examples"].append(sql)
+        for data in patterns.values():
+            data["sql_examples"] = data["sql_examples"][-PATTERN_EXAMPLES:]
+
+        errors: Dict[str, Dict[str, Any]] = {}
+        for key, count, last_seen in conn.execute("SELECT error_key, error_count, last_seen FROM error_corrections"):
+            errors[key] = {"failed_sql": [], "corrections": [], "error_count": count, "last_seen": last_seen}
+        for key, sql in conn.execute("SELECT error_key, sql FROM error_sql"):
+            if key in errors:
+                errors[key]["failed_sql"].append(sql)
+
+        insights = {
+            (a, b): {"usage_count": usage, "success_rate": success / usage if usage else 0, "last_used": last_used}
+            for a, b, usage, success, last_used in conn.execute(
+                "SELECT table_a, table_b, usage_count, success_count, last_used FROM schema_insights")
+        }
+        preferences = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM preferences")}
+
+        metrics = [
+            {"question": q, "sql": s, "intent": intent or "general", "pattern": pattern, "execution_time": t,
+             "result_count": n, "success": bool(ok), "timestamp": ts}
+            for q, s, intent, pattern, t, n, ok, ts in reversed(conn.execute(
+                "SELECT question, sql, intent, pattern, execution_time, result_count, success, ts FROM interactions"
+                " ORDER BY ts DESC LIMIT ?", (max_metrics,)).fetchall())
+        ]
+        successes = [
+            {"question": q, "sql": s, "intent": intent or "general", "timestamp": ts, "execution_time": t, "result_count": n}
+            for q, s, intent, ts, t, n in reversed(conn.execute(
+                "SELECT question, sql, intent, ts, execution_time, result_count FROM interactions"
+                " WHERE success = 1 ORDER BY ts DESC LIMIT ?", (max_successes,)).fetchall())
+        ]
+        return {
+            "query_patterns": patterns,
+            "user_intents": {},
+            "error_corrections": errors,
+            "schema_insights": insights,
+            "performance_metrics": metrics,
+            "user_preferences": preferences,
+            "successful_queries": successes,
+        }
+
+    # -- migration ---------------------------------------------------------
+
+    def import_snapshot(self, data: Dict[str, Any], source: str = "") -> int:
+        """Import learning_data.json contents as they are (counters are not recomputed)"""
+        return self._write(lambda conn: self._import(conn, data, source))
+
+    def _import(self, conn: sqlite3.Connection, data: Dict[str, Any], source: str) -> int:
+        intents = {(q.get("question"), q.get("sql")): q.get("intent") for q in data.get("successful_queries") or []}
+        rows = []
+        seen = set()
+        for m in data.get("performance_metrics") or []:
+            key = (m.get("question"), m.get("sql"))
+            seen.add(key)
+            rows.append((m.get("timestamp") or 0, m.get("question") or "", m.get("sql") or "", intents.get(key),
+                         int(bool(m.get("success"))), m.get("execution_time"), m.get("result_count")))
+        for q in data.get("successful_queries") or []:
+            if (q.get("question"), q.get("sql")) not in seen:
+                rows.append((q.get("timestamp") or 0, q.get("question") or "", q.get("sql") or "", q.get("intent"),
+                             1, q.get("execution_time"), q.get("result_count")))
+        conn.executemany(
+            "INSERT INTO interactions (ts, question, sql, intent, success, execution_time, result_count)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        for pattern, p in (data.get("query_patterns") or {}).items():
+            last_used = p.get("last_used") or 0
+            conn.execute("INSERT OR REPLACE INTO patterns (pattern, success_count, last_used) VALUES (?, ?, ?)",
+                         (pattern, int(p.get("success_count") or 0), last_used))
+            conn.executemany("INSERT OR IGNORE INTO pattern_intents (pattern, intent) VALUES (?, ?)",
+                             [(pattern, intent) for intent in p.get("intents") or []])
+            examples = p.get("sql_examples") or []
+            # Keep their order: older examples get slightly older timestamps
+            conn.executemany("INSERT OR REPLACE INTO pattern_examples (pattern, sql, last_used) VALUES (?, ?, ?)",
+                             [(pattern, sql, last_used - (len(examples) - n) * 1e-3) for n, sql in enumerate(examples)])
+        for key, e in (data.get("error_corrections") or {}).items():
+            conn.execute("INSERT OR REPLACE INTO error_corrections (error_key, pattern, error_count, last_seen) VALUES (?, ?, ?, ?)",
+                         (key, key.split(":", 1)[0], int(e.get("error_count") or 0), e.get("last_seen") or 0))
+            conn.executemany("INSERT OR IGNORE INTO error_sql (error_key, sql) VALUES (?, ?)",
+                             [(key, sql) for sql in e.get("failed_sql") or []])
+        for key, s in (data.get("schema_insights") or {}).items():
+            pair = _pair_from_key(key)
+            if pair and isinstance(s, dict):
+                usage = int(s.get("usage_count") or 0)
+                conn.execute("INSERT OR REPLACE INTO schema_insights VALUES (?, ?, ?, ?, ?)",
+                             (pair[0], pair[1], usage, round(float(s.get("success_rate") or 0) * usage), s.get("last_used") or 0))
+        for key, value in (data.get("user_preferences") or {}).items():
+            conn.execute("INSERT OR REPLACE INTO preferences (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('imported_from', ?)", (source,))
+        return len(rows)
+
+    # -- compaction --------------------------------------------------------
+
+    def compact(self, policy: Any, now: Optional[float] = None, force: bool = False) -> Dict[str, Any]:
+        """Evict, merge and shrink in one transaction, then enforce the disk budget.
+
+        Skipped (returns {"skipped": ...}) if another worker compacted within the
+        last half interval, unless `force`.
+        """
+        now = now or time.time()
+        stats = self._write(lambda conn: self._compact(conn, policy, now, force))
+        if not stats.get("skipped"):
+            stats.update(self._enforce_disk_budget(policy))
+        return stats
+
+    def _compact(self, conn: sqlite3.Connection, policy: Any, now: float, force: bool) -> Dict[str, Any]:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'last_compacted'").fetchone()
+        if row and not force and now - float(row[0]) < policy.interval_seconds / 2:
+            return {"skipped": "compacted %.0fs ago" % (now - float(row[0]))}
+        stats: Dict[str, Any] = {}
+        if policy.retention_seconds > 0:
+            stats["interactions_expired"] = conn.execute(
+                "DELETE FROM interactions WHERE ts < ?", (now - policy.retention_seconds,)).rowcount
+
+        patterns = policy.evictions(conn.execute("SELECT pattern, success_count, last_used FROM patterns"),
+                                    policy.max_patterns, now)
+        for table in ("patterns", "pattern_intents", "pattern_examples"):
+            conn.executemany(f"DELETE FROM {table} WHERE pattern = ?", [(p,) for p in patterns])
+        stats["patterns_evicted"] = len(patterns)
+
+        errors = policy.evictions(conn.execute("SELECT error_key, error_count, last_seen FROM error_corrections"),
+                                  policy.max_errors, now)
+        for table in ("error_corrections", "error_sql"):
+            conn.executemany(f"DELETE FROM {table} WHERE error_key = ?", [(k,) for k in errors])
+        stats["errors_evicted"] = len(errors)
+
+        pairs = policy.evictions(
+            (((a, b), usage, last_used) for a, b, usage, last_used in
+             conn.execute("SELECT table_a, table_b, usage_count, last_used FROM schema_insights")),
+            policy.max_insights, now)
+        conn.executemany("DELETE FROM schema_insights WHERE table_a = ? AND table_b = ?", pairs)
+        stats["table_pairs_evicted"] = len(pairs)
+
+        # Examples of one pattern that differ only in literals collapse to the latest
+        examples: Dict[str, List[str]] = {}
+        for pattern, sql in conn.execute("SELECT pattern, sql FROM pattern_examples ORDER BY pattern, last_used"):
+            examples.setdefault(pattern, []).append(sql)
+        stale = []
+        for pattern, sqls in examples.items():
+            kept = set(policy.merge_sql(sqls, policy.max_examples))
+            stale.extend((pattern, sql) for sql in sqls if sql not in kept)
+        conn.executemany("DELETE FROM pattern_examples WHERE pattern = ? AND sql = ?", stale)
+        stats["examples_merged"] = len(stale)
+
+        # error_sql has no timestamps; rowid order is insertion order
+        failed: Dict[str, List[str]] = {}
+        for key, sql in conn.execute("SELECT error_key, sql FROM error_sql ORDER BY error_key, rowid"):
+            failed.setdefault(key, []).append(sql)
+        stale = []
+        for key, sqls in failed.items():
+            kept = set(policy.merge_sql(sqls, policy.max_failed_sql))
+            stale.extend((key, sql) for sql in sqls if sql not in kept)
+        conn.executemany("DELETE FROM error_sql WHERE error_key = ? AND sql = ?", stale)
+        stats["failed_sql_merged"] = len(stale)
+
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_compacted', ?)", (repr(now),))
+        return stats
+
+    def _used_bytes(self, conn: sqlite3.Connection) -> Tuple[int, int, int]:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size, pages, free
+
+    def _enforce_disk_budget(self, policy: Any) -> Dict[str, Any]:
+        conn = self._conn()
+        deleted = 0
+        used, pages, free = self._used_bytes(conn)
+        # Interactions are nearly all of the file; drop the oldest share that is over budget
+        for _ in range(3):
+            if policy.max_db_bytes <= 0 or used <= policy.max_db_bytes:
+                break
+            total = conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+            excess = max(1, int(total * (1 - policy.max_db_bytes * 0.9 / used)))
+            deleted += self._write(lambda c: c.execute(
+                "DELETE FROM interactions WHERE id IN (SELECT id FROM interactions ORDER BY ts LIMIT ?)",
+                (excess,)).rowcount)
+            used, pages, free = self._used_bytes(conn)
+        vacuumed = False
+        if pages and free / pages > 0.2:
+            try:
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                vacuumed = True
+            except sqlite3.Error as e:
+                # Another process holds a read transaction; the next compaction retries
+                log.warning("Learning store VACUUM skipped: %s", e)
+        return {"interactions_over_budget": deleted, "vacuumed": vacuumed, "db_mb": round(used / 1024 / 1024, 2)}
+
+
+_STOP = object()
+
+
+class LearningWriter:
+    """Records interactions on a background thread, in batches.
+
+    `submit` only enqueues. The writer thread takes up to `batch_size`
+    interactions, or whatever arrived within `flush_seconds` of the first one,
+    and writes them with one `record_many` transaction. The queue is bounded;
+    when it is full `overflow` decides: "block" waits up to `block_seconds`
+    and then drops, "drop_newest" drops the new interaction, "drop_oldest"
+    makes room by dropping the oldest queued one. Pending interactions are
+    flushed at interpreter exit.
+    """
+
+    def __init__(self, store: LearningStore, batch_size: Optional[int] = None, flush_seconds: Optional[float] = None,
+                 queue_size: Optional[int] = None, overflow: Optional[str] = None,
+                 block_seconds: Optional[float] = None) -> None:
+        cfg = LEARNING_CONFIG
+        self.store = store
+        self.batch_size = batch_size or cfg["batch_size"]
+        self.flush_seconds = cfg["flush_seconds"] if flush_seconds is None else flush_seconds
+        self.overflow = overflow or cfg["overflow"]
+        self.block_seconds = cfg["block_seconds"] if block_seconds is None else block_seconds
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size or cfg["queue_size"])
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def _ensure_started(self) -> None:
+        # Started on first use, so a forked worker gets its own thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True, name="learning-writer")
+                self._thread.start()
+
+    def submit(self, interaction: Dict[str, Any]) -> bool:
+        """Queue one interaction; False if it was dropped"""
+        if self._closed:
+            self.store.record(interaction)
+            return True
+        self._ensure_started()
+        self.submitted += 1
+        try:
+            if self.overflow == "block":
+                self._queue.put(interaction, timeout=self.block_seconds)
+            else:
+                self._queue.put_nowait(interaction)
+            return True
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                oldest = self._queue.get_nowait()
+            except queue.Empty:
+                oldest = None
+            keep = interaction
+            if oldest is not None and not isinstance(oldest, dict):
+                keep = oldest  # flush markers and the stop sentinel are never dropped
+            elif oldest is not None:
+                self.dropped += 1
+            try:
+                self._queue.put_nowait(keep)
+                if keep is interaction:
+                    return True
+            except queue.Full:
+                pass
+        self.dropped += 1
+        return False
+
+    def _next_batch(self) -> Tuple[List[Any], bool]:
+        """Block for the first item, then gather until the batch is full or flush_seconds passed"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        if isinstance(first, threading.Event):
+            return batch, False
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            # Flush markers end the batch so flush() returns promptly
+            if isinstance(item, threading.Event):
+                break
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._next_batch()
+            markers = [item for item in batch if isinstance(item, threading.Event)]
+            interactions = [item for item in batch if not isinstance(item, threading.Event)]
+            self._write(interactions)
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def _write(self, interactions: List[Dict[str, Any]]) -> None:
+        if not interactions:
+            return
+        for attempt in range(2):
+            try:
+                self.store.record_many(interactions)
+                self.written += len(interactions)
+                return
+            except Exception as e:
+                if attempt:
+                    self.failed += len(interactions)
+                    log.warning("Could not save %d learning interactions: %s", len(interactions), e)
+                else:
+                    time.sleep(0.2)  # e.g. another process held the write lock past busy_timeout
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything submitted so far is written; False on timeout"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.empty()
+        marker = threading.Event()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush pending interactions and stop the thread; later submits write synchronously"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                log.warning("Learning writer queue still full at shutdown; %d interactions lost", self._queue.qsize())
+                return
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+def get_learning_store(backend: Optional[str] = None) -> LearningStore:
+    """Return a learning store configured from LEARNING_CONFIG (sqlite by default)."""
+    backend = (backend or LEARNING_CONFIG["backend"]).lower()
+    if backend == "memory":
+        return InMemoryLearningStore()
+    return SQLiteLearningStore(LEARNING_CONFIG["db_path"])
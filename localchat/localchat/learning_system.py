@@ -4,6 +4,7 @@ Implements self-learning capabilities to improve over time
 """
 
 import json
+import threading
 import time
 import re
 from typing import Dict, List, Any, Optional, Tuple
@@ -11,11 +12,31 @@ from collections import defaultdict, Counter
 from datetime import datetime, timedelta
 import os
 
+from intent_lexicon import classify
+from latency_stats import LatencyTracker
+from learning_compaction import CompactionPolicy
+from learning_index import ExampleIndex, PatternIndex
+from learning_store import LEARNING_CONFIG, LearningStore, LearningWriter, get_learning_store, make_error_key, table_pairs
+from log_config import get_logger
+
+log = get_logger("learning")
+
 class LearningManager:
     """Manages learning and adaptation for the database assistant"""
     
-    def __init__(self, learning_data_file: str = "learning_data.json"):
+    def __init__(self, learning_data_file: str = "learning_data.json", store: Optional[LearningStore] = None,
+                 writer: Optional[LearningWriter] = None):
+        # learning_data_file is only read once, to import it into an empty store
         self.learning_data_file = learning_data_file
+        self.store = store if store is not None else get_learning_store()
+        # Writes go through a background batch writer unless LEARNING_ASYNC=0
+        if writer is None and LEARNING_CONFIG["async_writes"]:
+            writer = LearningWriter(self.store)
+        self.writer = writer
+        # Decay and budgets; the store is compacted before loading so load time stays flat
+        self.compaction = CompactionPolicy()
+        self.last_compaction: Dict[str, Any] = {}
+        self._next_compaction = time.time() + self.compaction.interval_seconds
         self.learning_data = self._load_learning_data()
         
         # Learning components
@@ -23,37 +44,73 @@ class LearningManager:
         self.user_intents = self.learning_data.get("user_intents", {})
         self.error_corrections = self.learning_data.get("error_corrections", {})
         self.schema_insights = self.learning_data.get("schema_insights", {})
-        self.performance_metrics = self.learning_data.get("performance_metrics", [])
+        # Recent interactions in a fixed-size ring, with streaming latency percentiles
+        self.latency = LatencyTracker()
+        self.latency.add_many(
+            m if m.get("pattern") is not None else {**m, "pattern": self._extract_query_pattern(m.get("question") or "")}
+            for m in self.learning_data.get("performance_metrics", [])
+        )
         self.user_preferences = self.learning_data.get("user_preferences", {})
         self.successful_queries = self.learning_data.get("successful_queries", [])
+        self._build_indexes()
         
     def _load_learning_data(self) -> Dict[str, Any]:
-        """Load existing learning data from file"""
+        """Load learning data from the store, importing learning_data.json into an empty store first"""
         try:
-            if os.path.exists(self.learning_data_file):
+            if self.store.is_empty() and os.path.exists(self.learning_data_file):
                 with open(self.learning_data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    imported = self.store.import_snapshot(json.load(f), source=os.path.abspath(self.learning_data_file))
+                log.info("Imported %d interactions from %s", imported, self.learning_data_file)
         except Exception as e:
-            print(f"Warning: Could not load learning data: {e}")
-        return {}
-    
-    def _save_learning_data(self):
-        """Save learning data to file"""
+            log.warning("Could not import learning data: %s", e)
+        self._compact_store()
         try:
-            self.learning_data = {
-                "query_patterns": self.query_patterns,
-                "user_intents": self.user_intents,
-                "error_corrections": self.error_corrections,
-                "schema_insights": self.schema_insights,
-                "performance_metrics": self.performance_metrics[-1000:],  # Keep last 1000
-                "user_preferences": self.user_preferences,
-                "successful_queries": self.successful_queries[-500:],  # Keep last 500
-                "last_updated": datetime.now().isoformat()
-            }
-            with open(self.learning_data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.learning_data, f, indent=2, ensure_ascii=False)
+            return self.store.load(LEARNING_CONFIG["max_metrics"], LEARNING_CONFIG["max_successes"])
         except Exception as e:
-            print(f"Warning: Could not save learning data: {e}")
+            log.warning("Could not load learning data: %s", e)
+        return {}
+    
+    def _build_indexes(self):
+        """Inverted indexes over the loaded state; kept up to date by learn_from_interaction"""
+        self._examples = ExampleIndex()
+        for q in self.successful_queries:
+            self._examples.add(q["question"], q["sql"], q.get("intent") or "general",
+                               self._extract_query_pattern(q["question"]), self._sql_tables(q["sql"]),
+                               q.get("timestamp"))
+        self._patterns = PatternIndex(self.query_patterns)
+        # Only errors seen more than twice become tips
+        self._error_patterns = PatternIndex()
+        self._frequent_errors: Dict[str, set] = {}
+        for error_key, error_data in self.error_corrections.items():
+            if error_data["error_count"] > 2:
+                self._add_frequent_error(error_key)
+    
+    @property
+    def performance_metrics(self) -> List[Dict[str, Any]]:
+        """Recent interactions as dicts, oldest first (a copy of the latency ring)"""
+        return self.latency.records()
+    
+    def _add_frequent_error(self, error_key: str):
+        pattern = error_key.split(":", 1)[0]
+        self._error_patterns.add(pattern)
+        self._frequent_errors.setdefault(pattern, set()).add(error_key)
+    
+    def _snapshot(self) -> Dict[str, Any]:
+        """JSON-safe copy of the in-memory state (intent sets as lists, table pairs as "a,b")"""
+        return {
+            "query_patterns": {
+                p: {**data, "intents": sorted(data.get("intents", ()))} for p, data in self.query_patterns.items()
+            },
+            "user_intents": self.user_intents,
+            "error_corrections": self.error_corrections,
+            "schema_insights": {
+                ",".join(k) if isinstance(k, tuple) else str(k): v for k, v in self.schema_insights.items()
+            },
+            "performance_metrics": self.latency.records(),
+            "user_preferences": self.user_preferences,
+            "successful_queries": self.successful_queries[-LEARNING_CONFIG["max_successes"]:],
+            "last_updated": datetime.now().isoformat()
+        }
     
     def learn_from_interaction(self, question: str, sql: str, success: bool, 
                              execution_time: float = 0, result_count: int = 0, 
@@ -63,9 +120,10 @@ class LearningManager:
         # Extract patterns from the question
         intent = self._extract_user_intent(question)
         pattern = self._extract_query_pattern(question)
+        now = time.time()
         
         # Track performance
-        self._track_performance(question, sql, execution_time, result_count, success)
+        self._track_performance(question, sql, execution_time, result_count, success, intent, pattern, now)
         
         if success:
             self._reinforce_successful_pattern(pattern, sql, intent)
@@ -73,7 +131,7 @@ class LearningManager:
                 "question": question,
                 "sql": sql,
                 "intent": intent,
-                "timestamp": time.time(),
+                "timestamp": now,
                 "execution_time": execution_time,
                 "result_count": result_count
             })
@@ -81,43 +139,107 @@ class LearningManager:
             self._learn_from_error(pattern, sql, error_message, user_feedback)
         
         # Learn schema insights
-        self._update_schema_insights(question, sql, success)
+        tables = self._update_schema_insights(question, sql, success)
+        if success:
+            self._examples.add(question, sql, intent, pattern, tables, now)
         
         # Learn user preferences
-        self._learn_user_preferences(question, sql, success)
+        preferences = self._learn_user_preferences(question, sql, success)
         
-        # Save learning data periodically
-        if len(self.successful_queries) % 10 == 0:
-            self._save_learning_data()
+        # In-memory history stays bounded; the store keeps everything
+        cap = LEARNING_CONFIG["max_successes"]
+        if len(self.successful_queries) > cap + cap // 10:
+            del self.successful_queries[:-cap]
+        
+        # Queued for the background writer; without one, a single transaction on this thread
+        interaction = {
+            "question": question,
+            "sql": sql,
+            "success": success,
+            "timestamp": now,
+            "intent": intent,
+            "pattern": pattern,
+            "tables": tables,
+            "execution_time": execution_time,
+            "result_count": result_count,
+            "error_message": error_message,
+            "preferences": preferences,
+        }
+        if self.writer is not None:
+            self.writer.submit(interaction)
+        else:
+            try:
+                self.store.record(interaction)
+            except Exception as e:
+                log.warning("Could not save learning data: %s", e)
+        
+        if self.compaction.interval_seconds > 0 and now >= self._next_compaction:
+            self._next_compaction = now + self.compaction.interval_seconds
+            self.compact(background=True)
+    
+    def compact(self, now: Optional[float] = None, background: bool = False) -> Dict[str, Any]:
+        """Evict cold patterns, errors and table pairs, merge duplicate SQL, then compact the store"""
+        now = now or time.time()
+        policy = self.compaction
+        started = time.perf_counter()
+        
+        patterns = set(policy.evictions(
+            ((p, d["success_count"], d.get("last_used")) for p, d in self.query_patterns.items()),
+            policy.max_patterns, now))
+        query_patterns = {p: d for p, d in self.query_patterns.items() if p not in patterns}
+        for data in query_patterns.values():
+            data["sql_examples"] = policy.merge_sql(data["sql_examples"], policy.max_examples)
+        
+        errors = set(policy.evictions(
+            ((k, e["error_count"], e.get("last_seen")) for k, e in self.error_corrections.items()),
+            policy.max_errors, now))
+        error_corrections = {k: e for k, e in self.error_corrections.items() if k not in errors}
+        for data in error_corrections.values():
+            data["failed_sql"] = policy.merge_sql(data["failed_sql"], policy.max_failed_sql)
+        
+        pairs = set(policy.evictions(
+            ((k, s["usage_count"], s.get("last_used")) for k, s in self.schema_insights.items()),
+            policy.max_insights, now))
+        
+        # New dicts instead of deleting in place, so concurrent readers never see them change size
+        self.query_patterns = query_patterns
+        self.error_corrections = error_corrections
+        self.schema_insights = {k: s for k, s in self.schema_insights.items() if k not in pairs}
+        self._build_indexes()
+        
+        self.last_compaction = {
+            "at": now,
+            "patterns_evicted": len(patterns),
+            "errors_evicted": len(errors),
+            "table_pairs_evicted": len(pairs),
+            "memory_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        log.info("🧹 Learning data compacted: %d patterns, %d errors, %d table pairs evicted",
+                 len(patterns), len(errors), len(pairs))
+        if background:
+            threading.Thread(target=self._compact_store, args=(now,), daemon=True, name="learning-compaction").start()
+        else:
+            self._compact_store(now)
+        return self.last_compaction
+    
+    def _compact_store(self, now: Optional[float] = None) -> None:
+        try:
+            stats = self.store.compact(self.compaction, now)
+        except Exception as e:
+            log.warning("Could not compact learning store: %s", e)
+            return
+        if stats and not stats.get("skipped"):
+            log.info("🧹 Learning store compacted: %s", stats)
+        self.last_compaction = {**self.last_compaction, "store": stats}
     
     def _extract_user_intent(self, question: str) -> str:
         """Extract user intent from question"""
-        question_lower = question.lower()
-        
-        # Define intent patterns
-        intent_patterns = {
-            "count": ["how many", "count", "number of", "total"],
-            "list": ["show", "list", "get", "find", "display"],
-            "filter": ["where", "from", "with", "having", "filter"],
-            "aggregate": ["sum", "average", "avg", "max", "min", "group by"],
-            "join": ["with", "and", "including", "together"],
-            "time_series": ["daily", "monthly", "weekly", "yearly", "trend", "over time"],
-            "comparison": ["compare", "vs", "versus", "difference", "better", "worse"],
-            "top": ["top", "best", "highest", "most", "first"],
-            "recent": ["recent", "latest", "new", "last"]
-        }
-        
-        for intent, patterns in intent_patterns.items():
-            if any(pattern in question_lower for pattern in patterns):
-                return intent
-        
-        return "general"
+        return classify(question).primary_intent()
     
     def _extract_query_pattern(self, question: str) -> str:
         """Extract query pattern from question"""
         # Normalize question for pattern matching
         normalized = re.sub(r'\b\d+\b', 'NUMBER', question.lower())
-        normalized = re.sub(r'\b[a-zA-Z]+\b', 'WORD', normalized)
         normalized = re.sub(r'[^\w\s]', '', normalized)
         
         # Extract key words that indicate query type
@@ -137,16 +259,10 @@ class LearningManager:
         return ' '.join(key_words[:3])  # Limit to 3 key words
     
     def _track_performance(self, question: str, sql: str, execution_time: float, 
-                          result_count: int, success: bool):
+                          result_count: int, success: bool, intent: str = "general",
+                          pattern: str = "", timestamp: Optional[float] = None):
         """Track performance metrics"""
-        self.performance_metrics.append({
-            "question": question,
-            "sql": sql,
-            "execution_time": execution_time,
-            "result_count": result_count,
-            "success": success,
-            "timestamp": time.time()
-        })
+        self.latency.add(execution_time, success, intent, pattern, sql, question, result_count, timestamp)
     
     def _reinforce_successful_pattern(self, pattern: str, sql: str, intent: str):
         """Reinforce successful query patterns"""
@@ -158,6 +274,7 @@ class LearningManager:
                 "last_used": time.time()
             }
         
+        self._patterns.add(pattern)
         self.query_patterns[pattern]["success_count"] += 1
         self.query_patterns[pattern]["intents"].add(intent)
         self.query_patterns[pattern]["last_used"] = time.time()
@@ -171,7 +288,7 @@ class LearningManager:
     
     def _learn_from_error(self, pattern: str, sql: str, error_message: str, user_feedback: str):
         """Learn from errors and corrections"""
-        error_key = f"{pattern}:{error_message[:50]}" if error_message else pattern
+        error_key = make_error_key(pattern, error_message)
         
         if error_key not in self.error_corrections:
             self.error_corrections[error_key] = {
@@ -183,80 +300,95 @@ class LearningManager:
         
         self.error_corrections[error_key]["error_count"] += 1
         self.error_corrections[error_key]["last_seen"] = time.time()
+        if self.error_corrections[error_key]["error_count"] == 3:
+            self._add_frequent_error(error_key)
         
         if sql not in self.error_corrections[error_key]["failed_sql"]:
             self.error_corrections[error_key]["failed_sql"].append(sql)
+            # Keep only the latest few, like the pattern examples
+            del self.error_corrections[error_key]["failed_sql"][:-self.compaction.max_failed_sql]
+    
+    def _update_schema_insights(self, question: str, sql: str, success: bool) -> List[str]:
+        """Learn schema relationships and usage patterns; returns the tables the SQL used"""
+        tables = self._sql_tables(sql)
+        
+        # Learn table relationships
+        for table_pair in table_pairs(tables):
+            if table_pair not in self.schema_insights:
+                self.schema_insights[table_pair] = {
+                    "usage_count": 0,
+                    "success_rate": 0,
+                    "last_used": time.time()
+                }
+            
+            insight = self.schema_insights[table_pair]
+            insight["usage_count"] += 1
+            # Failures lower the rate too (same as success_count / usage_count in the store)
+            insight["success_rate"] = (
+                insight["success_rate"] * (insight["usage_count"] - 1) + (1 if success else 0)
+            ) / insight["usage_count"]
+            insight["last_used"] = time.time()
+        return tables
     
-    def _update_schema_insights(self, question: str, sql: str, success: bool):
-        """Learn schema relationships and usage patterns"""
-        # Extract table names from SQL
+    def _sql_tables(self, sql: str) -> List[str]:
+        """Distinct table names after FROM / JOIN"""
         table_pattern = r'\bFROM\s+(\w+)|JOIN\s+(\w+)'
         tables = re.findall(table_pattern, sql, re.IGNORECASE)
-        tables = [t[0] or t[1] for t in tables if t[0] or t[1]]
-        
-        if len(tables) > 1:
-            # Learn table relationships
-            for i in range(len(tables)):
-                for j in range(i+1, len(tables)):
-                    table_pair = tuple(sorted([tables[i], tables[j]]))
-                    if table_pair not in self.schema_insights:
-                        self.schema_insights[table_pair] = {
-                            "usage_count": 0,
-                            "success_rate": 0,
-                            "last_used": time.time()
-                        }
-                    
-                    self.schema_insights[table_pair]["usage_count"] += 1
-                    if success:
-                        self.schema_insights[table_pair]["success_rate"] = (
-                            self.schema_insights[table_pair]["success_rate"] * 
-                            (self.schema_insights[table_pair]["usage_count"] - 1) + 1
-                        ) / self.schema_insights[table_pair]["usage_count"]
-                    self.schema_insights[table_pair]["last_used"] = time.time()
+        return list(dict.fromkeys(t[0] or t[1] for t in tables if t[0] or t[1]))
     
-    def _learn_user_preferences(self, question: str, sql: str, success: bool):
-        """Learn user preferences and patterns"""
-        question_lower = question.lower()
+    def _learn_user_preferences(self, question: str, sql: str, success: bool) -> Dict[str, Any]:
+        """Learn user preferences and patterns; returns the preferences that changed"""
+        intents = classify(question)
+        learned = {}
         
         # Learn display preferences
-        if any(phrase in question_lower for phrase in ["full list", "all details", "show all"]):
-            self.user_preferences["prefers_full_details"] = True
-        elif any(phrase in question_lower for phrase in ["limit", "first", "top", "few"]):
-            self.user_preferences["prefers_limited_results"] = True
+        if "full_detail" in intents:
+            learned["prefers_full_details"] = True
+        elif "limit" in intents:
+            learned["prefers_limited_results"] = True
         
         # Learn query complexity preferences
         if "JOIN" in sql.upper() or "GROUP BY" in sql.upper():
-            self.user_preferences["handles_complex_queries"] = True
+            learned["handles_complex_queries"] = True
         
         # Learn time-based preferences
-        if any(word in question_lower for word in ["recent", "latest", "today", "yesterday"]):
-            self.user_preferences["frequently_asks_time_based"] = True
+        if "time_based" in intents:
+            learned["frequently_asks_time_based"] = True
+        
+        changed = {k: v for k, v in learned.items() if self.user_preferences.get(k) != v}
+        self.user_preferences.update(changed)
+        return changed
+    
+    def get_verified_examples(self, question: str, limit: int = 3) -> List[Dict[str, str]]:
+        """Question/SQL pairs that ran successfully, best match for `question` first (few-shot prompts)"""
+        intent = self._extract_user_intent(question)
+        pattern = self._extract_query_pattern(question)
+        return [
+            {"question": e["question"], "sql": e["sql"]}
+            for e in self._examples.search(intent, pattern, self._examples.tables_in(question), limit)
+        ]
     
     def get_learned_examples(self, question: str, limit: int = 3) -> List[Dict[str, Any]]:
         """Get relevant learned examples for a question"""
         intent = self._extract_user_intent(question)
         pattern = self._extract_query_pattern(question)
         
-        examples = []
-        
-        # Get examples from successful queries
-        for query_data in self.successful_queries[-50:]:  # Last 50 queries
-            if (intent in query_data.get("intent", "") or 
-                pattern in self._extract_query_pattern(query_data["question"])):
-                examples.append({
-                    "question": query_data["question"],
-                    "sql": query_data["sql"],
-                    "type": "successful_example"
-                })
+        # Successful queries sharing the intent, pattern or tables; best match, most used and most recent first
+        examples = [
+            {"question": e["question"], "sql": e["sql"], "type": "successful_example"}
+            for e in self._examples.search(intent, pattern, self._examples.tables_in(question), limit)
+        ]
         
         # Get examples from query patterns
-        if pattern in self.query_patterns:
+        if len(examples) < limit and pattern in self.query_patterns:
+            seen = {e["sql"] for e in examples}
             for sql_example in self.query_patterns[pattern]["sql_examples"][-2:]:
-                examples.append({
-                    "question": f"Example for pattern: {pattern}",
-                    "sql": sql_example,
-                    "type": "pattern_example"
-                })
+                if sql_example not in seen:
+                    examples.append({
+                        "question": f"Example for pattern: {pattern}",
+                        "sql": sql_example,
+                        "type": "pattern_example"
+                    })
         
         return examples[:limit]
     
@@ -265,10 +397,12 @@ class LearningManager:
         pattern = self._extract_query_pattern(question)
         tips = []
         
-        # Check for common errors in this pattern
-        for error_key, error_data in self.error_corrections.items():
-            if pattern in error_key and error_data["error_count"] > 2:
-                tips.append(f"Common error in this pattern: {error_key.split(':')[1]}")
+        # Errors seen more than twice in this pattern or a related one, most frequent first
+        error_keys = [k for p in self._error_patterns.related(pattern) for k in self._frequent_errors.get(p, ())]
+        error_keys.sort(key=lambda k: -self.error_corrections[k]["error_count"])
+        for error_key in error_keys:
+            if ":" in error_key:
+                tips.append(f"Common error in this pattern: {error_key.split(':', 1)[1]}")
         
         return tips
     
@@ -295,10 +429,13 @@ class LearningManager:
         pattern = self._extract_query_pattern(question)
         suggestions = []
         
-        # Find similar successful patterns
-        for p, data in self.query_patterns.items():
-            if (pattern in p or p in pattern) and data["success_count"] > 3:
-                suggestions.extend(data["sql_examples"][-2:])
+        # Related patterns (containing this one or contained in it), most successful first
+        related = [p for p in self._patterns.related(pattern) if self.query_patterns[p]["success_count"] > 3]
+        related.sort(key=lambda p: (-self.query_patterns[p]["success_count"], -self.query_patterns[p]["last_used"]))
+        for p in related:
+            suggestions.extend(self.query_patterns[p]["sql_examples"][-2:])
+            if len(suggestions) >= 3:
+                break
         
         return suggestions[:3]
     
@@ -310,17 +447,19 @@ class LearningManager:
             "total_errors_learned": len(self.error_corrections),
             "schema_relationships_learned": len(self.schema_insights),
             "user_preferences": self.user_preferences,
-            "recent_success_rate": self._calculate_recent_success_rate()
+            "recent_success_rate": self._calculate_recent_success_rate(),
+            "latency": self.latency.percentiles(),
+            "compaction": self.last_compaction,
+            "writer": self.writer.status() if self.writer is not None else None
         }
     
     def _calculate_recent_success_rate(self) -> float:
         """Calculate recent success rate"""
-        recent_metrics = self.performance_metrics[-50:]  # Last 50 interactions
-        if not recent_metrics:
-            return 0.0
-        
-        successful = sum(1 for m in recent_metrics if m.get("success", False))
-        return successful / len(recent_metrics)
+        return self.latency.success_rate(50)  # Last 50 interactions
+    
+    def get_latency_report(self, windows: Optional[List[int]] = None, limit: int = 10) -> Dict[str, Any]:
+        """p50/p95/p99 per intent, and the slowest patterns and SQL fingerprints per sliding window"""
+        return self.latency.report(windows, limit)
     
     def export_learning_data(self, filename: str = None):
         """Export learning data for analysis"""
@@ -328,6 +467,6 @@ class LearningManager:
             filename = f"learning_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.learning_data, f, indent=2, ensure_ascii=False)
+            json.dump(self._snapshot(), f, indent=2, ensure_ascii=False)
         
         return filename
@@ -3,12 +3,25 @@ LLM configuration for single-model pipeline.
 Provides base URL and a single model name used across the app.
 """
 
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
 # Base LLM connection/config
 LLM_CONFIG = {
     "base_url": "http://localhost:11434", 
     "model": "qwen3:4b",
     "temperature": 0.1,
     "max_tokens": 4096,
+    # Keep the model resident and the context window fixed so Ollama can reuse
+    # the KV cache of the static prompt prefix between requests. Changing
+    # num_ctx per request forces a reload; a window smaller than the prompt
+    # truncates its head and defeats prefix reuse.
+    "keep_alive": "30m",
+    "num_ctx": 8192,
 }
 
 # Lightweight agent/runtime toggles retained for compatibility
@@ -21,6 +34,16 @@ AGENT_CONFIG = {
     "max_execution_time": 120,
 }
 
+# Record/replay of LLM calls for reproducible benchmarks and tests.
+# LLM_CASSETTE=path enables it for every get_single_llm() caller.
+CASSETTE_CONFIG = {
+    "path": os.getenv("LLM_CASSETTE", ""),
+    # record: always call the model and store; replay: cassette only; auto: replay, record misses
+    "mode": os.getenv("LLM_CASSETTE_MODE", "replay"),
+    # Replay delay as a multiple of the recorded generation time (0 = instant)
+    "latency_scale": float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "0")),
+}
+
 # Minimal helper to obtain an Ollama LLM instance where needed
 try:
     from langchain_ollama import OllamaLLM  # type: ignore
@@ -28,15 +51,106 @@ except Exception:  # pragma: no cover
     OllamaLLM = None  # type: ignore
 
 
-def get_single_llm(model: str | None = None, base_url: str | None = None, temperature: float | None = None):
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a prompt was never recorded."""
+
+
+class CassetteLLM:
+    """Records prompt -> completion pairs (with generation time) and replays them.
+
+    Entries are keyed by sha256(model + prompt), so any change to the prompt
+    layout, schema text or model is a miss rather than a stale answer. The
+    cassette is a JSON file rewritten atomically after every recording.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, mode: str = "replay", inner: Any = None,
+                 model: Optional[str] = None, latency_scale: float = 0.0) -> None:
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown cassette mode '{mode}' (expected record, replay or auto)")
+        if mode != "replay" and inner is None:
+            raise ValueError(f"Cassette mode '{mode}' needs an LLM to record from")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.model = model or LLM_CONFIG.get("model")
+        self.latency_scale = latency_scale
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION:
+                raise ValueError(f"Unsupported cassette version in {path}: {data.get('version')}")
+            self._entries = data.get("entries", {})
+
+    def _key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.model}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def invoke(self, prompt: Any, *args: Any, **kwargs: Any) -> str:
+        prompt = str(prompt)
+        key = self._key(prompt)
+        entry = None if self.mode == "record" else self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            if self.latency_scale > 0:
+                time.sleep(entry.get("seconds", 0.0) * self.latency_scale)
+            return entry["completion"]
+        if self.mode == "replay":
+            self.misses += 1
+            raise CassetteMiss(f"Prompt not in cassette {self.path} (key {key[:12]}, ends: {prompt[-80:]!r})")
+
+        started = time.perf_counter()
+        completion = str(self.inner.invoke(prompt, *args, **kwargs))
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = {
+                "model": self.model,
+                "completion": completion,
+                "seconds": round(time.perf_counter() - started, 4),
+                "prompt_chars": len(prompt),
+                # The tail carries the user question; enough to identify an entry by eye
+                "prompt_tail": prompt[-300:],
+                "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self._save()
+        return completion
+
+    def _save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entries": self._entries}, f, indent=1, sort_keys=True, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def get_single_llm(model: str | None = None, base_url: str | None = None, temperature: float | None = None,
+                   cassette: str | None = None, cassette_mode: str | None = None):
     """Return a configured single LLM instance.
     Relies on langchain_ollama. Callers should handle None if not installed.
+    With a cassette (argument or LLM_CASSETTE), calls are recorded/replayed;
+    replay mode works without langchain_ollama or a running Ollama.
     """
-    if OllamaLLM is None:
-        return None
     cfg = LLM_CONFIG
-    return OllamaLLM(
-        model=model or cfg.get("model"),
-        base_url=base_url or cfg.get("base_url"),
-        temperature=temperature if temperature is not None else cfg.get("temperature", 0.1),
-    )
+    cassette = cassette or CASSETTE_CONFIG["path"]
+    mode = cassette_mode or CASSETTE_CONFIG["mode"]
+    llm = None
+    if OllamaLLM is not None and not (cassette and mode == "replay"):
+        llm = OllamaLLM(
+            model=model or cfg.get("model"),
+            base_url=base_url or cfg.get("base_url"),
+            temperature=temperature if temperature is not None else cfg.get("temperature", 0.1),
+            num_ctx=cfg.get("num_ctx"),
+            keep_alive=cfg.get("keep_alive"),
+        )
+    if not cassette:
+        return llm
+    if llm is None and mode != "replay":
+        return None
+    return CassetteLLM(cassette, mode=mode, inner=llm, model=model or cfg.get("model"),
+                       latency_scale=CASSETTE_CONFIG["latency_scale"])
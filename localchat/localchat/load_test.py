@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+HTTP load test for the SQL API
+
+Replays a weighted mix of /execute, /ask and /ask_explain requests against a
+running API with open-loop (Poisson) arrivals: requests are sent on schedule
+whether or not earlier ones have finished, so a saturated server shows up as
+growing latency instead of a silently lower request rate. Latency is measured
+from the scheduled send time, which avoids coordinated omission.
+
+Questions are drawn from the REFERENCE_QUESTIONS categories, SQL for /execute
+from the reference EXAMPLES. Each arrival rate step reports throughput, error
+rate and p50/p95/p99 latency (overall and per endpoint), plus the mean number
+of requests in flight (Little's law), which is the concurrent-user estimate.
+
+With --stub the harness starts sql_api in-process on a local port with a stub
+LLM (fixed latency, limited parallelism like a single Ollama) and a stub
+database, so the whole run needs neither Ollama nor MySQL. When the mix
+includes /ask_explain, db_assistant_api is served on a second port as well,
+with its assistant replaced by one built on the same stub LLM and database.
+Against real servers, --explain-url points /ask_explain at db_assistant_api.
+
+Usage:
+    python load_test.py --stub --rates 1,2,4,8 --duration 20
+    python load_test.py --url http://localhost:8000 --mix execute=3,ask=6 --rates 0.5,1,2 -o load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from reference_questions import EXAMPLES, REFERENCE_QUESTIONS
+
+
+DEFAULT_MIX = {"execute": 3, "ask": 6, "ask_explain": 1}
+
+# /ask_explain is only served by db_assistant_api (repository root)
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse 'execute=3,ask=6' into endpoint weights."""
+    mix: Dict[str, float] = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip().lstrip("/")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name}' (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class RequestMix:
+    """Draws (endpoint, payload) pairs according to the configured weights."""
+
+    def __init__(self, mix: Dict[str, float], users: int = 50, preview_rows: int = 20, seed: int = 7) -> None:
+        self.endpoints = [e for e, w in mix.items() if w > 0]
+        self.weights = [mix[e] for e in self.endpoints]
+        if not self.endpoints:
+            raise ValueError("Request mix is empty")
+        self.categories = [c for c, qs in REFERENCE_QUESTIONS.items() if qs]
+        # /execute only accepts SELECT statements
+        self.sql = [ex["sql"] for ex in EXAMPLES if ex["sql"].lstrip().upper().startswith("SELECT")]
+        self.users = max(1, users)
+        self.preview_rows = preview_rows
+        self._rng = random.Random(seed)
+
+    def next(self) -> Tuple[str, Dict[str, Any]]:
+        rng = self._rng
+        endpoint = rng.choices(self.endpoints, weights=self.weights)[0]
+        if endpoint == "execute":
+            return endpoint, {"query": rng.choice(self.sql)}
+        # Pick the category first so small categories are exercised as often as large ones
+        question = rng.choice(REFERENCE_QUESTIONS[rng.choice(self.categories)])
+        payload: Dict[str, Any] = {"q": question, "preview_rows": self.preview_rows}
+        if endpoint == "ask":
+            # Simulated chat users, so follow-ups hit the session store
+            payload["chat_id"] = f"load-{rng.randrange(self.users)}"
+        return endpoint, payload
+
+
+def run_step(url: str, mix: RequestMix, rate: float, duration: float,
+             timeout: float = 120.0, max_in_flight: int = 512, seed: int = 0,
+             routes: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Send Poisson arrivals at `rate` req/s for `duration` seconds and summarize them.
+
+    `routes` maps an endpoint to another base URL (e.g. ask_explain to db_assistant_api).
+    """
+    routes = routes or {}
+    local = threading.local()
+    samples: List[Dict[str, Any]] = []
+    samples_lock = threading.Lock()
+    in_flight = 0
+    peak_in_flight = 0
+
+    def _session() -> requests.Session:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        return session
+
+    def _send(endpoint: str, payload: Dict[str, Any], scheduled: float) -> None:
+        nonlocal in_flight, peak_in_flight
+        with samples_lock:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+        sent = time.perf_counter()
+        status, error = 0, None
+        try:
+            resp = _session().post(f"{routes.get(endpoint, url)}/{endpoint}", json=payload, timeout=timeout)
+            status = resp.status_code
+            if status >= 400:
+                error = f"HTTP {status}"
+        except requests.Timeout:
+            error = "timeout"
+        except Exception as e:
+            error = type(e).__name__
+        done = time.perf_counter()
+        with samples_lock:
+            in_flight -= 1
+            samples.append({
+                "endpoint": endpoint,
+                "latency": done - scheduled,
+                "service": done - sent,
+                "status": status,
+                "error": error,
+            })
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="load") as pool:
+        next_at = started
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at - started > duration:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint, payload = mix.next()
+            pool.submit(_send, endpoint, payload, next_at)
+    elapsed = time.perf_counter() - started
+    return summarize(samples, rate, elapsed, peak_in_flight)
+
+
+def _latency_stats(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ok = [s["latency"] * 1000 for s in samples if not s["error"]]
+    errors = len(samples) - len(ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "latency_ms_p50": round(_percentile(ok, 50), 1),
+        "latency_ms_p95": round(_percentile(ok, 95), 1),
+        "latency_ms_p99": round(_percentile(ok, 99), 1),
+    }
+
+
+def summarize(samples: List[Dict[str, Any]], rate: float, elapsed: float, peak_in_flight: int = 0) -> Dict[str, Any]:
+    """Aggregate one rate step into throughput, error and latency figures."""
+    step = {"offered_rps": rate, "elapsed_seconds": round(elapsed, 2)}
+    step.update(_latency_stats(samples))
+    ok = [s for s in samples if not s["error"]]
+    step["throughput_rps"] = round(len(ok) / elapsed, 3) if elapsed else 0.0
+    # Little's law: mean requests in the system = arrival rate x mean time in system
+    mean_latency = statistics.mean(s["latency"] for s in samples) if samples else 0.0
+    step["concurrency_mean"] = round(len(samples) / elapsed * mean_latency, 2) if elapsed else 0.0
+    step["concurrency_peak"] = peak_in_flight
+    error_kinds: Dict[str, int] = {}
+    for s in samples:
+        if s["error"]:
+            error_kinds[s["error"]] = error_kinds.get(s["error"], 0) + 1
+    step["error_kinds"] = error_kinds
+    step["endpoints"] = {
+        e: _latency_stats([s for s in samples if s["endpoint"] == e])
+        for e in sorted({s["endpoint"] for s in samples})
+    }
+    return step
+
+
+def find_capacity(steps: List[Dict[str, Any]], slo_p95_ms: float, max_error_rate: float) -> Optional[Dict[str, Any]]:
+    """Highest step that still met the latency SLO and error budget."""
+    passing = [s for s in steps if s["latency_ms_p95"] <= slo_p95_ms and s["error_rate"] <= max_error_rate]
+    return max(passing, key=lambda s: s["offered_rps"]) if passing else None
+
+
+# ---------------------------------------------------------------------------
+# Stub backends (--stub)
+# ---------------------------------------------------------------------------
+
+class StubLLM:
+    """Scripted completions with a fixed generation time and limited parallelism,
+    like a single Ollama instance (OLLAMA_NUM_PARALLEL)."""
+
+    def __init__(self, latency_ms: float = 800.0, parallel: int = 1) -> None:
+        from bench_nl2sql import ScriptedLLM
+
+        self.inner = ScriptedLLM()
+        self.latency = latency_ms / 1000.0
+        self._slots = threading.Semaphore(max(1, parallel))
+
+    def invoke(self, prompt: str) -> str:
+        with self._slots:
+            time.sleep(self.latency)
+            return self.inner.invoke(prompt)
+
+
+class StubDatabase:
+    """Returns a fixed synthetic result after a jittered query time."""
+
+    def __init__(self, latency_ms: float = 20.0, rows: int = 50) -> None:
+        self.latency = latency_ms / 1000.0
+        self.columns = ["id", "store_id", "name", "total_price"]
+        self.rows = [(i, f"store-{i % 5}", f"item {i}", round(10 + i * 1.5, 2)) for i in range(rows)]
+
+    def _wait(self) -> None:
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def execute(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        self._wait()
+        return list(self.columns), list(self.rows)
+
+    def run_query(self, query: str) -> List[Dict[str, Any]]:
+        self._wait()
+        return [dict(zip(self.columns, r)) for r in self.rows]
+
+
+class StubExplainAssistant:
+    """Stands in for ThreeModelDBAssistant behind db_assistant_api.
+
+    SQL comes from the stub LLM through SingleModelDBAssistant, rows from the
+    stub database; nothing is exported, so no download links are produced.
+    """
+
+    def __init__(self, llm: StubLLM, db: StubDatabase) -> None:
+        from session_store import InMemorySessionStore
+        from single_model_db_assistant import SingleModelDBAssistant
+
+        self.inner = SingleModelDBAssistant(embedded_mode=True, llm=llm, sql_executor=db.execute,
+                                            session_store=InMemorySessionStore())
+        self._last_columns: List[str] = []
+        self._last_rows: List[Tuple[Any, ...]] = []
+
+    def generate_sql(self, question: str) -> str:
+        return self.inner.generate_sql(question)
+
+    def execute_sql(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        return self.inner.execute_sql(sql)
+
+    def ask_explained(self, question: str, show_rows: int = 20) -> Dict[str, Any]:
+        result = self.inner.ask(question, show_rows=show_rows)
+        self._last_columns, self._last_rows = result.get("columns", []), result.get("rows", [])
+        return {
+            "sql": result.get("sql", ""),
+            "preview": result.get("formatted_results", result.get("error", "")),
+            "row_count": result.get("row_count", 0),
+        }
+
+    def ask(self, question: str, show_sql: bool = False, show_rows: int = 20,
+            include_json: bool = False, json_only: bool = False) -> str:
+        return self.ask_explained(question, show_rows)["preview"]
+
+    def _export_full_results_to_excel(self) -> Optional[str]:
+        return None
+
+
+def _isolate_stub_stores() -> None:
+    # Keep schema discovery, sessions and learned interactions away from any real store
+    os.environ["DATABASE_URL"] = "sqlite://"
+    os.environ["SESSION_STORE"] = "memory"
+    os.environ["LEARNING_STORE"] = "memory"
+
+
+def _serve(app: Any, port: int) -> Any:
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Stub server did not start within 30s")
+        time.sleep(0.05)
+    return server
+
+
+def start_stub_server(port: int, llm: StubLLM, db: StubDatabase) -> Any:
+    """Run sql_api in a background thread with stub LLM and database backends."""
+    _isolate_stub_stores()
+    import sql_api
+    from single_model_db_assistant import SingleModelDBAssistant
+
+    sql_api.get_db_connection = lambda: None
+    sql_api.run_query = db.run_query
+    sql_api.SingleModelDBAssistant = lambda **kwargs: SingleModelDBAssistant(llm=llm, sql_executor=db.execute, **kwargs)
+    return _serve(sql_api.app, port)
+
+
+def start_stub_explain_server(port: int, llm: StubLLM, db: StubDatabase) -> Any:
+    """Run db_assistant_api in a background thread, its assistant backed by the same stubs."""
+    _isolate_stub_stores()
+    # db_assistant_api builds its assistant at import time, so the stub module must be in place first
+    stub_module = types.ModuleType("three_model_db_assistant")
+    stub_module.ThreeModelDBAssistant = lambda **kwargs: StubExplainAssistant(llm, db)  # type: ignore[attr-defined]
+    sys.modules["three_model_db_assistant"] = stub_module
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import db_assistant_api
+
+    return _serve(db_assistant_api.app, port)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop HTTP load test for the SQL API")
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL (ignored with --stub)")
+    parser.add_argument("--explain-url", help="db_assistant_api base URL for /ask_explain (default: --url; ignored with --stub)")
+    parser.add_argument("--mix", help="Endpoint weights, e.g. execute=3,ask=6,ask_explain=1")
+    parser.add_argument("--rates", default="0.5,1,2,4", help="Comma-separated arrival rates (req/s), one step each")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per rate step")
+    parser.add_argument("--users", type=int, default=50, help="Distinct chat ids used for /ask")
+    parser.add_argument("--preview-rows", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--slo-p95-ms", type=float, default=5000.0, help="p95 latency target used for the capacity estimate")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--stop-on-breach", action="store_true", help="Stop stepping once a step misses the SLO")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    stub = parser.add_argument_group("stub backends")
+    stub.add_argument("--stub", action="store_true", help="Serve sql_api (and db_assistant_api) in-process with stub LLM and DB")
+    stub.add_argument("--stub-port", type=int, default=8765)
+    stub.add_argument("--stub-explain-port", type=int, default=8766, help="Port for the stub db_assistant_api")
+    stub.add_argument("--stub-llm-ms", type=float, default=800.0, help="Stub generation time per LLM call")
+    stub.add_argument("--stub-llm-parallel", type=int, default=1, help="Concurrent stub LLM calls (OLLAMA_NUM_PARALLEL)")
+    stub.add_argument("--stub-db-ms", type=float, default=20.0, help="Mean stub query time")
+    stub.add_argument("--stub-rows", type=int, default=50, help="Rows returned by every stub query")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix) if args.mix else dict(DEFAULT_MIX)
+    url = args.url.rstrip("/")
+    routes = {"ask_explain": args.explain_url.rstrip("/")} if args.explain_url else {}
+    if args.stub:
+        # One stub LLM for both servers, like a single Ollama behind both APIs
+        llm = StubLLM(args.stub_llm_ms, args.stub_llm_parallel)
+        db = StubDatabase(args.stub_db_ms, args.stub_rows)
+        print(f"🧪 Starting stub sql_api on port {args.stub_port} (LLM {args.stub_llm_ms:.0f}ms x{args.stub_llm_parallel}, DB {args.stub_db_ms:.0f}ms)")
+        start_stub_server(args.stub_port, llm, db)
+        url = f"http://127.0.0.1:{args.stub_port}"
+        routes = {}
+        if mix.get("ask_explain"):
+            print(f"🧪 Starting stub db_assistant_api on port {args.stub_explain_port} for /ask_explain")
+            start_stub_explain_server(args.stub_explain_port, llm, db)
+            routes["ask_explain"] = f"http://127.0.0.1:{args.stub_explain_port}"
+
+    rates = [float(r) for r in args.rates.split(",") if r.strip()]
+    request_mix = RequestMix(mix, users=args.users, preview_rows=args.preview_rows, seed=args.seed)
+    print(f"🚀 Load test against {url}: mix {mix}, {len(rates)} steps x {args.duration:.0f}s")
+
+    steps = []
+    for i, rate in enumerate(rates):
+        step = run_step(url, request_mix, rate, args.duration, timeout=args.timeout, seed=args.seed + i, routes=routes)
+        steps.append(step)
+        breached = step["latency_ms_p95"] > args.slo_p95_ms or step["error_rate"] > args.max_error_rate
+        print(
+            f"{'❌' if breached else '✅'} {rate:>6.2f} req/s offered | {step['throughput_rps']:>6.2f} ok/s | "
+            f"p50 {step['latency_ms_p50']:>8.0f}ms p95 {step['latency_ms_p95']:>8.0f}ms p99 {step['latency_ms_p99']:>8.0f}ms | "
+            f"errors {step['error_rate']:.1%} | in flight {step['concurrency_mean']:.1f}"
+        )
+        if breached and args.stop_on_breach:
+            break
+
+    capacity = find_capacity(steps, args.slo_p95_ms, args.max_error_rate)
+    report = {
+        "url": url,
+        "routes": routes,
+        "mix": mix,
+        "duration_seconds": args.duration,
+        "slo_p95_ms": args.slo_p95_ms,
+        "max_error_rate": args.max_error_rate,
+        "stub": args.stub,
+        "steps": steps,
+        "capacity": {
+            "max_rps": capacity["offered_rps"],
+            "concurrency_mean": capacity["concurrency_mean"],
+        } if capacity else None,
+    }
+    if capacity:
+        print(f"\n📈 Capacity: {capacity['offered_rps']} req/s within p95 ≤ {args.slo_p95_ms:.0f}ms "
+              f"(~{capacity['concurrency_mean']:.1f} requests in flight)")
+    else:
+        print(f"\n⚠️ No step met p95 ≤ {args.slo_p95_ms:.0f}ms with ≤ {args.max_error_rate:.0%} errors")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
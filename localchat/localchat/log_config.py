@@ -0,0 +1,108 @@
+"""
+Logging Configuration
+
+One leveled logger tree ("localchat.*") for the API, the assistant and the
+database helpers, replacing print() on the request path.
+
+- LOCALCHAT_LOG_LEVEL: DEBUG | INFO (default) | WARNING | ERROR. Result tables
+  and raw result previews are only rendered at DEBUG.
+- LOCALCHAT_LOG_SAMPLE: fraction (0-1) of per-request INFO/DEBUG records to
+  keep; records logged with `extra=SAMPLED`. Warnings and errors are never
+  sampled.
+- LOCALCHAT_LOG_FORMAT: "text" (default) or "json" (one object per line).
+- Output goes to stderr, which uvicorn and the start scripts leave attached.
+
+Messages use %-style arguments so they are only formatted when the record is
+emitted; `lazy(fn)` defers anything more expensive than that.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+from typing import Any, Callable
+
+LOG_CONFIG = {
+    "level": os.getenv("LOCALCHAT_LOG_LEVEL", "INFO").upper(),
+    "sample_rate": float(os.getenv("LOCALCHAT_LOG_SAMPLE", "1")),
+    "format": os.getenv("LOCALCHAT_LOG_FORMAT", "text").lower(),
+}
+
+ROOT_LOGGER = "localchat"
+# Per-request records: `log.info("...", x, extra=SAMPLED)`
+SAMPLED = {"sampled": True}
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s | %(message)s"
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled"}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class lazy:
+    """Defers an expensive message argument until the record is actually formatted"""
+
+    __slots__ = ("fn",)
+
+    def __init__(self, fn: Callable[[], Any]) -> None:
+        self.fn = fn
+
+    def __str__(self) -> str:
+        return str(self.fn())
+
+
+class _SampleFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = LOG_CONFIG["sample_rate"]
+        if rate >= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < rate
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: Any = None) -> logging.Logger:
+    """Attach the handler to the "localchat" logger (idempotent); `level` overrides LOCALCHAT_LOG_LEVEL"""
+    global _configured
+    root = logging.getLogger(ROOT_LOGGER)
+    with _configure_lock:
+        if not _configured:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(_JsonFormatter() if LOG_CONFIG["format"] == "json" else logging.Formatter(_TEXT_FORMAT))
+            handler.addFilter(_SampleFilter())
+            root.addHandler(handler)
+            root.propagate = False  # uvicorn configures the root logger too; don't print twice
+            _configured = True
+        root.setLevel(level if level is not None else LOG_CONFIG["level"])
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for one module: get_logger("sql_api") is "localchat.sql_api" """
+    if not _configured:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def debug_enabled(logger: logging.Logger) -> bool:
+    """True if `logger` emits DEBUG records (guards rendering of result tables)"""
+    return logger.isEnabledFor(logging.DEBUG)
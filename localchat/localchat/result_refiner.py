@@ -0,0 +1,270 @@
+"""
+Result Refiner
+
+Answers simple follow-ups over the previous result set without going back to
+the LLM or MySQL. The last result is held column-wise as NumPy arrays, and
+filter / sort / group / top-N refinements run as vectorized operations.
+
+Supported follow-ups (examples):
+- "only those from Bahrain", "only the ones where status is paid"
+- "only those with total_spent over 500"
+- "sort by total_spent", "order them by created_at desc"
+- "group that by country"
+- "top 5 by total_spent", "first 10"
+
+`refine()` returns None whenever the follow-up is not understood or refers to
+a column the previous result does not have; callers then regenerate SQL.
+"""
+
+from __future__ import annotations
+
+import re
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+
+# Results larger than this are not kept for local refinement
+MAX_REFINABLE_ROWS = 200_000
+
+_NUMERIC_TYPES = (int, float, Decimal)
+
+_REF = r"(?:(?:those|them|these|that|it|the ones|ones|rows|records|results)\s+)?"
+_FILTER_CMP_RE = re.compile(
+    r"^(?:only|just|filter(?:\s+to)?|keep)\s+" + _REF +
+    r"(?:with|where|having)\s+(?P<col>[\w ]+?)\s*"
+    r"(?P<op>>=|<=|>|<|=|over|above|greater than|more than|at least|under|below|less than|at most)\s*"
+    r"(?P<num>-?\d+(?:\.\d+)?)$",
+    re.IGNORECASE,
+)
+_FILTER_EQ_RE = re.compile(
+    r"^(?:only|just|filter(?:\s+to)?|keep)\s+" + _REF +
+    r"(?:where|with)\s+(?P<col>[\w ]+?)\s+(?:is|=|equals|equal to)\s+(?P<val>.+)$",
+    re.IGNORECASE,
+)
+_FILTER_FROM_RE = re.compile(
+    r"^(?:only|just|filter(?:\s+to)?|keep)\s+" + _REF + r"(?P<prep>from|in|for)\s+(?P<val>.+)$",
+    re.IGNORECASE,
+)
+_SORT_RE = re.compile(
+    r"^(?:now\s+)?(?:sort|order|sorted|ordered)\s+" + _REF +
+    r"by\s+(?P<col>[\w ]+?)(?:\s+(?P<dir>asc|ascending|desc|descending|highest first|lowest first))?$",
+    re.IGNORECASE,
+)
+_GROUP_RE = re.compile(r"^(?:now\s+)?(?:group|grouped|break down|breakdown)\s+" + _REF + r"by\s+(?P<col>[\w ]+)$", re.IGNORECASE)
+_TOP_RE = re.compile(
+    r"^(?:(?:show|give me|get)\s+)?(?:only\s+)?(?:the\s+)?(?P<kind>top|first|bottom)\s+(?P<n>\d+)"
+    r"(?:\s+" + _REF + r")?(?:\s+by\s+(?P<col>[\w ]+))?$",
+    re.IGNORECASE,
+)
+
+_OPS = {
+    ">": ">", "over": ">", "above": ">", "greater than": ">", "more than": ">",
+    ">=": ">=", "at least": ">=",
+    "<": "<", "under": "<", "below": "<", "less than": "<",
+    "<=": "<=", "at most": "<=",
+    "=": "=",
+}
+
+
+def _to_number(v: Any) -> float:
+    return float("nan") if v is None else float(v)
+
+
+class ColumnarResult:
+    """A result set stored column-wise; numeric columns become float arrays."""
+
+    def __init__(self, columns: Sequence[str], data: Dict[str, Any], n_rows: int) -> None:
+        self.columns = list(columns)
+        self.data = data
+        self.n_rows = n_rows
+        self._lower: Dict[str, Any] = {}
+        self._numeric: Dict[str, bool] = {}
+        self._floats: Dict[str, Any] = {}
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> "ColumnarResult":
+        n = len(rows)
+        data: Dict[str, Any] = {}
+        for i, col in enumerate(columns):
+            values = np.empty(n, dtype=object)
+            values[:] = [r[i] if i < len(r) else None for r in rows]
+            data[col] = values
+        return cls(columns, data, n)
+
+    def is_numeric(self, col: str) -> bool:
+        if col not in self._numeric:
+            self._numeric[col] = all(
+                v is None or (isinstance(v, _NUMERIC_TYPES) and not isinstance(v, bool)) for v in self.data[col]
+            )
+        return self._numeric[col]
+
+    def numeric(self, col: str) -> Any:
+        """Float view of a numeric column (NULL -> NaN), computed once and reused."""
+        if col not in self._floats:
+            self._floats[col] = np.array([_to_number(v) for v in self.data[col]], dtype=float)
+        return self._floats[col]
+
+    def lowered(self, col: str) -> Any:
+        """Lower-cased string view of a column, computed once and reused."""
+        if col not in self._lower:
+            self._lower[col] = np.array(["" if v is None else str(v).strip().lower() for v in self.data[col]], dtype=object)
+        return self._lower[col]
+
+    def take(self, index: Any) -> "ColumnarResult":
+        """Select rows by integer index array or boolean mask."""
+        data = {c: v[index] for c, v in self.data.items()}
+        n = len(next(iter(data.values()))) if data else 0
+        return ColumnarResult(self.columns, data, n)
+
+    def to_rows(self) -> List[Tuple[Any, ...]]:
+        if not self.columns:
+            return []
+        return list(zip(*(self.data[c].tolist() for c in self.columns)))
+
+
+class ResultRefiner:
+    """Parses refinement follow-ups and applies them to a ColumnarResult."""
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def parse(self, question: str) -> Optional[Dict[str, Any]]:
+        q = re.sub(r"\s+", " ", (question or "").strip()).rstrip(" .?!")
+        if not q:
+            return None
+        m = _FILTER_CMP_RE.match(q)
+        if m:
+            return {"op": "filter_cmp", "col": m.group("col"), "cmp": _OPS[m.group("op").lower()], "value": float(m.group("num"))}
+        m = _FILTER_EQ_RE.match(q)
+        if m:
+            return {"op": "filter_eq", "col": m.group("col"), "value": m.group("val").strip(" '\"")}
+        m = _FILTER_FROM_RE.match(q)
+        if m:
+            return {"op": "filter_value", "prep": m.group("prep").lower(), "value": m.group("val").strip(" '\"")}
+        m = _SORT_RE.match(q)
+        if m:
+            direction = (m.group("dir") or "asc").lower()
+            return {"op": "sort", "col": m.group("col"), "desc": direction.startswith("desc") or direction == "highest first"}
+        m = _GROUP_RE.match(q)
+        if m:
+            return {"op": "group", "col": m.group("col")}
+        m = _TOP_RE.match(q)
+        if m:
+            return {"op": "top", "n": int(m.group("n")), "col": m.group("col"), "desc": m.group("kind").lower() != "bottom"}
+        return None
+
+    def _resolve_column(self, result: ColumnarResult, name: Optional[str]) -> Optional[str]:
+        if not name:
+            return None
+        wanted = re.sub(r"\s+", "_", name.strip().lower())
+        by_lower = {c.lower(): c for c in result.columns}
+        if wanted in by_lower:
+            return by_lower[wanted]
+        # Accept an unambiguous partial name, e.g. "spent" -> total_spent
+        partial = [c for c in result.columns if wanted in c.lower()]
+        return partial[0] if len(partial) == 1 else None
+
+    def refine(self, result: ColumnarResult, question: str) -> Optional[Tuple[ColumnarResult, str]]:
+        """Apply a follow-up to `result`.
+
+        Returns (refined result, description) or None if the follow-up cannot be
+        answered from the columns already present.
+        """
+        if not self.available() or result is None:
+            return None
+        spec = self.parse(question)
+        if not spec:
+            return None
+        return self.apply(result, spec)
+
+    def apply(self, result: ColumnarResult, spec: Dict[str, Any]) -> Optional[Tuple[ColumnarResult, str]]:
+        op = spec["op"]
+        if op == "filter_value":
+            return self._filter_value(result, spec["value"])
+        if op == "filter_eq":
+            col = self._resolve_column(result, spec["col"])
+            if col is None:
+                return None
+            mask = result.lowered(col) == spec["value"].lower()
+            return result.take(mask), f"filter {col} = '{spec['value']}'"
+        if op == "filter_cmp":
+            col = self._resolve_column(result, spec["col"])
+            if col is None or not result.is_numeric(col):
+                return None
+            values = result.numeric(col)
+            ops = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal, "=": np.equal}
+            with np.errstate(invalid="ignore"):
+                mask = ops[spec["cmp"]](values, spec["value"])
+            return result.take(mask), f"filter {col} {spec['cmp']} {spec['value']:g}"
+        if op == "sort":
+            col = self._resolve_column(result, spec["col"])
+            if col is None:
+                return None
+            return result.take(self._order(result, col, spec["desc"])), f"sort by {col} {'DESC' if spec['desc'] else 'ASC'}"
+        if op == "group":
+            col = self._resolve_column(result, spec["col"])
+            if col is None:
+                return None
+            return self._group(result, col), f"group by {col}"
+        if op == "top":
+            n = spec["n"]
+            if spec.get("col"):
+                col = self._resolve_column(result, spec["col"])
+                if col is None:
+                    return None
+                index = self._order(result, col, spec["desc"])[:n]
+                return result.take(index), f"top {n} by {col}"
+            index = np.arange(result.n_rows)
+            index = index[:n] if spec["desc"] else index[::-1][:n]
+            return result.take(index), f"first {n} rows"
+        return None
+
+    def _filter_value(self, result: ColumnarResult, value: str) -> Optional[Tuple[ColumnarResult, str]]:
+        """Filter on whichever text column holds `value` (e.g. country for "from Bahrain")."""
+        needle = value.lower()
+        candidates = [c for c in result.columns if not result.is_numeric(c)]
+        best, best_mask = None, None
+        for col in candidates:
+            mask = result.lowered(col) == needle
+            if mask.any() and (best_mask is None or mask.sum() > best_mask.sum()):
+                best, best_mask = col, mask
+        if best is not None:
+            return result.take(best_mask), f"filter {best} = '{value}'"
+        # Not a value of any column ("from last month", "in stock"): let SQL generation answer it
+        return None
+
+    def _order(self, result: ColumnarResult, col: str, desc: bool) -> Any:
+        if result.is_numeric(col):
+            keys = result.numeric(col)
+            # NaN (NULL) always sorts last
+            keys = np.where(np.isnan(keys), -np.inf if desc else np.inf, keys)
+            order = np.argsort(-keys if desc else keys, kind="stable")
+        else:
+            keys = result.lowered(col).astype(str)
+            order = np.argsort(keys, kind="stable")
+            if desc:
+                order = order[::-1]
+        return order
+
+    def _group(self, result: ColumnarResult, col: str) -> ColumnarResult:
+        raw = result.data[col]
+        keys = np.array(["" if v is None else str(v) for v in raw], dtype=object).astype(str)
+        uniques, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(uniques))
+        columns = [col, "count"]
+        data: Dict[str, Any] = {col: raw[first_index], "count": counts.astype(object)}
+        for other in result.columns:
+            if other == col or other.lower() == "id" or other.lower().endswith("_id") or not result.is_numeric(other):
+                continue
+            values = np.nan_to_num(result.numeric(other))
+            name = f"sum_{other}"
+            columns.append(name)
+            data[name] = np.round(np.bincount(inverse, weights=values, minlength=len(uniques)), 2).astype(object)
+        order = np.argsort(-counts, kind="stable")
+        return ColumnarResult(columns, {c: v[order] for c, v in data.items()}, len(uniques))
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Materialized Rollups
+
+Summary tables for the analytic questions (aggregations, time series, store
+analytics) that otherwise scan orders, order_items and customers on every ask.
+
+rollup_daily_store_country holds, per store_id, calendar day and country:
+- orders_count, revenue (SUM orders.total_price), items_sold (SUM order_items.quantity)
+- new_customers (customers created that day)
+
+Order country comes from the shipping address; customer country from the
+customer record. Refresh is incremental: every (store_id, day) touched by an
+order, line item or customer whose `synced_at` is at or after the last
+watermark is recomputed in one transaction, so readers never see a half
+refreshed day. The first run (or --full) rebuilds everything.
+
+Usage:
+    python rollups.py            # incremental refresh
+    python rollups.py --full     # rebuild from scratch
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from log_config import get_logger
+
+log = get_logger("rollups")
+
+ROLLUP_TABLE = "rollup_daily_store_country"
+STATE_TABLE = "rollup_state"
+
+# Appended to the schema prompt once the rollup table exists
+ROLLUP_PROMPT = f"""
+## PRECOMPUTED ROLLUPS (prefer these for aggregates)
+📋 **{ROLLUP_TABLE}**: one row per (store_id, day, country) with orders_count, revenue,
+items_sold and new_customers; refreshed after every store sync.
+- Use it for revenue / order counts / items sold / new customers by day, week, month, store or country
+  (e.g. SUM(revenue) ... GROUP BY store_id; SUM(orders_count) ... WHERE day >= CURDATE() - INTERVAL 30 DAY)
+- country is '' when unknown; join stores on store_id for store_name
+- Query the base tables only for per-order or per-customer detail, or filters the rollup does not carry
+"""
+
+_DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        store_id VARCHAR(100) NOT NULL,
+        day DATE NOT NULL,
+        country VARCHAR(100) NOT NULL DEFAULT '',
+        orders_count INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(16,2) NOT NULL DEFAULT 0,
+        items_sold INT NOT NULL DEFAULT 0,
+        new_customers INT NOT NULL DEFAULT 0,
+        refreshed_at DATETIME NOT NULL,
+        PRIMARY KEY (store_id, day, country),
+        KEY idx_rollup_day (day),
+        KEY idx_rollup_country (country)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        name VARCHAR(64) PRIMARY KEY,
+        watermark DATETIME NULL,
+        refreshed_at DATETIME NULL,
+        days_refreshed INT NOT NULL DEFAULT 0,
+        duration_ms INT NOT NULL DEFAULT 0
+    )""",
+)
+
+# Affected (store_id, day) keys; a temporary table is per connection, so refreshes never collide
+_KEYS_DDL = (
+    "CREATE TEMPORARY TABLE IF NOT EXISTS _rollup_keys ("
+    " store_id VARCHAR(100) NOT NULL, day DATE NOT NULL, PRIMARY KEY (store_id, day))"
+)
+
+_KEY_SOURCES = (
+    "INSERT IGNORE INTO _rollup_keys SELECT store_id, DATE(created_at) FROM orders"
+    " WHERE created_at IS NOT NULL {where}",
+    "INSERT IGNORE INTO _rollup_keys SELECT o.store_id, DATE(o.created_at) FROM order_items oi"
+    " JOIN orders o ON o.order_id = oi.order_id WHERE o.created_at IS NOT NULL {where_items}",
+    "INSERT IGNORE INTO _rollup_keys SELECT store_id, DATE(created_at) FROM customers"
+    " WHERE created_at IS NOT NULL {where}",
+)
+
+# MySQL cannot open a temporary table twice in one statement, so each measure is its own upsert
+_REBUILD = (
+    f"""DELETE r FROM {ROLLUP_TABLE} r
+        JOIN _rollup_keys k ON k.store_id = r.store_id AND k.day = r.day""",
+    f"""INSERT INTO {ROLLUP_TABLE} (store_id, day, country, orders_count, revenue, refreshed_at)
+        SELECT o.store_id, DATE(o.created_at), COALESCE(os.country, ''), COUNT(*), COALESCE(SUM(o.total_price), 0), NOW()
+        FROM orders o
+        JOIN _rollup_keys k ON k.store_id = o.store_id AND k.day = DATE(o.created_at)
+        LEFT JOIN order_shipping os ON os.order_id = o.order_id
+        GROUP BY o.store_id, DATE(o.created_at), COALESCE(os.country, '')""",
+    f"""INSERT INTO {ROLLUP_TABLE} (store_id, day, country, items_sold, refreshed_at)
+        SELECT o.store_id, DATE(o.created_at), COALESCE(os.country, ''), COALESCE(SUM(oi.quantity), 0), NOW()
+        FROM order_items oi
+        JOIN orders o ON o.order_id = oi.order_id
+        JOIN _rollup_keys k ON k.store_id = o.store_id AND k.day = DATE(o.created_at)
+        LEFT JOIN order_shipping os ON os.order_id = o.order_id
+        GROUP BY o.store_id, DATE(o.created_at), COALESCE(os.country, '')
+        ON DUPLICATE KEY UPDATE items_sold = VALUES(items_sold)""",
+    f"""INSERT INTO {ROLLUP_TABLE} (store_id, day, country, new_customers, refreshed_at)
+        SELECT c.store_id, DATE(c.created_at), COALESCE(c.country, ''), COUNT(*), NOW()
+        FROM customers c
+        JOIN _rollup_keys k ON k.store_id = c.store_id AND k.day = DATE(c.created_at)
+        GROUP BY c.store_id, DATE(c.created_at), COALESCE(c.country, '')
+        ON DUPLICATE KEY UPDATE new_customers = VALUES(new_customers)""",
+)
+
+
+class RollupManager:
+    """Creates and refreshes the rollup tables over a mysql.connector connection."""
+
+    def __init__(self, connect: Callable[[], Any],
+                 on_refresh: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        """`connect` returns a new mysql.connector connection; one is opened per refresh.
+        `on_refresh` is called after every successful refresh (e.g. to drop cached counts).
+        """
+        self.connect = connect
+        self.on_refresh = on_refresh
+        self._lock = threading.Lock()
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def ensure_tables(self, conn: Any) -> None:
+        cursor = conn.cursor()
+        for ddl in _DDL:
+            cursor.execute(ddl)
+        cursor.close()
+        conn.commit()
+
+    def refresh(self, full: bool = False) -> Dict[str, Any]:
+        """Recompute every (store_id, day) touched since the last watermark.
+
+        Returns a summary; concurrent callers get {"status": "busy"} instead of
+        running a second refresh.
+        """
+        if not self._lock.acquire(blocking=False):
+            return {"status": "busy"}
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self.connect()
+            self.ensure_tables(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT NOW()")
+            new_watermark = cursor.fetchone()[0]
+            cursor.execute(f"SELECT watermark FROM {STATE_TABLE} WHERE name = %s", (ROLLUP_TABLE,))
+            row = cursor.fetchone()
+            watermark = None if full or not row else row[0]
+
+            # Everything below is one transaction (autocommit is off); the watermark moves with the data
+            cursor.execute(_KEYS_DDL)
+            cursor.execute("DELETE FROM _rollup_keys")
+            if watermark is None:
+                where, where_items, params = "", "", ()
+            else:
+                where, where_items, params = "AND synced_at >= %s", "AND oi.synced_at >= %s", (watermark,)
+            for sql in _KEY_SOURCES:
+                cursor.execute(sql.format(where=where, where_items=where_items), params)
+            if watermark is None:
+                cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+            cursor.execute("SELECT COUNT(*) FROM _rollup_keys")
+            days = int(cursor.fetchone()[0])
+            if days:
+                for sql in _REBUILD:
+                    cursor.execute(sql)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            cursor.execute(
+                f"INSERT INTO {STATE_TABLE} (name, watermark, refreshed_at, days_refreshed, duration_ms)"
+                " VALUES (%s, %s, NOW(), %s, %s) ON DUPLICATE KEY UPDATE watermark = VALUES(watermark),"
+                " refreshed_at = VALUES(refreshed_at), days_refreshed = VALUES(days_refreshed),"
+                " duration_ms = VALUES(duration_ms)",
+                (ROLLUP_TABLE, new_watermark, days, duration_ms),
+            )
+            conn.commit()
+            cursor.close()
+            self.last_result = {
+                "status": "ok",
+                "mode": "full" if watermark is None else "incremental",
+                "since": str(watermark) if watermark else None,
+                "days_refreshed": days,
+                "duration_ms": duration_ms,
+            }
+            log.info("✅ Rollups refreshed (%s): %d store-days in %dms", self.last_result["mode"], days, duration_ms)
+            if self.on_refresh:
+                self.on_refresh(self.last_result)
+            return self.last_result
+        except Exception as e:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            self.last_result = {"status": "error", "error": str(e)}
+            log.error("❌ Rollup refresh failed: %s", e)
+            return self.last_result
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._lock.release()
+
+    def refresh_async(self, full: bool = False) -> bool:
+        """Start a refresh in the background; False if one is already running."""
+        if self.running:
+            return False
+        threading.Thread(target=self.refresh, kwargs={"full": full}, daemon=True, name="rollup-refresh").start()
+        return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Refresh the rollup tables")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of since the last watermark")
+    args = parser.parse_args()
+
+    import mysql.connector
+
+    def connect() -> Any:
+        return mysql.connector.connect(
+            host=os.getenv("DB_HOST", "43.225.53.118"),
+            user=os.getenv("DB_USER", "staging_sony_centeral"),
+            password=os.getenv("DB_PASSWORD", "sony_centeralsony_centeral"),
+            database=os.getenv("DB_NAME", "staging_central_hub"),
+            ssl_disabled=True,
+        )
+
+    print(RollupManager(connect).refresh(full=args.full))
+
+
+if __name__ == "__main__":
+    main()
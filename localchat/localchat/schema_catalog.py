@@ -0,0 +1,535 @@
+"""
+Schema Catalog
+
+Structured description of the database schema (columns, keys, indexes, foreign
+keys, row estimates), read with four bulk information_schema queries instead
+of reflecting every table and sampling its rows.
+
+The catalog is cached on disk (SCHEMA_CACHE_CONFIG["path"]) together with a
+checksum of the schema. A warm start loads the file and runs one checksum
+query: if it matches, the cached catalog is used as is; otherwise the catalog
+is re-read and the file rewritten. If the database is unreachable the cached
+catalog is still returned, marked stale.
+
+Catalog layout (JSON-serializable):
+    {"version": 1, "database": "...", "checksum": "...", "built_at": 1700000000.0,
+     "tables": {"orders": {"type": "BASE TABLE", "rows": 1234, "comment": "",
+                           "columns": [{"name", "type", "nullable", "key", "default", "extra", "comment"}],
+                           "primary_key": ["order_id"],
+                           "indexes": {"idx_store": {"columns": ["store_id"], "unique": false}},
+                           "foreign_keys": [{"name", "columns", "ref_table", "ref_columns"}]}}}
+"""
+
+from __future__ import annotations
+
+import difflib
+import json
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log_config import get_logger
+
+log = get_logger("schema_catalog")
+
+Executor = Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]
+
+CACHE_VERSION = 1
+
+SCHEMA_CACHE_CONFIG = {
+    "enabled": os.getenv("SCHEMA_CACHE", "1") not in ("0", "false", "False"),
+    "path": os.getenv("SCHEMA_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_cache.json")),
+}
+
+_TABLES_SQL = (
+    "SELECT table_name, table_type, table_rows, table_comment FROM information_schema.tables"
+    " WHERE table_schema = DATABASE()"
+)
+_COLUMNS_SQL = (
+    "SELECT table_name, column_name, column_type, is_nullable, column_key, column_default, extra, column_comment"
+    " FROM information_schema.columns WHERE table_schema = DATABASE() ORDER BY table_name, ordinal_position"
+)
+_INDEXES_SQL = (
+    "SELECT table_name, index_name, non_unique, column_name FROM information_schema.statistics"
+    " WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"
+)
+_FOREIGN_KEYS_SQL = (
+    "SELECT table_name, constraint_name, column_name, referenced_table_name, referenced_column_name"
+    " FROM information_schema.key_column_usage"
+    " WHERE table_schema = DATABASE() AND referenced_table_name IS NOT NULL"
+    " ORDER BY table_name, constraint_name, ordinal_position"
+)
+# One round trip; changes to any column, index or table change the result. Row counts are left out.
+CHECKSUM_SQL = (
+    "SELECT DATABASE(),"
+    " (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', table_name, table_type))), 0) FROM information_schema.tables"
+    "  WHERE table_schema = DATABASE()),"
+    " (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', table_name, column_name, ordinal_position, column_type,"
+    "   is_nullable, column_key, IFNULL(column_default, ''), extra))), 0) FROM information_schema.columns"
+    "  WHERE table_schema = DATABASE()),"
+    " (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', table_name, index_name, seq_in_index, column_name, non_unique))), 0)"
+    "  FROM information_schema.statistics WHERE table_schema = DATABASE()),"
+    " (SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', table_name, constraint_name, column_name, referenced_table_name,"
+    "   referenced_column_name))), 0) FROM information_schema.key_column_usage"
+    "  WHERE table_schema = DATABASE() AND referenced_table_name IS NOT NULL)"
+)
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", "replace")
+    return "" if value is None else str(value)
+
+
+def schema_checksum(execute: Executor) -> Tuple[str, str]:
+    """(database name, checksum) from a single query"""
+    _, rows = execute(CHECKSUM_SQL)
+    database, *parts = rows[0]
+    return _text(database), ":".join(str(int(p or 0)) for p in parts)
+
+
+def introspect(execute: Executor, checksum: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """Read the whole schema with four bulk information_schema queries
+
+    `checksum` is the (database, checksum) pair if the caller already has it.
+    """
+    database, checksum = checksum or schema_checksum(execute)
+    tables: Dict[str, Dict[str, Any]] = {}
+
+    _, rows = execute(_TABLES_SQL)
+    for name, table_type, table_rows, comment in rows:
+        tables[_text(name)] = {
+            "type": _text(table_type), "rows": int(table_rows) if table_rows is not None else None,
+            "comment": _text(comment), "columns": [], "primary_key": [], "indexes": {}, "foreign_keys": [],
+        }
+
+    _, rows = execute(_COLUMNS_SQL)
+    for table, column, column_type, nullable, key, default, extra, comment in rows:
+        entry = tables.get(_text(table))
+        if entry is None:
+            continue
+        entry["columns"].append({
+            "name": _text(column), "type": _text(column_type), "nullable": _text(nullable) == "YES",
+            "key": _text(key), "default": None if default is None else _text(default),
+            "extra": _text(extra), "comment": _text(comment),
+        })
+
+    _, rows = execute(_INDEXES_SQL)
+    for table, index, non_unique, column in rows:
+        entry = tables.get(_text(table))
+        if entry is None:
+            continue
+        index = _text(index)
+        spec = entry["indexes"].setdefault(index, {"columns": [], "unique": not int(non_unique)})
+        spec["columns"].append(_text(column))
+        if index == "PRIMARY":
+            entry["primary_key"].append(_text(column))
+
+    _, rows = execute(_FOREIGN_KEYS_SQL)
+    for table, constraint, column, ref_table, ref_column in rows:
+        entry = tables.get(_text(table))
+        if entry is None:
+            continue
+        fks = entry["foreign_keys"]
+        if not fks or fks[-1]["name"] != _text(constraint):
+            fks.append({"name": _text(constraint), "columns": [], "ref_table": _text(ref_table), "ref_columns": []})
+        fks[-1]["columns"].append(_text(column))
+        fks[-1]["ref_columns"].append(_text(ref_column))
+
+    return {"version": CACHE_VERSION, "database": database, "checksum": checksum,
+            "built_at": time.time(), "tables": tables}
+
+
+def render_structure(name: str, table: Dict[str, Any]) -> str:
+    """CREATE TABLE text for one catalog table (prompt and legacy structure field)"""
+    lines = []
+    for col in table["columns"]:
+        line = f"\t{col['name']} {col['type'].upper()}"
+        if not col["nullable"]:
+            line += " NOT NULL"
+        if col["default"] is not None:
+            line += f" DEFAULT {col['default']}"
+        if "auto_increment" in col["extra"]:
+            line += " AUTO_INCREMENT"
+        lines.append(line)
+    if table["primary_key"]:
+        lines.append(f"\tPRIMARY KEY ({', '.join(table['primary_key'])})")
+    for index, spec in table["indexes"].items():
+        if index != "PRIMARY":
+            lines.append(f"\t{'UNIQUE ' if spec['unique'] else ''}KEY {index} ({', '.join(spec['columns'])})")
+    for fk in table["foreign_keys"]:
+        lines.append(f"\tFOREIGN KEY({', '.join(fk['columns'])}) REFERENCES {fk['ref_table']} ({', '.join(fk['ref_columns'])})")
+    return f"CREATE TABLE {name} (\n" + ",\n".join(lines) + "\n)"
+
+
+def read_cache(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    path = path or SCHEMA_CACHE_CONFIG["path"]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(catalog, dict) or catalog.get("version") != CACHE_VERSION or "tables" not in catalog:
+        return None
+    return catalog
+
+
+def write_cache(catalog: Dict[str, Any], path: Optional[str] = None) -> None:
+    """Atomic write, so a concurrent reader never sees a partial file"""
+    path = path or SCHEMA_CACHE_CONFIG["path"]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(catalog, f, separators=(",", ":"), default=str)
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning("Could not write schema cache %s: %s", path, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def load_catalog(execute: Optional[Executor], path: Optional[str] = None,
+                 use_cache: Optional[bool] = None) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Return (catalog, source), source being "cache", "database", "stale-cache" or "unavailable".
+
+    `execute` may be None when there is no connection; the cached catalog is
+    then returned unvalidated.
+    """
+    use_cache = SCHEMA_CACHE_CONFIG["enabled"] if use_cache is None else use_cache
+    cached = read_cache(path) if use_cache else None
+    if execute is None:
+        return (cached, "stale-cache") if cached else (None, "unavailable")
+    try:
+        current = None
+        if cached:
+            current = schema_checksum(execute)
+            if (cached.get("database"), cached.get("checksum")) == current:
+                return cached, "cache"
+        catalog = introspect(execute, current)
+    except Exception as e:
+        log.warning("Schema introspection failed: %s", e)
+        return (cached, "stale-cache") if cached else (None, "unavailable")
+    if use_cache:
+        write_cache(catalog, path)
+    return catalog, "database"
+
+
+# ---------------------------------------------------------------------------
+# Indexed view used by the validator, the auto-fixer and the prompt builder
+# ---------------------------------------------------------------------------
+
+_OPAQUE_SCHEMAS = frozenset(("information_schema", "mysql", "performance_schema", "sys"))
+# MySQL's dummy table: SELECT 1 FROM DUAL
+_PSEUDO_TABLES = frozenset(("dual",))
+_STRUCTURE_SKIP = frozenset(("primary", "key", "unique", "foreign", "constraint", "index", "fulltext", "create", "check"))
+_COMMENT_RE = re.compile(r"/\*.*?\*/|(?:--|#)[^\n]*", re.DOTALL)
+_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_TABLE_REF_RE = re.compile(
+    r"\b(from|join)\s+`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?(?:\s+(?:as\s+)?`?(\w+)`?)?", re.IGNORECASE
+)
+# Further tables of a comma join: FROM orders o, customers c
+_COMMA_TABLE_RE = re.compile(r"\s*,\s*`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?(?:\s+(?:as\s+)?`?(\w+)`?)?", re.IGNORECASE)
+_CTE_RE = re.compile(r"(?:\bwith(?:\s+recursive)?|,)\s+`?(\w+)`?\s*(?:\([^)]*\)\s*)?as\s*\(", re.IGNORECASE)
+_DERIVED_ALIAS_RE = re.compile(r"\s+(?:as\s+)?`?(\w+)`?", re.IGNORECASE)
+_QUALIFIED_RE = re.compile(r"(?<![\w.`])`?([A-Za-z_]\w*)`?\s*\.\s*`?(\w+|\*)`?")
+_SELECT_LIST_RE = re.compile(r"^\s*select\s+(?:distinct\s+)?(.*?)\s+from\b", re.IGNORECASE | re.DOTALL)
+_BARE_IDENT_RE = re.compile(r"^`?([A-Za-z_]\w*)`?$")
+_ALIAS_TAIL_RE = re.compile(r"\s+(?:as\s+)?`?\w+`?$", re.IGNORECASE)
+_NOT_ALIAS = frozenset((
+    "where", "on", "using", "join", "inner", "left", "right", "outer", "cross", "natural", "straight_join",
+    "group", "order", "limit", "having", "union", "window", "for", "lock", "into", "set", "select", "as",
+))
+_KEYWORDS = frozenset(("null", "true", "false", "current_date", "current_timestamp", "current_time", "now"))
+
+
+def _innermost_parens(sql: str) -> List[int]:
+    """For each position, the index of the innermost unclosed '(' before it (-1 at top level)"""
+    out, stack = [], []
+    for i, ch in enumerate(sql):
+        out.append(stack[-1] if stack else -1)
+        if ch == "(":
+            stack.append(i)
+        elif ch == ")" and stack:
+            stack.pop()
+    return out
+
+
+def _derived_aliases(sql: str) -> List[str]:
+    """Aliases of (SELECT ...) subqueries used as tables"""
+    out, stack = [], []
+    for i, ch in enumerate(sql):
+        if ch == "(":
+            stack.append(i)
+        elif ch == ")" and stack:
+            start = stack.pop()
+            if re.match(r"\s*select\b", sql[start + 1:i], re.IGNORECASE):
+                m = _DERIVED_ALIAS_RE.match(sql, i + 1)
+                if m and m.group(1).lower() not in _NOT_ALIAS:
+                    out.append(m.group(1))
+    return out
+
+
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(text):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+class QueryRefs:
+    """Tables and aliases referenced by one query"""
+    __slots__ = ("aliases", "tables", "unknown_tables", "opaque", "ambiguous")
+
+    def __init__(self) -> None:
+        self.aliases: Dict[str, str] = {}   # lower alias or table name -> catalog table name
+        self.tables: List[str] = []         # catalog tables in query order
+        self.unknown_tables: List[str] = []
+        self.opaque: set = set()            # lower names of CTEs, derived tables and system tables
+        self.ambiguous: set = set()         # lower aliases bound to different tables (e.g. reused in a subquery)
+
+    def bind(self, name: str, table: str) -> None:
+        """Map an alias to a table; an alias bound to two different tables resolves to nothing"""
+        key = name.lower()
+        if key in self.ambiguous:
+            return
+        if self.aliases.setdefault(key, table) != table:
+            del self.aliases[key]
+            self.ambiguous.add(key)
+
+
+class CatalogIndex:
+    """Hash-indexed schema: column sets and types, keys, indexes and a join graph.
+
+    Built once per schema state, never modified. Table names keep their
+    catalog spelling; column lookups are case-insensitive like MySQL's.
+    """
+
+    def __init__(self) -> None:
+        self.tables: Dict[str, str] = {}                   # lower name -> name
+        self.column_names: Dict[str, Tuple[str, ...]] = {}  # table -> columns in ordinal order
+        self.columns: Dict[str, frozenset] = {}            # table -> lower column names
+        self.column_types: Dict[str, Dict[str, str]] = {}  # table -> lower column -> type
+        self.primary_keys: Dict[str, Tuple[str, ...]] = {}
+        self.unique_keys: Dict[str, List[Tuple[str, ...]]] = {}
+        self.indexes: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self.column_owners: Dict[str, frozenset] = {}      # lower column -> tables that have it
+        # table -> [(column, other table, other column, declared)]; both directions of every edge
+        self.join_graph: Dict[str, List[Tuple[str, str, str, bool]]] = {}
+
+    # -- construction ------------------------------------------------------
+
+    @classmethod
+    def from_catalog(cls, catalog: Dict[str, Any]) -> "CatalogIndex":
+        index = cls()
+        for name, table in catalog.get("tables", {}).items():
+            index._add_table(name, [(c["name"], c["type"]) for c in table["columns"]], table["primary_key"])
+            index.indexes[name] = {k: tuple(v["columns"]) for k, v in table["indexes"].items()}
+            index.unique_keys[name] = [tuple(v["columns"]) for k, v in table["indexes"].items() if v["unique"] and k != "PRIMARY"]
+        edges = [(name, fk["columns"][0], fk["ref_table"], fk["ref_columns"][0])
+                 for name, table in catalog.get("tables", {}).items()
+                 for fk in table["foreign_keys"] if len(fk["columns"]) == 1]
+        index._finish(edges)
+        return index
+
+    @classmethod
+    def from_structures(cls, schema_info: Dict[str, Dict[str, Any]]) -> "CatalogIndex":
+        """Best-effort index from CREATE TABLE text (table_info and fallback states)"""
+        index = cls()
+        for name, info in (schema_info or {}).items():
+            columns, primary_key = [], []
+            for line in str(info.get("structure", "")).splitlines():
+                m = re.match(r"\s*`?(\w+)`?\s+([A-Za-z]+(?:\s*\([^)]*\))?(?:\s+unsigned)?)", line, re.IGNORECASE)
+                if not m or m.group(1).lower() in _STRUCTURE_SKIP:
+                    pk = re.match(r"\s*primary\s+key\s*\(([^)]*)\)", line, re.IGNORECASE)
+                    if pk:
+                        primary_key = [c.strip(" `") for c in pk.group(1).split(",")]
+                    continue
+                columns.append((m.group(1), m.group(2).lower()))
+                if re.search(r"\bprimary\s+key\b", line, re.IGNORECASE):
+                    primary_key = [m.group(1)]
+            index._add_table(name, columns, primary_key)
+            index.indexes[name] = {}
+            index.unique_keys[name] = []
+        index._finish([])
+        return index
+
+    def _add_table(self, name: str, columns: List[Tuple[str, str]], primary_key: List[str]) -> None:
+        self.tables[name.lower()] = name
+        self.column_names[name] = tuple(c for c, _ in columns)
+        self.columns[name] = frozenset(c.lower() for c, _ in columns)
+        self.column_types[name] = {c.lower(): t for c, t in columns}
+        self.primary_keys[name] = tuple(primary_key)
+
+    def _finish(self, declared: List[Tuple[str, str, str, str]]) -> None:
+        owners: Dict[str, set] = {}
+        for table, cols in self.columns.items():
+            for col in cols:
+                owners.setdefault(col, set()).add(table)
+        self.column_owners = {c: frozenset(t) for c, t in owners.items()}
+
+        # Undeclared `<x>_id` columns join to the table whose primary or unique key is that column
+        keyed: Dict[str, str] = {}
+        for table, pk in self.primary_keys.items():
+            if len(pk) == 1 and pk[0].lower().endswith("_id"):
+                keyed.setdefault(pk[0].lower(), table)
+        for table, uniques in self.unique_keys.items():
+            for key in uniques:
+                if len(key) == 1 and key[0].lower().endswith("_id"):
+                    keyed.setdefault(key[0].lower(), table)
+        seen = {(t, c.lower()) for t, c, _, _ in declared}
+        edges = [(t, c, rt, rc, True) for t, c, rt, rc in declared]
+        for table, cols in self.columns.items():
+            for col in cols:
+                target = keyed.get(col)
+                if target and target != table and (table, col) not in seen:
+                    edges.append((table, col, target, col, False))
+
+        graph: Dict[str, List[Tuple[str, str, str, bool]]] = {t: [] for t in self.columns}
+        for table, col, ref_table, ref_col, is_declared in edges:
+            if ref_table not in graph:
+                continue
+            graph[table].append((col, ref_table, ref_col, is_declared))
+            graph[ref_table].append((ref_col, table, col, is_declared))
+        self.join_graph = graph
+
+    # -- lookups -----------------------------------------------------------
+
+    def table(self, name: str) -> Optional[str]:
+        """Catalog spelling of a table name, or None"""
+        return self.tables.get(name.lower())
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column.lower() in self.columns.get(table, ())
+
+    def tables_with_column(self, column: str) -> frozenset:
+        return self.column_owners.get(column.lower(), frozenset())
+
+    def column_type(self, table: str, column: str) -> Optional[str]:
+        return self.column_types.get(table, {}).get(column.lower())
+
+    def join_keys(self, left: str, right: str) -> List[Tuple[str, str]]:
+        """(left column, right column) pairs that join the two tables directly"""
+        return [(col, other_col) for col, other, other_col, _ in self.join_graph.get(left, []) if other == right]
+
+    def closest_column(self, table: str, column: str, cutoff: float = 0.75) -> Optional[str]:
+        """Most likely intended column: a unique one it abbreviates (total -> total_price), else the closest spelling"""
+        wanted = column.lower()
+        columns = self.column_names.get(table, ())
+        prefixed = [c for c in columns if c.lower().startswith(wanted + "_")]
+        if len(prefixed) == 1:
+            return prefixed[0]
+        match = difflib.get_close_matches(wanted, [c.lower() for c in columns], n=1, cutoff=cutoff)
+        return next((c for c in columns if c.lower() == match[0]), None) if match else None
+
+    # -- SQL checks --------------------------------------------------------
+
+    def references(self, sql: str) -> QueryRefs:
+        """Resolve the tables and aliases of a query (comments and literals removed)"""
+        text = _LITERAL_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+        refs = QueryRefs()
+        refs.opaque.update(m.group(1).lower() for m in _CTE_RE.finditer(text))
+        refs.opaque.update(a.lower() for a in _derived_aliases(text))
+        parens = _innermost_parens(text)
+        for m in _TABLE_REF_RE.finditer(text):
+            open_at = parens[m.start()]
+            # EXTRACT(YEAR FROM x), TRIM(... FROM x): FROM inside a call that is not a subquery
+            if open_at >= 0 and not re.search(r"\bselect\b", text[open_at:m.start()], re.IGNORECASE):
+                continue
+            self._add_reference(refs, m.group(2), m.group(3), m.group(4))
+            end = m.end()
+            while True:
+                more = _COMMA_TABLE_RE.match(text, end)
+                if not more:
+                    break
+                self._add_reference(refs, more.group(1), more.group(2), more.group(3))
+                end = more.end()
+        return refs
+
+    def _add_reference(self, refs: QueryRefs, first: str, second: Optional[str], alias: Optional[str]) -> None:
+        alias = alias if alias and alias.lower() not in _NOT_ALIAS else None
+        if second and first.lower() in _OPAQUE_SCHEMAS:
+            refs.opaque.add((alias or second).lower())
+            return
+        name = second or first
+        if not second and name.lower() in _PSEUDO_TABLES:
+            refs.opaque.add(name.lower())
+            return
+        if name.lower() in refs.opaque:
+            if alias:
+                refs.opaque.add(alias.lower())
+            return
+        table = self.table(name)
+        if table is None:
+            refs.unknown_tables.append(name)
+            return
+        if table not in refs.tables:
+            refs.tables.append(table)
+        refs.bind(name, table)
+        if alias:
+            refs.bind(alias, table)
+
+    def check_sql(self, sql: str) -> Optional[str]:
+        """First schema problem in a query, or None.
+
+        Checks referenced tables, every alias.column reference and bare
+        column names in the outer select list. Anything it cannot resolve
+        (CTEs, derived tables, system schemas, DUAL, unknown qualifiers and
+        aliases reused for different tables) is skipped rather than
+        reported, so a reported problem is a real one.
+        """
+        refs = self.references(sql)
+        if refs.unknown_tables:
+            return f"Table '{refs.unknown_tables[0]}' not found in schema."
+        text = _LITERAL_RE.sub("''", _COMMENT_RE.sub(" ", sql))
+        for m in _QUALIFIED_RE.finditer(text):
+            table = refs.aliases.get(m.group(1).lower())
+            column = m.group(2)
+            if table and column != "*" and not self.has_column(table, column):
+                return f"Column '{m.group(1)}.{column}' not found in table '{table}'."
+        if refs.opaque or not refs.tables:
+            return None
+        select_list = _SELECT_LIST_RE.match(text)
+        if not select_list:
+            return None
+        for item in _split_top_level(select_list.group(1)):
+            item = item.strip()
+            bare = _BARE_IDENT_RE.match(item) or _BARE_IDENT_RE.match(_ALIAS_TAIL_RE.sub("", item))
+            if not bare or bare.group(1).lower() in _KEYWORDS:
+                continue
+            column = bare.group(1)
+            if not any(self.has_column(t, column) for t in refs.tables):
+                return f"Column '{column}' not found in referenced tables."
+        return None
+
+    def suggest_column_fix(self, sql: str, reference: str) -> Optional[str]:
+        """Replacement for a column reference the database rejected ('o.total' -> 'o.total_price')"""
+        refs = self.references(sql)
+        qualifier, _, column = reference.rpartition(".")
+        if qualifier:
+            table = refs.aliases.get(qualifier.lower())
+            if not table:
+                return None
+            closest = self.closest_column(table, column)
+            if closest:
+                return f"{qualifier}.{closest}"
+            # Right column, wrong table: use the alias of the query table that has it
+            # (its real alias if it has one; MySQL rejects the table name once aliased)
+            for alias, other in sorted(refs.aliases.items(), key=lambda a: a[0] == a[1].lower()):
+                if other != table and self.has_column(other, column):
+                    return f"{alias}.{column}"
+            return None
+        for table in refs.tables:
+            closest = self.closest_column(table, column)
+            if closest:
+                return closest
+        return None
@@ -0,0 +1,209 @@
+"""
+Session Store
+
+Restart-safe conversation state for the DB assistant.
+Sessions are keyed by the same chat id the Next.js app writes to
+`chat_messages`, so a follow-up that lands on another worker (or after a
+restart) still sees the previous turns and display preferences.
+
+Backends:
+- SQLiteSessionStore (default): embedded SQLite file in WAL mode, shared by all
+  worker processes on the box
+- InMemorySessionStore: per-process dict, useful for the REPL and tests
+"""
+
+from __future__ import annotations
+
+import abc
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Defaults can be overridden through the environment
+SESSION_CONFIG = {
+    "backend": os.getenv("SESSION_STORE", "sqlite"),
+    "db_path": os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db")),
+    "ttl_seconds": int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+    "max_history": int(os.getenv("SESSION_MAX_HISTORY", "10")),
+    "cleanup_interval": int(os.getenv("SESSION_CLEANUP_INTERVAL", "600")),
+}
+
+# Only these response fields are needed to rebuild context on a follow-up.
+# Result rows are deliberately not persisted: they are large and not JSON-safe.
+_PERSISTED_RESPONSE_KEYS = (
+    "sql", "refined_from", "columns", "row_count", "error",
+    "clarification_required", "suggested_question",
+)
+
+
+def _compact_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a conversation entry to the JSON-safe fields used for context."""
+    response = entry.get("response") or {}
+    compact = {k: response[k] for k in _PERSISTED_RESPONSE_KEYS if k in response}
+    if "columns" in compact:
+        compact["columns"] = [str(c) for c in compact["columns"] or []]
+    return {
+        "question": entry.get("question", ""),
+        "response": compact,
+        "timestamp": entry.get("timestamp", time.time()),
+    }
+
+
+class SessionStore(abc.ABC):
+    """Interface for conversation stores keyed by chat id."""
+
+    def __init__(self, max_history: int = 10, ttl_seconds: int = 7 * 24 * 3600) -> None:
+        self.max_history = max_history
+        self.ttl_seconds = ttl_seconds
+
+    @abc.abstractmethod
+    def load(self, chat_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Return (history, preferences) for a chat; empty values if unknown or expired."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def save(self, chat_id: str, history: List[Dict[str, Any]], preferences: Dict[str, Any]) -> None:
+        """Persist the bounded history and preferences for a chat."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, chat_id: str) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def cleanup(self) -> int:
+        """Drop sessions idle for longer than the TTL. Returns the number removed."""
+        raise NotImplementedError
+
+    def _bounded(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [_compact_entry(e) for e in history[-self.max_history:]]
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store; state is lost on restart."""
+
+    def __init__(self, max_history: int = 10, ttl_seconds: int = 7 * 24 * 3600) -> None:
+        super().__init__(max_history, ttl_seconds)
+        self._sessions: Dict[str, Tuple[List[Dict[str, Any]], Dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, chat_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        with self._lock:
+            item = self._sessions.get(chat_id)
+        if not item or time.time() - item[2] > self.ttl_seconds:
+            return [], {}
+        history, preferences, _ = item
+        return [dict(e) for e in history], dict(preferences)
+
+    def save(self, chat_id: str, history: List[Dict[str, Any]], preferences: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[chat_id] = (self._bounded(history), dict(preferences), time.time())
+
+    def delete(self, chat_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+
+    def cleanup(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [k for k, v in self._sessions.items() if v[2] < cutoff]
+            for k in expired:
+                del self._sessions[k]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Embedded SQLite store in WAL mode, safe for several worker processes.
+
+    Each thread keeps its own connection; a read is a single primary-key lookup
+    plus a small JSON decode. Expired sessions are purged opportunistically on
+    save, at most once per `cleanup_interval` seconds.
+    """
+
+    def __init__(self, db_path: str = "sessions.db", max_history: int = 10,
+                 ttl_seconds: int = 7 * 24 * 3600, cleanup_interval: int = 600) -> None:
+        super().__init__(max_history, ttl_seconds)
+        self.db_path = db_path
+        self.cleanup_interval = cleanup_interval
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " chat_id TEXT PRIMARY KEY,"
+            " history TEXT NOT NULL,"
+            " preferences TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def load(self, chat_id: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT history, preferences, updated_at FROM sessions WHERE chat_id = ?",
+            (chat_id,),
+        ).fetchone()
+        if not row or time.time() - row[2] > self.ttl_seconds:
+            return [], {}
+        try:
+            return json.loads(row[0]), json.loads(row[1])
+        except ValueError:
+            return [], {}
+
+    def save(self, chat_id: str, history: List[Dict[str, Any]], preferences: Dict[str, Any]) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (chat_id, history, preferences, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(chat_id) DO UPDATE SET history = excluded.history,"
+            " preferences = excluded.preferences, updated_at = excluded.updated_at",
+            (
+                chat_id,
+                json.dumps(self._bounded(history), ensure_ascii=False, default=str),
+                json.dumps(preferences, ensure_ascii=False, default=str),
+                now,
+            ),
+        )
+        conn.commit()
+        if now - self._last_cleanup > self.cleanup_interval:
+            self._last_cleanup = now
+            self.cleanup()
+
+    def delete(self, chat_id: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+        conn.commit()
+
+    def cleanup(self) -> int:
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+        conn.commit()
+        return cur.rowcount or 0
+
+
+def get_session_store(backend: Optional[str] = None) -> SessionStore:
+    """Return a session store configured from SESSION_CONFIG (sqlite by default)."""
+    cfg = SESSION_CONFIG
+    backend = (backend or cfg["backend"]).lower()
+    if backend == "memory":
+        return InMemorySessionStore(cfg["max_history"], cfg["ttl_seconds"])
+    return SQLiteSessionStore(
+        cfg["db_path"],
+        max_history=cfg["max_history"],
+        ttl_seconds=cfg["ttl_seconds"],
+        cleanup_interval=cfg["cleanup_interval"],
+    )
@@ -10,32 +10,84 @@ Simplified pipeline that uses one LLM to:
 from __future__ import annotations
 
 import json
+import os
+import re
+import threading
+import time
 import requests
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from dynamic_database_config import (
-    get_database_description_prompt,
+    SchemaState,
+    get_catalog_index,
+    get_schema_state,
+    wait_for_schema,
 )
+from count_answerer import CountAnswerer
+from db_health import DB_HEALTH_CONFIG, DatabaseUnavailable, get_db_health, is_connection_error
+from intent_lexicon import classify
+from join_planner import JoinPlanner
+from log_config import SAMPLED, debug_enabled, get_logger
 from llm_config import LLM_CONFIG, get_single_llm
+from result_refiner import MAX_REFINABLE_ROWS, ColumnarResult, ResultRefiner
+from session_store import InMemorySessionStore, SessionStore, get_session_store
+
+log = get_logger("assistant")
+
+# Verified question/SQL pairs from LearningManager added to each SQL prompt
+FEW_SHOT_CONFIG = {
+    "k": int(os.getenv("FEW_SHOT_K", "3")),
+    "token_budget": int(os.getenv("FEW_SHOT_TOKENS", "400")),
+}
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English and SQL; only used for budgeting
+    return len(text) // 4 + 1
 
 
 class SingleModelDBAssistant:
-    def __init__(self, model: Optional[str] = None, base_url: Optional[str] = None, temperature: float = 0.1, api_url: str = "http://localhost:8000", embedded_mode: bool = False) -> None:
+    def __init__(self, model: Optional[str] = None, base_url: Optional[str] = None, temperature: float = 0.1, api_url: str = "http://localhost:8000", embedded_mode: bool = False, session_store: Optional[SessionStore] = None, llm: Optional[Any] = None, sql_executor: Optional[Callable[[str], Tuple[List[str], List[Tuple[Any, ...]]]]] = None, learning_manager: Optional[Any] = None) -> None:
         self.api_url = api_url
         self.embedded_mode = embedded_mode
         self.model_name = model or LLM_CONFIG.get("model")
         self.base_url = base_url or LLM_CONFIG.get("base_url")
         self.temperature = temperature
-        self.llm = get_single_llm(self.model_name, self.base_url, self.temperature)
+        # An injected llm/sql_executor (benchmarks, offline runs) replaces Ollama / MySQL
+        self.llm = llm or get_single_llm(self.model_name, self.base_url, self.temperature)
+        self.sql_executor = sql_executor
         if self.llm is None:
             raise RuntimeError("langchain_ollama is not available. Please install langchain and langchain-ollama.")
         
-        # Conversation memory for context-aware behavior
-        self.conversation_history = []
-        self.user_preferences = {
-            "show_all_rows": False,  # User's preference for showing all rows
-            "last_full_detail_request": None  # Track when user last asked for full details
-        }
+        # Conversation memory and preferences of the chat being answered, kept per
+        # thread so concurrent requests never see each other's state (see ask())
+        # show_all_rows: user's preference for showing all rows
+        # last_full_detail_request: when the user last asked for full details
+        self._call = threading.local()
+        # Cached static prompt pieces (see _prompt_prefix)
+        self._snapshot_text: Optional[str] = None
+        self._reference_text: Optional[str] = None
+        self._prefix_cache: Dict[str, Tuple[str, str]] = {}
+        # Persistent per-chat state; only consulted when ask() receives a chat_id
+        self.session_store = session_store or get_session_store()
+        # Striped per-chat locks, held only while a session is loaded or saved
+        self._chat_locks = [threading.Lock() for _ in range(64)]
+        # Last complete result per chat, kept for local refinements ("only those from X")
+        self.refiner = ResultRefiner()
+        self._last_results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._results_lock = threading.Lock()
+        # Preview requests run SQL with a LIMIT, then count the full result if it was cut off
+        self.count_timeout = float(os.getenv("PREVIEW_COUNT_TIMEOUT", "5"))
+        self._count_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="preview-count")
+        # Plain count questions are answered from store aggregates / cached counts, without the LLM
+        self.count_answerer = CountAnswerer(self.execute_sql)
+        # Exact join clauses for the tables a question names; learned table-pair success rates weight the paths
+        self.learning_manager = learning_manager
+        self._join_planner: Optional[JoinPlanner] = None
+        # Set when an auto-fix rewrote the SQL on this thread; such SQL is not a verified example
+        self._exec_state = threading.local()
         
         # Test API connection only if not in embedded mode
         if not embedded_mode and not self._test_api_connection():
@@ -50,9 +102,9 @@ class SingleModelDBAssistant:
         
         try:
             if embedded_mode:
-                print(f"Model '{self.model_name}' initialized in embedded mode (Database: '{self.database_name}').")
+                log.info("Model '%s' initialized in embedded mode (Database: '%s').", self.model_name, self.database_name)
             else:
-                print(f"Model '{self.model_name}' connected to SQL API at '{self.api_url}' (Database: '{self.database_name}').")
+                log.info("Model '%s' connected to SQL API at '%s' (Database: '%s').", self.model_name, self.api_url, self.database_name)
         except Exception:
             pass
 
@@ -184,6 +236,13 @@ class SingleModelDBAssistant:
                         if "ORDER BY" not in fixed:
                             fixed += "\nORDER BY customer_count DESC"
             
+            # Nothing above applied: map the rejected column to the closest one in the catalog
+            if fixed == sql and "unknown column" in lower_err:
+                m = re.search(r"unknown column '([^']+)'", error_message, re.IGNORECASE)
+                replacement = get_catalog_index().suggest_column_fix(sql, m.group(1)) if m else None
+                if replacement:
+                    fixed = re.sub(r"(?<![\w.`])" + re.escape(m.group(1)) + r"(?![\w`])", replacement, fixed)
+
             # Guard against selecting sensitive columns
             if "access_token" in fixed:
                 fixed = fixed.replace("stores.access_token,", "").replace(", stores.access_token", "")
@@ -193,23 +252,30 @@ class SingleModelDBAssistant:
         except Exception:
             return sql
 
-    def _schema_prompt(self) -> str:
+    def _schema_prompt(self, state: Optional[SchemaState] = None) -> str:
         # Prefer dynamic live schema; append snapshot only as supplemental context
         try:
-            dynamic = get_database_description_prompt()
+            dynamic = (state or get_schema_state()).prompt
         except Exception:
             dynamic = ""
-        snapshot = ""
-        try:
-            with open("schema_snapshot.txt", "r", encoding="utf-8") as f:
-                snapshot = f.read().strip()
-        except Exception:
-            snapshot = ""
+        if self._snapshot_text is None:
+            # Read once; resolve next to this module so the bytes do not depend on the cwd
+            self._snapshot_text = ""
+            for path in (os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema_snapshot.txt"), "schema_snapshot.txt"):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._snapshot_text = f.read().strip()
+                    break
+                except Exception:
+                    continue
+        snapshot = self._snapshot_text
         if dynamic and snapshot:
             return dynamic + "\n\n-- supplemental snapshot (may be stale) --\n" + snapshot
         return dynamic or snapshot
 
     def _reference_examples(self) -> str:
+        if self._reference_text is not None:
+            return self._reference_text
         try:
             from reference_questions import REFERENCE_QUESTIONS
             # Flatten key categories useful for schema reasoning
@@ -222,9 +288,10 @@ class SingleModelDBAssistant:
                 lines.append(f"- {c}:")
                 for q in qs[:12]:  # cap to avoid overly long prompts
                     lines.append(f"  • {q}")
-            return "\n".join(lines)
+            self._reference_text = "\n".join(lines)
         except Exception:
             return ""
+        return self._reference_text
 
     def _extract_sql(self, text: str) -> str:
         if not text:
@@ -241,46 +308,131 @@ class SingleModelDBAssistant:
         body = body.replace("```sql", "").replace("```", "").strip()
         return body
 
+    def _prompt_prefix(self, kind: str = "deliberate", state: Optional[SchemaState] = None) -> str:
+        """Static part of a SQL prompt (instructions, schema, examples).
+
+        The prefix is cached and byte-identical across requests as long as the
+        schema text is unchanged, so Ollama can reuse the evaluated prefix from
+        its KV cache and only process the question appended at the end.
+        """
+        schema = self._schema_prompt(state)
+        cached = self._prefix_cache.get(kind)
+        if cached is not None and cached[0] == schema:
+            return cached[1]
+        if kind == "forced":
+            prefix = (
+                "Output exactly one valid MySQL SQL query that answers the user's request.\n"
+                "Rules:\n"
+                "- Use ONLY the provided schema.\n"
+                "- Only SELECT statements are allowed. Do NOT use SHOW, DESCRIBE, INSERT, UPDATE, DELETE, CREATE, DROP, or ALTER.\n"
+                "- The SQL MUST start with SELECT.\n"
+                "- Do NOT explain.\n"
+                "- Return a single fenced sql block and nothing else.\n\n"
+                f"SCHEMA:\n{schema}\n\n"
+            )
+        else:
+            refs = self._reference_examples()
+            prefix = (
+                "You are an elite MySQL query generator. Follow the deliberate process strictly.\n\n"
+                "THINK (high-level intent):\n"
+                "- Restate the user's goal in 1 short sentence.\n"
+                "- Identify which tables are relevant and why.\n\n"
+                "THINK (schema mapping):\n"
+                "- Map needed fields to exact table.column names from the schema.\n"
+                "- Choose correct join paths (orders → order_customer → customers, orders → order_items → products).\n\n"
+                "THINK (query plan):\n"
+                "- Select columns (avoid SELECT * when possible).\n"
+                "- Filters, grouping, ordering, and safe limits if large.\n\n"
+                "GENERATE (single MySQL query):\n"
+                "- Output exactly one executable SQL in a fenced sql block. No prose before or after.\n"
+                "- Only SELECT statements are allowed. Do NOT use SHOW, DESCRIBE, INSERT, UPDATE, DELETE, CREATE, DROP, or ALTER.\n"
+                "- The SQL MUST start with SELECT.\n"
+                "- Exclude admin/chat_messages and any sensitive columns (e.g., stores.access_token).\n\n"
+                f"SCHEMA (read-me-first):\n{schema}\n\n"
+                + (f"REFERENCE QUESTIONS (guide your thinking, do not echo):\n{refs}\n\n" if refs else "")
+            )
+        self._prefix_cache[kind] = (schema, prefix)
+        return prefix
+
+    def _join_hint(self, question: str, state: Optional[SchemaState] = None) -> str:
+        try:
+            index = (state or get_schema_state()).index
+            if self._join_planner is None or self._join_planner.index is not index:
+                self._join_planner = JoinPlanner(index)
+            self._join_planner.insights = self.learning_manager.schema_insights if self.learning_manager else None
+            return self._join_planner.hint_for_question(question)
+        except Exception:
+            return ""
+
+    def _few_shot_block(self, question: str, state: Optional[SchemaState] = None) -> str:
+        """Most similar verified examples (intent, pattern and table overlap) within FEW_SHOT_CONFIG's token budget"""
+        if self.learning_manager is None or FEW_SHOT_CONFIG["k"] <= 0:
+            return ""
+        try:
+            candidates = self.learning_manager.get_verified_examples(question, limit=FEW_SHOT_CONFIG["k"] * 2)
+            state = state or get_schema_state()
+            # The generic fallback schema would reject valid examples
+            index = state.index if state.source != "fallback" else None
+        except Exception:
+            return ""
+        header = "VERIFIED EXAMPLES (ran successfully on this database; adapt, do not copy blindly):\n"
+        budget = FEW_SHOT_CONFIG["token_budget"] - _estimate_tokens(header)
+        lines = []
+        for example in candidates:
+            # Skip examples the schema no longer supports
+            if index is not None and index.check_sql(example["sql"]):
+                continue
+            text = f"Q: {example['question']}\nSQL: {' '.join(example['sql'].split())}\n"
+            cost = _estimate_tokens(text)
+            if cost > budget:
+                continue
+            budget -= cost
+            lines.append(text)
+            if len(lines) >= FEW_SHOT_CONFIG["k"]:
+                break
+        return header + "".join(lines) + "\n" if lines else ""
+
     def _build_prompt(self, question: str) -> str:
-        schema = self._schema_prompt()
-        refs = self._reference_examples()
+        # Static prefix first, the only per-request bytes (question, join path, examples) last.
+        # One schema state for all parts, so a hot swap cannot mix two schemas in one prompt
+        state = get_schema_state()
         return (
-            "You are an elite MySQL query generator. Follow the deliberate process strictly.\n\n"
-            "THINK (high-level intent):\n"
-            "- Restate the user's goal in 1 short sentence.\n"
-            "- Identify which tables are relevant and why.\n\n"
-            "THINK (schema mapping):\n"
-            "- Map needed fields to exact table.column names from the schema.\n"
-            "- Choose correct join paths (orders → order_customer → customers, orders → order_items → products).\n\n"
-            "THINK (query plan):\n"
-            "- Select columns (avoid SELECT * when possible).\n"
-            "- Filters, grouping, ordering, and safe limits if large.\n\n"
-            "GENERATE (single MySQL query):\n"
-            "- Output exactly one executable SQL in a fenced sql block. No prose before or after.\n"
-            "- Only SELECT statements are allowed. Do NOT use SHOW, DESCRIBE, INSERT, UPDATE, DELETE, CREATE, DROP, or ALTER.\n"
-            "- The SQL MUST start with SELECT.\n"
-            "- Exclude admin/chat_messages and any sensitive columns (e.g., stores.access_token).\n\n"
-            f"SCHEMA (read-me-first):\n{schema}\n\n"
-            + (f"REFERENCE QUESTIONS (guide your thinking, do not echo):\n{refs}\n\n" if refs else "")
+            self._prompt_prefix("deliberate", state)
             + f"USER QUESTION:\n{question}\n\n"
-            "Return only a single fenced sql code block."
+            + self._join_hint(question, state)
+            + self._few_shot_block(question, state)
+            + "Return only a single fenced sql code block."
         )
 
     def _build_forced_sql_prompt(self, question: str) -> str:
-        schema = self._schema_prompt()
+        state = get_schema_state()
         return (
-            "Output exactly one valid MySQL SQL query that answers the user's request.\n"
-            "Rules:\n"
-            "- Use ONLY the provided schema.\n"
-            "- Only SELECT statements are allowed. Do NOT use SHOW, DESCRIBE, INSERT, UPDATE, DELETE, CREATE, DROP, or ALTER.\n"
-            "- The SQL MUST start with SELECT.\n"
-            "- Do NOT explain.\n"
-            "- Return a single fenced sql block and nothing else.\n\n"
-            f"SCHEMA:\n{schema}\n\n"
-            f"USER QUESTION:\n{question}\n\n"
-            "Return only a single fenced sql code block."
+            self._prompt_prefix("forced", state)
+            + f"USER QUESTION:\n{question}\n\n"
+            + self._join_hint(question, state)
+            + self._few_shot_block(question, state)
+            + "Return only a single fenced sql code block."
         )
 
+    def _learn(self, question: str, sql: str, success: bool, seconds: float = 0.0,
+               row_count: int = 0, error: Optional[str] = None) -> None:
+        """Feed an executed query back to the learning manager (never fails the answer)"""
+        if self.learning_manager is None or not sql:
+            return
+        try:
+            self.learning_manager.learn_from_interaction(question, sql, success, seconds, row_count, error)
+        except Exception as e:
+            log.warning("Could not record interaction: %s", e)
+
+    def warm_up(self) -> None:
+        """Evaluate the static prompt prefix once so the first real question hits Ollama's prompt cache."""
+        try:
+            # Prime with the analyzed schema, not the fallback used while it loads
+            wait_for_schema(timeout=float(os.getenv("SCHEMA_WARMUP_TIMEOUT", "60")))
+            self.llm.invoke(self._prompt_prefix("deliberate") + "USER QUESTION:\nhow many tables are there\n\nReturn only a single fenced sql code block.")
+        except Exception as e:
+            log.warning("⚠️  LLM warm-up failed: %s", e)
+
     def _intent_fallback_sql(self, question: str) -> Optional[str]:
         q = (question or "").lower()
         # Count tables
@@ -338,53 +490,111 @@ class SingleModelDBAssistant:
             # In API mode, use the existing API call logic
             return self._execute_sql_api(sql)
     
-    def _execute_sql_embedded(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
-        """Execute SQL directly in embedded mode"""
+    def _has_top_level_limit(self, sql: str) -> bool:
+        """True if the outer query already has a LIMIT (subqueries, strings and comments ignored)."""
+        flat = re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`", "''", sql)
+        flat = re.sub(r"/\*.*?\*/|(?:--|#)[^\n]*", " ", flat, flags=re.DOTALL)
+        while True:
+            inner = re.sub(r"\([^()]*\)", " _ ", flat)
+            if inner == flat:
+                break
+            flat = inner
+        return re.search(r"\blimit\b", flat, re.IGNORECASE) is not None
+
+    def execute_preview(self, sql: str, limit: Any) -> Tuple[List[str], List[Tuple[Any, ...]], Optional[int]]:
+        """Execute `sql` for display: at most `limit` rows plus the total row count.
+
+        The query runs with a pushed-down LIMIT, so a preview never transfers the
+        full result. Only when that returns more than `limit` rows does COUNT(*)
+        over the same query run; a short result is already complete and costs
+        no count. The total is None if the count failed or did not finish within
+        `count_timeout`. Queries that already have a LIMIT, and unlimited
+        requests, run unchanged.
+        """
+        base = sql.strip().rstrip(";").rstrip()
+        if limit == float('inf') or self._has_top_level_limit(base):
+            columns, rows = self.execute_sql(sql)
+            return columns, rows, len(rows)
+        limit = int(limit)
+        # One extra row tells whether anything was cut off; the newline keeps a trailing comment harmless
+        columns, rows = self.execute_sql(f"{base}\nLIMIT {limit + 1}")
+        if len(rows) <= limit:
+            return columns, rows, len(rows)
+        timeout_ms = int(self.count_timeout * 1000)
+        count_future = self._count_pool.submit(
+            self.execute_sql,
+            f"SELECT /*+ MAX_EXECUTION_TIME({timeout_ms}) */ COUNT(*) FROM (\n{base}\n) AS _preview_count",
+        )
+        try:
+            _, count_rows = count_future.result(timeout=self.count_timeout)
+            total: Optional[int] = int(count_rows[0][0])
+        except Exception:
+            total = None
+        if total is not None and total <= limit:
+            total = None  # count disagrees with the rows we just saw
+        return columns, rows[:limit], total
+
+    def _query_mysql(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        """Run one query on a fresh mysql.connector connection"""
+        import mysql.connector
+        
+        # Get connection details
+        host = os.getenv("DB_HOST", "43.225.53.118")
+        user = os.getenv("DB_USER", "staging_sony_centeral")
+        password = os.getenv("DB_PASSWORD", "sony_centeralsony_centeral")
+        database = os.getenv("DB_NAME", "staging_central_hub")
+        
+        # Connect to database
+        conn = mysql.connector.connect(
+            host=host,
+            user=user,
+            password=password,
+            database=database,
+            ssl_disabled=True,
+            connection_timeout=DB_HEALTH_CONFIG["connect_timeout"]
+        )
+        
         try:
-            # Import the database connection function from sql_api
-            import mysql.connector
-            import os
-            
-            # Get connection details
-            host = os.getenv("DB_HOST", "43.225.53.118")
-            user = os.getenv("DB_USER", "staging_sony_centeral")
-            password = os.getenv("DB_PASSWORD", "sony_centeralsony_centeral")
-            database = os.getenv("DB_NAME", "staging_central_hub")
-            
-            # Connect to database
-            conn = mysql.connector.connect(
-                host=host,
-                user=user,
-                password=password,
-                database=database,
-                ssl_disabled=True
-            )
-            
             cursor = conn.cursor(dictionary=True)
             cursor.execute(sql)
             results = cursor.fetchall()
             cursor.close()
+        finally:
             conn.close()
+        
+        if not results:
+            return [], []
+        
+        # Extract columns and convert to tuple format
+        columns = list(results[0].keys())
+        rows = []
+        for row in results:
+            row_tuple = tuple(row.get(col, None) for col in columns)
+            rows.append(row_tuple)
+        
+        return columns, rows
+
+    def _execute_sql_embedded(self, sql: str) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        """Execute SQL directly in embedded mode"""
+        try:
+            if self.sql_executor is not None:
+                return self.sql_executor(sql)
+            # Shared circuit breaker: fails fast while the database is down
+            return get_db_health().call(lambda: self._query_mysql(sql))
             
-            if not results:
-                return [], []
-            
-            # Extract columns and convert to tuple format
-            columns = list(results[0].keys())
-            rows = []
-            for row in results:
-                row_tuple = tuple(row.get(col, None) for col in columns)
-                rows.append(row_tuple)
-            
-            return columns, rows
-            
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
+            # Rewriting the SQL cannot fix an unreachable database
+            if is_connection_error(e):
+                raise Exception(f"SQL execution failed: {str(e)}")
             # Attempt auto-fix in embedded mode
             try:
                 fixed_sql = self._auto_fix_sql(sql, str(e))
                 if fixed_sql and fixed_sql.strip() != sql.strip():
-                    print(f"🔄 Auto-fixing SQL and retrying...")
-                    print(f"📝 Fixed SQL: {fixed_sql}")
+                    log.info("🔄 Auto-fixing SQL and retrying...")
+                    log.debug("📝 Fixed SQL: %s", fixed_sql)
+                    self._exec_state.auto_fixed = True
                     return self._execute_sql_embedded(fixed_sql)
             except Exception:
                 pass
@@ -407,13 +617,14 @@ class SingleModelDBAssistant:
             
             if not result.get("success"):
                 error_msg = result.get("error", "Unknown API error")
-                print(f"⚠️  SQL Error: {error_msg}")
+                log.warning("⚠️  SQL Error: %s", error_msg)
                 
                 # Attempt a single auto-fix and retry once
                 fixed_sql = self._auto_fix_sql(sql, error_msg)
                 if fixed_sql and fixed_sql.strip() != sql.strip():
-                    print(f"🔄 Auto-fixing SQL and retrying...")
-                    print(f"📝 Fixed SQL: {fixed_sql}")
+                    log.info("🔄 Auto-fixing SQL and retrying...")
+                    log.debug("📝 Fixed SQL: %s", fixed_sql)
+                    self._exec_state.auto_fixed = True
                     
                     response = requests.post(
                         f"{self.api_url}/execute",
@@ -423,7 +634,7 @@ class SingleModelDBAssistant:
                     if response.status_code == 200:
                         result = response.json()
                         if result.get("success"):
-                            print("✅ Auto-fix successful!")
+                            log.info("✅ Auto-fix successful")
                             sql = fixed_sql  # propagate fixed SQL for downstream parsing
                         else:
                             raise Exception(f"Auto-fix failed: {result.get('error', 'Unknown error')}")
@@ -489,6 +700,32 @@ class SingleModelDBAssistant:
         except Exception:
             return f"Returned {payload['count']} rows across {len(columns)} columns."
 
+    @property
+    def conversation_history(self) -> List[Dict[str, Any]]:
+        """History of the chat answered on this thread."""
+        if not hasattr(self._call, "history"):
+            self._call.history = []
+        return self._call.history
+
+    @conversation_history.setter
+    def conversation_history(self, history: List[Dict[str, Any]]) -> None:
+        self._call.history = history
+
+    @property
+    def user_preferences(self) -> Dict[str, Any]:
+        """Display preferences of the chat answered on this thread."""
+        if not hasattr(self._call, "preferences"):
+            self._call.preferences = self._default_preferences()
+        return self._call.preferences
+
+    @user_preferences.setter
+    def user_preferences(self, preferences: Dict[str, Any]) -> None:
+        self._call.preferences = preferences
+
+    @property
+    def _active_chat_id(self) -> Optional[str]:
+        return getattr(self._call, "chat_id", None)
+
     def _add_to_conversation(self, question: str, response: Dict[str, Any]) -> None:
         """Add question and response to conversation history."""
         self.conversation_history.append({
@@ -502,20 +739,13 @@ class SingleModelDBAssistant:
 
     def _extract_user_preferences(self, question: str) -> None:
         """Extract and remember user preferences from the question."""
-        q = question.lower().strip()
+        intents = classify(question)
         
         # Check for full detail requests
-        full_detail_phrases = [
-            "full list", "complete list", "all details", "show all", "entire list",
-            "full details", "complete details", "all data", "everything", "full data",
-            "complete data", "entire data", "all records", "full records", "complete records",
-            "no limit", "unlimited", "all rows", "full rows", "complete rows"
-        ]
-        
-        if any(phrase in q for phrase in full_detail_phrases):
+        if "full_detail" in intents:
             self.user_preferences["show_all_rows"] = True
             self.user_preferences["last_full_detail_request"] = __import__("time").time()
-        elif any(phrase in q for phrase in ["limit", "first", "top", "few", "some"]):
+        elif "limit" in intents:
             # User explicitly wants limited results
             self.user_preferences["show_all_rows"] = False
 
@@ -528,28 +758,12 @@ class SingleModelDBAssistant:
         last_conversation = self.conversation_history[-1]
         last_question = last_conversation.get("question", "")
         last_response = last_conversation.get("response", {})
-        last_sql = last_response.get("sql", "")
-        
-        q = question.lower().strip()
+        last_sql = last_response.get("sql") or last_response.get("refined_from", "")
         
-        # Check for continuation phrases
-        continuation_phrases = [
-            "more", "next", "continue", "rest", "remaining", "additional",
-            "50 more", "20 more", "10 more", "5 more", "100 more",
-            "show more", "get more", "give me more"
-        ]
-        
-        # Check for full detail phrases
-        vague_phrases = [
-            "full list", "complete list", "all details", "show all", "entire list",
-            "full details", "complete details", "all data", "everything", "full data",
-            "complete data", "entire data", "all records", "full records", "complete records",
-            "no limit", "unlimited", "all rows", "full rows", "complete rows",
-            "the full list", "give me the full list", "show me the full list"
-        ]
+        intents = classify(question)
         
         # If asking for more/continuation of previous data
-        if any(phrase in q for phrase in continuation_phrases):
+        if "continuation" in intents:
             if last_sql and "SELECT" in last_sql.upper():
                 # Extract WHERE clause from previous SQL to preserve context
                 where_clause = ""
@@ -578,7 +792,7 @@ class SingleModelDBAssistant:
                     return f"get me {question} {last_question}"
         
         # If asking for full details
-        elif any(phrase in q for phrase in vague_phrases):
+        elif "full_detail" in intents:
             if last_sql and "SELECT" in last_sql.upper():
                 # Generic approach: simply append "full list" to the previous question
                 # This works for any type of query - orders, customers, products, etc.
@@ -589,38 +803,19 @@ class SingleModelDBAssistant:
     def _is_vague_question(self, question: str) -> bool:
         """Detect incomplete/vague prompts that are likely to confuse the LLM."""
         try:
-            q = (question or "").strip().lower()
+            q = (question or "").strip()
             if not q:
                 return True
-            words = q.split()
-
-            # Intent cues that indicate a concrete ask
-            intent_cues = {
-                "how many", "count", "list", "show", "get", "find", "give", "top", "recent", "latest"
-            }
-            if any(cue in q for cue in intent_cues):
-                intent_present = True
-            else:
-                intent_present = False
+            intents = classify(q)
 
+            # Intent cues indicate a concrete ask; domain hints name what it is about
+            intent_present = "intent_cue" in intents
+            has_domain = "domain" in intents
             # Vague pronouns or continuations
-            vague_tokens = {
-                "this", "that", "those", "these", "it", "them",
-                "more", "next", "continue", "rest", "remaining",
-                "others", "like before", "same as before"
-            }
-            has_vague_tokens = any(tok in q for tok in vague_tokens)
-
-            # Domain hints (expanded with common synonyms)
-            domain_tokens = {
-                "orders", "order", "products", "product", "customers", "customer",
-                "stores", "store", "variants", "variant", "sales", "sold", "tv", "tvs",
-                "television", "televisions", "sku", "skus", "items", "item"
-            }
-            has_domain = any(tok in q for tok in domain_tokens)
+            has_vague_tokens = "vague_ref" in intents
 
             # Very short questions with no domain and no intent are vague
-            if len(words) <= 2 and not has_domain and not intent_present:
+            if intents.word_count <= 2 and not has_domain and not intent_present:
                 return True
 
             # If we have intent or domain, do not treat as vague
@@ -637,52 +832,37 @@ class SingleModelDBAssistant:
 
     def _should_show_all_rows(self, question: str) -> bool:
         """Check if user wants all rows based on current question and conversation history."""
-        q = question.lower().strip()
+        intents = classify(question)
         
         # First, update preferences based on current question
         self._extract_user_preferences(question)
         
-        # Check if current question explicitly asks for full details
-        full_detail_phrases = [
-            "full list", "complete list", "all details", "show all", "entire list",
-            "full details", "complete details", "all data", "everything", "full data",
-            "complete data", "entire data", "all records", "full records", "complete records",
-            "no limit", "unlimited", "all rows", "full rows", "complete rows"
-        ]
-        
-        if any(phrase in q for phrase in full_detail_phrases):
-            return True
-        
-        # Check for continuation requests - these should show all remaining rows
-        continuation_phrases = [
-            "more", "next", "continue", "rest", "remaining", "additional",
-            "50 more", "20 more", "10 more", "5 more", "100 more",
-            "show more", "get more", "give me more"
-        ]
-        
-        if any(phrase in q for phrase in continuation_phrases):
+        # Current question explicitly asks for full details, or continues a previous
+        # listing - both should show all (remaining) rows
+        if "full_detail" in intents or "continuation" in intents:
             return True
         
         # If current question doesn't specify, check if user has a preference for full details
-        # and the question is vague (doesn't specify limits)
+        # and the question is vague (doesn't specify any limits)
         if self.user_preferences["show_all_rows"]:
-            # Check if question is vague (doesn't specify any limits)
-            limit_indicators = ["limit", "first", "top", "few", "some", "last", "recent"]
-            if not any(indicator in q for indicator in limit_indicators):
+            if "limit" not in intents and "recency" not in intents:
                 return True
         
         return False
 
-    def reset_preferences(self) -> None:
-        """Reset user preferences to default."""
-        self.user_preferences = {
-            "show_all_rows": False,
-            "last_full_detail_request": None
-        }
+    def reset_preferences(self, chat_id: Optional[str] = None) -> None:
+        """Reset user preferences to default (and in the stored session, for a chat)."""
+        if chat_id:
+            self._begin_call(str(chat_id))
+        self.user_preferences = self._default_preferences()
+        if chat_id:
+            self._save_session(str(chat_id))
         print("🔄 User preferences reset to default")
 
-    def show_preferences(self) -> None:
+    def show_preferences(self, chat_id: Optional[str] = None) -> None:
         """Show current user preferences."""
+        if chat_id:
+            self._begin_call(str(chat_id))
         print(f"\n📋 Current Preferences:")
         print(f"   • Show all rows: {self.user_preferences['show_all_rows']}")
         if self.user_preferences['last_full_detail_request']:
@@ -691,14 +871,150 @@ class SingleModelDBAssistant:
             print(f"   • Last full detail request: {int(time_ago)} seconds ago")
         print(f"   • Conversation history: {len(self.conversation_history)} entries")
 
-    def ask(self, question: str, show_rows: int = 20) -> Dict[str, Any]:
-        """Generate SQL, execute via API, and return results."""
+    def _remember_result(self, sql: str, columns: List[str], rows: List[Tuple[Any, ...]], columnar: Optional[ColumnarResult] = None) -> None:
+        """Keep the last complete result of the active chat for local refinement."""
+        key = self._active_chat_id
+        with self._results_lock:
+            self._last_results.pop(key, None)
+            # Anonymous calls have no follow-ups, so there is nothing to keep for them
+            if key is None or not rows or len(rows) > MAX_REFINABLE_ROWS or not self.refiner.available():
+                return
+            # Columnar arrays are built lazily, on the first follow-up that needs them
+            self._last_results[key] = {"sql": sql, "columns": columns, "rows": rows, "columnar": columnar}
+            while len(self._last_results) > 32:
+                self._last_results.popitem(last=False)
+
+    def _refine_last_result(self, question: str, show_rows: Any) -> Optional[Dict[str, Any]]:
+        """Answer filter/sort/group/top-N follow-ups from the previous result without the LLM.
+
+        Returns None when there is nothing to refine or the follow-up needs
+        columns the previous result does not have (the caller then regenerates SQL).
+        """
+        last = self._last_results.get(self._active_chat_id)
+        if last is None or self.refiner.parse(question) is None:
+            return None
+        try:
+            if last["columnar"] is None:
+                last["columnar"] = ColumnarResult.from_rows(last["columns"], last["rows"])
+            refined = self.refiner.refine(last["columnar"], question)
+        except Exception:
+            refined = None
+        if refined is None:
+            return None
+        result_set, description = refined
+        columns, rows = result_set.columns, result_set.to_rows()
+        log.info("⚡ Refined previous result locally (%s): %d rows", description, len(rows), extra=SAMPLED)
+        result = {
+            "sql": "",
+            "refined_from": last["sql"],
+            "refinement": description,
+            "columns": columns,
+            "rows": rows,
+            "row_count": len(rows),
+            "formatted_results": self._format_results(columns, rows, show_rows),
+        }
+        self._remember_result(last["sql"], columns, rows, result_set)
+        self._add_to_conversation(question, result)
+        return result
+
+    def _answer_count(self, question: str, show_rows: Any) -> Optional[Dict[str, Any]]:
+        """Answer "how many X" / "X per store" from maintained aggregates, or return None."""
+        started = time.perf_counter()
+        answer = self.count_answerer.answer(question)
+        if answer is None:
+            return None
+        columns, rows = answer["columns"], answer["rows"]
+        formatted_results = self._format_results(columns, rows, show_rows) + f"\n\n🕒 {answer['note']}"
+        log.info("⚡ Count answered from %s in %.0fms", answer["source"], (time.perf_counter() - started) * 1000, extra=SAMPLED)
+        result = {
+            "sql": answer["sql"],
+            "columns": columns,
+            "rows": rows,
+            "row_count": len(rows),
+            "count_source": answer["source"],
+            "freshness": answer["note"],
+            "formatted_results": formatted_results,
+        }
+        self._add_to_conversation(question, result)
+        self._remember_result(answer["sql"], columns, rows)
+        return result
+
+    def _format_results(self, columns: List[str], rows: List[Tuple[Any, ...]], show_rows: Any,
+                        total: Optional[int] = None, truncated: bool = False) -> str:
+        """Render rows as a table; `total`/`truncated` describe rows that were not fetched."""
+        if not rows:
+            return "No results found."
+        from tabulate import tabulate
+        display_rows = rows[:show_rows] if show_rows != float('inf') else rows
+        formatted_results = tabulate(display_rows, headers=columns, tablefmt="fancy_grid")
+        total = len(rows) if total is None and not truncated else total
+        if total is None:
+            formatted_results += f"\n\n... more rows available (showing first {len(display_rows)})"
+        elif len(display_rows) < total:
+            formatted_results += f"\n\n... and {total - len(display_rows)} more rows (showing first {len(display_rows)})"
+        return formatted_results
+
+    def _default_preferences(self) -> Dict[str, Any]:
+        return {
+            "show_all_rows": False,
+            "last_full_detail_request": None
+        }
+
+    def ask(self, question: str, show_rows: int = 20, chat_id: Optional[str] = None) -> Dict[str, Any]:
+        """Generate SQL, execute via API, and return results.
+
+        When `chat_id` is given, conversation history and preferences are loaded
+        from the session store before answering and written back afterwards.
+        Without one the question is answered with no history and default
+        preferences. Either way the state lives on the calling thread, so
+        concurrent requests (even for the same chat) never block on each other's
+        LLM calls.
+        """
+        if not chat_id:
+            self._call.chat_id = None
+            self.conversation_history = []
+            self.user_preferences = self._default_preferences()
+            return self._ask(question, show_rows)
+        chat_id = str(chat_id)
+        self._begin_call(chat_id)
+        try:
+            return self._ask(question, show_rows)
+        finally:
+            self._save_session(chat_id)
+
+    def _chat_lock(self, chat_id: str) -> threading.Lock:
+        return self._chat_locks[hash(chat_id) % len(self._chat_locks)]
+
+    def _begin_call(self, chat_id: str) -> None:
+        """Load a chat's stored session into this thread's state."""
+        with self._chat_lock(chat_id):
+            history, preferences = self.session_store.load(chat_id)
+        self._call.chat_id = chat_id
+        self.conversation_history = history
+        self.user_preferences = {**self._default_preferences(), **preferences}
+
+    def _save_session(self, chat_id: str) -> None:
+        try:
+            with self._chat_lock(chat_id):
+                self.session_store.save(chat_id, self.conversation_history, self.user_preferences)
+        except Exception as e:
+            log.warning("⚠️  Could not persist session %s: %s", chat_id, e)
+
+    def _ask(self, question: str, show_rows: int = 20) -> Dict[str, Any]:
+        # Follow-ups like "only those from Bahrain" are answered from the last result
+        refined = self._refine_last_result(question, show_rows)
+        if refined is not None:
+            return refined
+        counted = self._answer_count(question, show_rows)
+        if counted is not None:
+            return counted
+
         # First, get context-aware question
         context_question = self._get_context_from_history(question)
         
-        print(f"\n🤖 Processing: {question}")
+        log.info("🤖 Processing: %s", question, extra=SAMPLED)
         if context_question != question:
-            print(f"🔄 Context-aware interpretation: {context_question}")
+            log.debug("🔄 Context-aware interpretation: %s", context_question)
         
         # If prompt is vague/incomplete, ask for confirmation instead of generating random SQL
         if self._is_vague_question(question):
@@ -707,7 +1023,7 @@ class SingleModelDBAssistant:
                 f"Would you like me to run this based on previous context instead?\n\n→ {context_question}\n\n"
                 "Please confirm or rephrase your question."
             )
-            print(f"\n❓ Clarification needed\n{msg}")
+            log.info("❓ Clarification needed for: %s", question, extra=SAMPLED)
             result = {
                 "clarification_required": True,
                 "suggested_question": context_question,
@@ -724,65 +1040,56 @@ class SingleModelDBAssistant:
         should_show_all = self._should_show_all_rows(question)
         if should_show_all:
             show_rows = float('inf')  # Show all rows
-            if any(phrase in question.lower() for phrase in ["full", "complete", "all", "entire", "everything"]):
-                print("📋 User requested full details - showing all available rows")
+            if "full_word" in classify(question):
+                log.debug("📋 User requested full details - showing all available rows")
             else:
-                print("📋 Using previous preference for full details - showing all available rows")
+                log.debug("📋 Using previous preference for full details - showing all available rows")
         
         # Generate SQL using context-aware question
         sql = self.generate_sql(context_question)
-        print(f"\n📝 Generated SQL:\n{sql}")
+        log.debug("📝 Generated SQL:\n%s", sql)
         
         try:
-            # Execute SQL via API
-            print(f"\n🚀 Executing query via API...")
-            columns, rows = self.execute_sql(sql)
-            
-            # Display results
-            if rows:
-                print(f"\n📊 Query Results ({len(rows)} rows):")
-                print("=" * 80)
-                
-                # Create table display
-                from tabulate import tabulate
-                display_rows = rows[:show_rows] if show_rows != float('inf') else rows
-                table = tabulate(display_rows, headers=columns, tablefmt="fancy_grid")
-                print(table)
-                
-                # Only show truncation message if we're actually limiting rows
-                if show_rows != float('inf') and len(rows) > show_rows:
-                    print(f"\n... and {len(rows) - show_rows} more rows (showing first {show_rows})")
-                
-                # Skip summary generation - user only wants query results
-                
+            # Execute SQL via API; previews only fetch the rows they display
+            started = time.perf_counter()
+            self._exec_state.auto_fixed = False
+            columns, rows, total = self.execute_preview(sql, show_rows)
+            if self._exec_state.auto_fixed:
+                self._learn(context_question, sql, False, error="needed an auto-fix")
             else:
-                print("\n📊 Query executed successfully but returned no results.")
+                self._learn(context_question, sql, True, time.perf_counter() - started, total if total is not None else len(rows))
+            truncated = total is None or total > len(rows)
+            row_count = total if total is not None else len(rows)
             
             # Create formatted results for API
-            formatted_results = ""
-            if rows:
-                from tabulate import tabulate
-                display_rows = rows[:show_rows] if show_rows != float('inf') else rows
-                formatted_results = tabulate(display_rows, headers=columns, tablefmt="fancy_grid")
-                if show_rows != float('inf') and len(rows) > show_rows:
-                    formatted_results += f"\n\n... and {len(rows) - show_rows} more rows (showing first {show_rows})"
-            else:
-                formatted_results = "No results found."
+            formatted_results = self._format_results(columns, rows, show_rows, total, truncated)
+            
+            log.info("📊 Query returned %d%s rows", row_count, "+" if total is None else "", extra=SAMPLED)
+            if rows and debug_enabled(log):
+                log.debug("📊 Query Results:\n%s", formatted_results)
             
             # Store conversation for context
             result = {
                 "sql": sql,
                 "columns": columns,
                 "rows": rows,
-                "row_count": len(rows),
+                "row_count": row_count,
+                "truncated": truncated,
                 "formatted_results": formatted_results
             }
             self._add_to_conversation(question, result)
+            # Only complete results can be refined locally
+            if truncated:
+                with self._results_lock:
+                    self._last_results.pop(self._active_chat_id, None)
+            else:
+                self._remember_result(sql, columns, rows)
             
             return result
             
         except Exception as e:
-            print(f"\n❌ Error executing query: {str(e)}")
+            log.warning("❌ Error executing query: %s", e)
+            self._learn(context_question, sql, False, error=str(e))
             error_result = {
                 "sql": sql,
                 "error": str(e)
@@ -790,6 +1097,36 @@ class SingleModelDBAssistant:
             self._add_to_conversation(question, error_result)
             return error_result
 
+    def ask_many(self, questions: List[str], output: Optional[str] = None, **kwargs: Any) -> List[Dict[str, Any]]:
+        """Answer a list of questions with SQL generation and execution pipelined.
+
+        See `batch_runner.ask_many` for options (concurrency limits, checkpoint, output format).
+        """
+        from batch_runner import ask_many
+        return ask_many(self, questions, output=output, **kwargs)
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    """Console output for the interactive loops; ask() itself only logs"""
+    if result.get("error"):
+        print(f"\n❌ Error executing query: {result['error']}")
+        return
+    if result.get("clarification_required"):
+        print(f"\n❓ Clarification needed\n{result['formatted_results']}")
+        return
+    if result.get("sql"):
+        print(f"\n📝 Generated SQL:\n{result['sql']}")
+    if result.get("rows"):
+        print(f"\n📊 Query Results ({result.get('row_count', 0)} rows):")
+        print("=" * 80)
+        print(result.get("formatted_results", ""))
+    else:
+        print("\n📊 Query executed successfully but returned no results.")
+
+
+# Chat id the interactive loops answer under
+REPL_CHAT_ID = "repl"
+
 
 def main() -> None:
     print("🚀 Single-Model DB Assistant (MySQL via API)")
@@ -800,7 +1137,8 @@ def main() -> None:
     print("=" * 60)
     
     try:
-        assistant = SingleModelDBAssistant()
+        # The REPL is one conversation: keep it in memory under a fixed chat id
+        assistant = SingleModelDBAssistant(session_store=InMemorySessionStore())
         print(f"\n✅ Connected! Using model: {assistant.model_name} | Database: {assistant.database_name}")
         print("\n💡 Type a question, or 'exit' to quit.\n")
         
@@ -817,10 +1155,10 @@ def main() -> None:
             # Handle special commands
             q_lower = q.strip().lower()
             if q_lower in {"reset", "reset preferences"}:
-                assistant.reset_preferences()
+                assistant.reset_preferences(REPL_CHAT_ID)
                 continue
             elif q_lower in {"preferences", "show preferences", "status"}:
-                assistant.show_preferences()
+                assistant.show_preferences(REPL_CHAT_ID)
                 continue
             elif q_lower in {"help", "commands"}:
                 print("\n📚 Available Commands:")
@@ -835,7 +1173,7 @@ def main() -> None:
                 continue
             
             try:
-                assistant.ask(q, show_rows=30)
+                print_result(assistant.ask(q, show_rows=30, chat_id=REPL_CHAT_ID))
             except Exception as e:
                 print(f"❌ Error: {e}")
                 
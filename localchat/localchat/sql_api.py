@@ -4,11 +4,11 @@ Simple SQL API - Execute SQL queries and return results
 """
 
 import json
-import traceback
 import os
 import sys
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
+import threading
+from typing import Dict, Any, List, Optional
+from fastapi import Body, FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 import uvicorn
 import mysql.connector
@@ -18,8 +18,15 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
+from log_config import SAMPLED, get_logger
+from db_health import DB_HEALTH_CONFIG, DatabaseUnavailable, get_db_health, is_connection_error
+from dynamic_database_config import get_schema_state, is_schema_ready, start_schema_init, start_schema_watcher
+from learning_system import LearningManager
+from rollups import RollupManager
 from single_model_db_assistant import SingleModelDBAssistant
 
+log = get_logger("sql_api")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="SQL Query API",
@@ -33,46 +40,76 @@ db_connection = None
 # Initialize the SingleModelDBAssistant
 assistant = None
 
+# Learned examples, join weights and latency stats shared by every request (learning.db)
+learning_manager = None
+
+# Circuit breaker and keepalive shared with the assistant's embedded executor
+db_health = get_db_health()
+
+def connect_mysql():
+    """Open a new mysql.connector connection from DB_* environment settings"""
+    # Get connection details from environment or use defaults
+    return mysql.connector.connect(
+        host=os.getenv("DB_HOST", "43.225.53.118"),
+        user=os.getenv("DB_USER", "staging_sony_centeral"),
+        password=os.getenv("DB_PASSWORD", "sony_centeralsony_centeral"),
+        database=os.getenv("DB_NAME", "staging_central_hub"),
+        ssl_disabled=True,
+        connection_timeout=DB_HEALTH_CONFIG["connect_timeout"]
+    )
+
+def _after_rollup_refresh(result: Dict[str, Any]) -> None:
+    # A refresh follows a store sync, so cached counts are stale too
+    if assistant is not None:
+        assistant.count_answerer.invalidate()
+
+# Rollup tables refreshed after each store sync (own connection per refresh)
+rollup_manager = RollupManager(connect_mysql, on_refresh=_after_rollup_refresh)
+
 def get_db_connection():
     """Get database connection using mysql.connector"""
     global db_connection
     if db_connection is None or not db_connection.is_connected():
         try:
-            # Get connection details from environment or use defaults
-            host = os.getenv("DB_HOST", "43.225.53.118")
-            user = os.getenv("DB_USER", "staging_sony_centeral")
-            password = os.getenv("DB_PASSWORD", "sony_centeralsony_centeral")
-            database = os.getenv("DB_NAME", "staging_central_hub")
-            
-            db_connection = mysql.connector.connect(
-                host=host,
-                user=user,
-                password=password,
-                database=database,
-                ssl_disabled=True
-            )
-            print("✅ Database connection established successfully!")
+            db_connection = connect_mysql()
+            log.info("✅ Database connection established")
         except mysql.connector.Error as e:
-            print(f"❌ Failed to connect to database: {e}")
+            log.error("❌ Failed to connect to database: %s", e)
             raise e
     return db_connection
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database connection and assistant on startup"""
-    global assistant
+    global assistant, learning_manager
     try:
-        print("🔌 Initializing database connection...")
-        get_db_connection()
-        print("✅ Database connection established successfully!")
+        # Schema analysis runs in the background; prompts use the fallback schema until it is ready
+        start_schema_init()
+        start_schema_watcher()
+        log.info("🔌 Initializing database connection...")
+        db_health.set_probe(_probe_database)
+        if not db_health.ping():
+            # Start anyway; the keepalive reconnects and requests fail fast meanwhile
+            log.warning("⚠️  Database not reachable yet: %s", db_health.last_error)
+        db_health.start_keepalive()
         
-        print("🤖 Initializing SingleModelDBAssistant...")
-        assistant = SingleModelDBAssistant(embedded_mode=True)
-        print("✅ SingleModelDBAssistant initialized successfully!")
+        log.info("🤖 Initializing SingleModelDBAssistant...")
+        learning_manager = LearningManager()
+        assistant = SingleModelDBAssistant(embedded_mode=True, learning_manager=learning_manager)
+        log.info("✅ SingleModelDBAssistant initialized")
+        # Prime Ollama's prompt cache with the static prefix without delaying startup
+        threading.Thread(target=assistant.warm_up, daemon=True).start()
     except Exception as e:
-        print(f"❌ Failed to initialize: {e}")
+        log.exception("❌ Failed to initialize: %s", e)
         raise e
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write queued learning data before the process exits"""
+    db_health.stop_keepalive()
+    if learning_manager is not None and learning_manager.writer is not None:
+        learning_manager.writer.close()
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -80,28 +117,32 @@ async def root():
         "message": "SQL Query API is running!",
         "endpoints": {
             "/execute": "POST - Execute SQL query",
+            "/ask": "POST - Ask a question in natural language",
+            "/rollups/refresh": "POST - Refresh rollup tables (after a store sync)",
             "/health": "GET - Health check",
             "/docs": "GET - API documentation"
         }
     }
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
+def health_check():
+    """Health check endpoint (plain def: the ping may connect, so it runs in the threadpool)"""
     try:
-        conn = get_db_connection()
-        if conn is None:
-            return {"status": "error", "message": "Database not initialized"}
-        
-        # Test database connection
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        result = cursor.fetchone()
-        cursor.close()
+        # Does not wait on a connect timeout while the circuit is open
+        if not db_health.ping():
+            return {
+                "status": "error",
+                "database": "disconnected",
+                "circuit": db_health.status(),
+                "message": f"Database connection failed: {db_health.last_error}"
+            }
         
         return {
             "status": "healthy",
             "database": "connected",
+            "circuit": db_health.status(),
+            "schema": "ready" if is_schema_ready() else "loading",
+            "schema_version": get_schema_state().version,
             "message": "API is running and database is accessible"
         }
     except Exception as e:
@@ -111,17 +152,39 @@ async def health_check():
             "message": f"Database connection failed: {str(e)}"
         }
 
+def _probe_database() -> None:
+    """SELECT 1 on a short-lived connection of its own.
+
+    The keepalive thread runs this while request handlers use db_connection,
+    and a mysql.connector connection must not be shared between threads.
+    """
+    conn = connect_mysql()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+def _run_query(query: str) -> List[Dict[str, Any]]:
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)  # dictionary=True gives column names
+    cursor.execute(query)
+    results = cursor.fetchall()
+    cursor.close()
+    return results
+
 def run_query(query: str) -> List[Dict[str, Any]]:
     """Execute SQL query and return results as list of dictionaries"""
+    global db_connection
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)  # dictionary=True gives column names
-        cursor.execute(query)
-        results = cursor.fetchall()
-        cursor.close()
-        return results
+        # Fails fast with DatabaseUnavailable while the circuit is open
+        return db_health.call(lambda: _run_query(query))
     except mysql.connector.Error as e:
-        print(f"MySQL Error: {e}")
+        log.warning("MySQL Error: %s", e)
+        if is_connection_error(e):
+            db_connection = None  # reconnect on the next call
         raise e
 
 @app.post("/execute")
@@ -141,7 +204,7 @@ async def execute_sql(query_data: Dict[str, Any]):
                 detail="Only SELECT queries are allowed for security reasons"
             )
         
-        print(f"🔍 Executing SQL: {sql_query}")
+        log.debug("🔍 Executing SQL: %s", sql_query)
         
         # Execute query using direct MySQL connector
         results = run_query(sql_query)
@@ -151,7 +214,7 @@ async def execute_sql(query_data: Dict[str, Any]):
         if results:
             columns = list(results[0].keys())
         
-        print(f"✅ Query executed successfully, returned {len(results)} rows")
+        log.info("✅ /execute returned %d rows", len(results), extra=SAMPLED)
         
         return {
             "success": True,
@@ -163,10 +226,14 @@ async def execute_sql(query_data: Dict[str, Any]):
         
     except HTTPException:
         raise
+    except DatabaseUnavailable as e:
+        return JSONResponse(
+            status_code=503,
+            content={"success": False, "error": str(e), "query": sql_query}
+        )
     except Exception as e:
         error_msg = f"SQL execution failed: {str(e)}"
-        print(f"❌ {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("❌ %s", error_msg)
         
         return JSONResponse(
             status_code=500,
@@ -187,12 +254,18 @@ async def ask_question(request_data: Dict[str, Any]):
         
         question = request_data.get("q", "").strip()
         preview_rows = request_data.get("preview_rows", 20)
+        # Same id the Next.js app writes to chat_messages; keys the session store
+        chat_id = request_data.get("chat_id")
         
         if not question:
             raise HTTPException(status_code=400, detail="No question provided")
         
+        # Skip SQL generation entirely while the database is known to be down
+        if not db_health.available:
+            return JSONResponse(status_code=503, content={"error": f"Database unavailable: {db_health.last_error}"})
+        
         # Use the assistant to process the question with context
-        result = assistant.ask(question, show_rows=preview_rows)
+        result = assistant.ask(question, show_rows=preview_rows, chat_id=chat_id)
         
         if "error" in result:
             return JSONResponse(
@@ -206,6 +279,8 @@ async def ask_question(request_data: Dict[str, Any]):
             "sql": result.get("sql"),
             "columns": result.get("columns", []),
             "row_count": result.get("row_count", 0),
+            # data holds only the preview rows when truncated; row_count is the full total
+            "truncated": result.get("truncated", False),
             "data": result.get("rows", [])
         }
         
@@ -213,14 +288,34 @@ async def ask_question(request_data: Dict[str, Any]):
         raise
     except Exception as e:
         error_msg = f"Failed to process question: {str(e)}"
-        print(f"❌ {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        log.exception("❌ %s", error_msg)
         
         return JSONResponse(
             status_code=500,
             content={"error": error_msg}
         )
 
+@app.post("/rollups/refresh")
+def refresh_rollups(request_data: Optional[Dict[str, Any]] = Body(default=None)):
+    """Refresh the rollup tables incrementally; called by the Next.js sync after it finishes.
+
+    Body (optional): {"full": true} rebuilds from scratch, {"wait": true} blocks until done.
+    """
+    options = request_data or {}
+    full = bool(options.get("full"))
+    if options.get("wait"):
+        result = rollup_manager.refresh(full=full)
+        if result.get("status") == "error":
+            return JSONResponse(status_code=500, content=result)
+        return result
+    started = rollup_manager.refresh_async(full=full)
+    return {"status": "started" if started else "busy"}
+
+@app.get("/rollups/status")
+def rollup_status():
+    """Last rollup refresh result"""
+    return {"running": rollup_manager.running, "last_result": rollup_manager.last_result}
+
 if __name__ == "__main__":
     print("🚀 Starting SQL Query API...")
     print("🌐 API will be available at: http://localhost:8000")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+SQL Fingerprints
+
+Queries that differ only in literals share one fingerprint. Used to group
+the workload (index_advisor, latency_stats), to merge SQL examples
+(learning_compaction) and to key examples in learning_index.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/|(?:--|#)[^\n]*", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+
+
+def strip_comments_and_strings(sql: str, placeholder: str = "?") -> str:
+    """Drop comments and replace every string literal with `placeholder`."""
+    return _STRING_RE.sub(placeholder, _COMMENT_RE.sub(" ", sql or ""))
+
+
+def fingerprint_sql(sql: str) -> str:
+    """Normalize SQL so queries that differ only in literals share one fingerprint.
+
+    Comments are dropped, strings and numbers become '?', IN lists collapse to
+    IN (?+), whitespace is collapsed and everything is lower-cased.
+    """
+    text = strip_comments_and_strings(sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("in (?+)", text)
+    text = re.sub(r"\s+", " ", text).strip().rstrip(";").strip()
+    return text.lower()
+
+
+def fingerprint_id(sql: str) -> str:
+    """Short stable id for a query's fingerprint."""
+    return hashlib.sha1(fingerprint_sql(sql).encode("utf-8")).hexdigest()[:16]
@@ -26,12 +26,16 @@ def start_api():
     """Start the SQL API server"""
     print("🚀 Starting SQL API server...")
     try:
-        # Start API in background
+        # Start API in background; its output goes to a file because a pipe
+        # nobody reads fills up and blocks the server
+        log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_api.log")
+        log_file = open(log_path, "ab")
         api_process = subprocess.Popen(
             [sys.executable, "sql_api.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stdout=log_file,
+            stderr=subprocess.STDOUT
         )
+        log_file.close()  # the child keeps its own handle
         
         # Give the API a moment to start up
         print("⏳ Waiting for API to start...")
@@ -42,13 +46,14 @@ def start_api():
             return api_process
         else:
             print("❌ API failed to start or is not responding")
-            # Get error output for debugging
-            stdout, stderr = api_process.communicate()
-            if stderr:
-                print(f"API Error: {stderr.decode()}")
-            if stdout:
-                print(f"API Output: {stdout.decode()}")
             api_process.terminate()
+            # Show the end of the API output for debugging
+            with open(log_path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 4000))
+                output = f.read().decode(errors="replace")
+            if output:
+                print(f"API Output ({log_path}):\n{output}")
             return None
             
     except Exception as e:
@@ -61,10 +66,12 @@ def start_assistant():
     try:
         # Use embedded mode to avoid external LLM connection issues
         subprocess.run([sys.executable, "-c", """
-from single_model_db_assistant import SingleModelDBAssistant
+from session_store import InMemorySessionStore
+from single_model_db_assistant import REPL_CHAT_ID, SingleModelDBAssistant, print_result
 import sys
 
-assistant = SingleModelDBAssistant(embedded_mode=True)
+# The REPL is one conversation: keep it in memory under a fixed chat id
+assistant = SingleModelDBAssistant(embedded_mode=True, session_store=InMemorySessionStore())
 print('✅ Connected! Using model:', assistant.model_name, '| Database:', assistant.database_name)
 print('\\n💡 Type a question, or \\'exit\\' to quit.\\n')
 
@@ -75,7 +82,7 @@ while True:
             continue
         if question.strip().lower() in ['exit', 'quit']:
             break
-        assistant.ask(question, show_rows=30)
+        print_result(assistant.ask(question, show_rows=30, chat_id=REPL_CHAT_ID))
     except EOFError:
         break
     except KeyboardInterrupt:
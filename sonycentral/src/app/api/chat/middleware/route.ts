@@ -40,13 +40,13 @@ class SQLClient {
     }
   }
 
-  async processWithAssistant(prompt: string): Promise<any> {
+  async processWithAssistant(prompt: string, chatId?: string): Promise<any> {
     try {
       // Call the start_assistant endpoint (if it exists) or use the three-model assistant
       const response = await fetch(`${this.baseUrl}/ask`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ q: prompt, preview_rows: 20 })
+        body: JSON.stringify({ q: prompt, preview_rows: 20, chat_id: chatId })
       });
       
       if (!response.ok) {
@@ -96,7 +96,7 @@ export async function POST(req: NextRequest) {
       console.log('Processing message through SQL Client middleware:', message);
       
       // Step 1: Process with assistant to get SQL query
-      const assistantResult = await sqlClient.processWithAssistant(message);
+      const assistantResult = await sqlClient.processWithAssistant(message, chatId);
       
       if (assistantResult.error) {
         throw new Error(`Assistant error: ${assistantResult.error}`);
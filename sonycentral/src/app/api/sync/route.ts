@@ -710,6 +710,13 @@ async function syncStores(stores: { shop: string; accessToken: string }[]) {
     }
   }
   
+  // Refresh the assistant's rollup tables from the rows just synced; the API runs it in the background
+  try {
+    await fetch(`${process.env.FASTAPI_URL || 'http://localhost:8000'}/rollups/refresh`, { method: 'POST' });
+  } catch (error) {
+    console.error('⚠️ Rollup refresh request failed:', error);
+  }
+
   const hasErrors = errorLogs.length > 0;
   const message = hasErrors 
     ? `Sync completed with ${errorLogs.length} error(s)` 